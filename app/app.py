@@ -1,16 +1,27 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import joblib
 import os
-import plotly.express as px
-import plotly.graph_objects as go
-from pathlib import Path
-import shap
-from lifetimes import BetaGeoFitter, GammaGammaFitter
-from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from textwrap import dedent
+import time
+
+# Heavy libraries (shap, matplotlib, plotly, sklearn) are imported where they
+# are first used so startup only pays for what a page view needs; check with
+# `python import_budget.py`.
+
+from clv import calculate_clv, monthly_discount
+from explain import explain_customer
+from features import FEATURE_NAMES, compute_components, extract_inputs, features_frame
+from forest_grid import compile_forest
+from model_artifact import DEFAULT_ARTIFACT_DIR, is_artifact, load_artifact
+from model_registry import get_registry
+from prediction_cache import figure_png, get_cache
+from scoring_session import ScoringSession
+from segmentation import DEFAULT_SEGMENTS_PATH, Segmenter, generate_persona
+from shap_jobs import DEFAULT_TIME_BUDGET, POLL_INTERVAL, get_runner, job_key
+
+# Explanation modes offered in the SHAP tab
+SHAP_MODE_FAST = "Fast (path contributions)"
+SHAP_MODE_EXACT = "Exact SHAP"
 
 # Set page configuration
 st.set_page_config(
@@ -870,12 +881,108 @@ def patch_model(model):
     # Return the wrapped clean model
     return ModelWrapper(clean_model)
 
-def load_model():
+def get_model_path():
+    """Return the exported model artifact if present, otherwise the pickle."""
+    if is_artifact(DEFAULT_ARTIFACT_DIR):
+        return DEFAULT_ARTIFACT_DIR
+    return os.path.join(os.path.dirname(__file__), 'churn_model.pkl')
+
+def get_clv_model():
+    """Fitted BG/NBD + Gamma-Gamma parameters, or None if none have been fitted."""
+    from clv_model import DEFAULT_PARAMS_PATH, CLVModel
+    
+    if not os.path.exists(DEFAULT_PARAMS_PATH):
+        return None
+    try:
+        return get_registry().get(DEFAULT_PARAMS_PATH, loader=CLVModel.load)
+    except Exception:
+        return None
+
+def get_model():
+    """Return the model shared by all sessions, reloaded when its file changes."""
+    try:
+        return get_registry().get(get_model_path(), loader=load_model)
+    except Exception as e:
+        st.error(f"❌ Error loading model: {str(e)}")
+        return None
+
+def score_customer(model, features):
+    """Score the current customer, re-walking only trees whose features changed.
+
+    The session lives in ``st.session_state`` so every browser session keeps
+    its own leaf cache. It only pays off when the forest is scored by tree
+    traversal (its threshold grid is over the memory cap); a compiled grid
+    is already a single lookup and is used directly.
+    """
+    engine = getattr(model, 'engine', None)
+    if engine is None or getattr(engine, 'mode', 'trees') == 'grid':
+        return model.predict_with_proba(features)
+    forest = getattr(engine, 'forest', engine)
+    session = st.session_state.get('scoring_session')
+    if session is None or session.forest is not forest:
+        session = ScoringSession(forest, features)
+        st.session_state.scoring_session = session
+    else:
+        session.update(features)
+    return session.predict_with_proba()
+
+def load_model(model_path=None):
     """Load the pre-trained model with version compatibility handling."""
     try:
         import os
         import pickle
         import numpy as np
+        
+        # Create a model wrapper that handles all predictions
+        class ModelWrapper:
+            def __init__(self, model):
+                self.model = model
+                # Copy necessary attributes
+                for attr in ['classes_', 'n_classes_', 'n_features_in_', 'feature_importances_']:
+                    if hasattr(model, attr):
+                        setattr(self, attr, getattr(model, attr, None))
+                # Flattened NumPy copy of the forest used for scoring, compiled
+                # to an exact threshold grid when it is small enough
+                try:
+                    self.engine = compile_forest(model)
+                except Exception:
+                    self.engine = None
+            
+            def predict(self, X):
+                return self.predict_with_proba(X)[0]
+            
+            def predict_proba(self, X):
+                return self.predict_with_proba(X)[1]
+            
+            def predict_with_proba(self, X):
+                """Return class labels and probabilities from one pass over the forest."""
+                if self.engine is not None:
+                    return self.engine.predict_with_proba(X)
+                if hasattr(X, 'values'):
+                    X = X.values
+                proba = self.model.predict_proba(X)
+                return self.model.classes_[np.argmax(proba, axis=1)], proba
+            
+            def __getattr__(self, name):
+                # Handle any missing attributes
+                if name == 'monotonic_cst':
+                    return None
+                try:
+                    return getattr(self.model, name, None)
+                except Exception:
+                    return None
+        
+        # Prefer the exported artifact: memory-mapped arrays, no unpickling
+        # and no dependency on the installed sklearn version
+        if model_path is None:
+            model_path = get_model_path()
+        if is_artifact(model_path):
+            try:
+                return ModelWrapper(load_artifact(model_path))
+            except Exception as e:
+                st.warning(f"Could not load model artifact, falling back to pickle: {str(e)}")
+            model_path = None
+        
         from sklearn.ensemble import RandomForestClassifier
         from sklearn.tree import DecisionTreeClassifier
         import warnings
@@ -884,7 +991,8 @@ def load_model():
         # Suppress version warnings
         warnings.filterwarnings("ignore", category=InconsistentVersionWarning)
         
-        model_path = os.path.join(os.path.dirname(__file__), 'churn_model.pkl')
+        if model_path is None:
+            model_path = os.path.join(os.path.dirname(__file__), 'churn_model.pkl')
         
         # Create a custom DecisionTreeClassifier that handles monotonic_cst
         class SafeDecisionTree(DecisionTreeClassifier):
@@ -913,34 +1021,6 @@ def load_model():
                 if value is not None:
                     self.estimators_.append(value)
         
-        # Create a model wrapper that handles all predictions
-        class ModelWrapper:
-            def __init__(self, model):
-                self.model = model
-                # Copy necessary attributes
-                for attr in ['classes_', 'n_classes_', 'n_features_in_', 'feature_importances_']:
-                    if hasattr(model, attr):
-                        setattr(self, attr, getattr(model, attr, None))
-            
-            def predict(self, X):
-                if hasattr(X, 'values'):
-                    X = X.values
-                return self.model.predict(X)
-            
-            def predict_proba(self, X):
-                if hasattr(X, 'values'):
-                    X = X.values
-                return self.model.predict_proba(X)
-            
-            def __getattr__(self, name):
-                # Handle any missing attributes
-                if name == 'monotonic_cst':
-                    return None
-                try:
-                    return getattr(self.model, name, None)
-                except Exception:
-                    return None
-        
         # Try to load the model with our custom classes
         try:
             with open(model_path, 'rb') as f:
@@ -1058,21 +1138,10 @@ def get_user_inputs():
 def prepare_features(input_df):
     """Prepare the input data for prediction with the expected 3 features."""
     try:
-        # Get values with defaults if not present
-        if isinstance(input_df, pd.DataFrame):
-            tenure = float(input_df.get('Tenure', [0])[0])
-            satisfaction = float(input_df.get('SatisfactionScore', [3])[0])
-            orders = float(input_df.get('OrderCount', [0])[0])
-            coupons = float(input_df.get('CouponUsed', [0])[0])
-            cashback = float(input_df.get('CashbackAmount', [0])[0])
-            complain = int(input_df.get('Complain', [0])[0])
-        else:  # Assume it's a dictionary
-            tenure = float(input_df.get('Tenure', 0))
-            satisfaction = float(input_df.get('SatisfactionScore', 3))
-            orders = float(input_df.get('OrderCount', 0))
-            coupons = float(input_df.get('CouponUsed', 0))
-            cashback = float(input_df.get('CashbackAmount', 0))
-            complain = int(input_df.get('Complain', 0))
+        # Vectorized, UI-free feature logic shared with the batch tools
+        inputs = extract_inputs(input_df)
+        components = compute_components(inputs)
+        processed_df = features_frame(inputs)
         
         # Debug toggle with unique keys
         debug_mode = st.sidebar.checkbox("Enable Debug Mode", value=True, key="debug_mode_checkbox")
@@ -1083,62 +1152,27 @@ def prepare_features(input_df):
                 key="force_dynamic_checkbox",
                 help="Override model with dynamic predictions for testing"
             )
-        
-        st.sidebar.write("### Input Values")
-        st.sidebar.json({
-            'Tenure': tenure,
-            'SatisfactionScore': satisfaction,
-            'OrderCount': orders,
-            'CouponUsed': coupons,
-            'CashbackAmount': cashback,
-            'Complain': complain
-        })
-        
-        # Calculate intermediate values
-        # Feature 1: Engagement Score (combines Tenure and Satisfaction)
-        tenure_score = np.log1p(tenure) / np.log1p(72)  # log scale for tenure (0-72 months)
-        sat_score = (satisfaction / 5.0) ** 2  # square to emphasize low satisfaction
-        feature1 = 0.6 * (1 - sat_score) + 0.4 * (1 - tenure_score)
-        
-        # Feature 2: Usage Pattern (combines OrderCount and CouponUsed)
-        order_score = min(orders / 50.0, 2.0)  # cap at 2.0 (100 orders)
-        coupon_ratio = min(coupons / (orders + 1), 1.0)  # coupons per order
-        feature2 = 0.7 * (1 - order_score/2.0) + 0.3 * coupon_ratio
-        
-        # Feature 3: Value & Issues (combines Cashback and Complaints)
-        cashback_score = 1.0 - min(cashback / 300.0, 1.0)  # normalize to 0-1 and invert
-        feature3 = cashback_score + (0.5 * complain)  # complaints increase churn risk
-        
-        # Apply sigmoid to create more separation between values
-        features = {
-            'Feature1': 1 / (1 + np.exp(-10 * (feature1 - 0.5))),
-            'Feature2': 1 / (1 + np.exp(-10 * (feature2 - 0.5))),
-            'Feature3': 1 / (1 + np.exp(-10 * (feature3 - 0.5)))
-        }
-        
-        # Log intermediate calculations
-        st.sidebar.write("### 🔍 Feature Calculations")
-        st.sidebar.json({
-            'tenure_score': tenure_score,
-            'sat_score': sat_score,
-            'order_score': order_score,
-            'coupon_ratio': coupon_ratio,
-            'cashback_score': cashback_score
-        })
-        
-        # Create DataFrame with exact feature names and order
-        processed_df = pd.DataFrame([features], columns=['Feature1', 'Feature2', 'Feature3'])
-        
-        # Debug output
-        st.sidebar.write("### 📊 Processed Features")
-        st.sidebar.json(processed_df.iloc[0].to_dict())
+            
+            st.sidebar.write("### Input Values")
+            st.sidebar.json({name: float(values[0]) for name, values in inputs.items()})
+            
+            # Log intermediate calculations
+            st.sidebar.write("### 🔍 Feature Calculations")
+            st.sidebar.json({
+                name: float(components[name][0])
+                for name in ['tenure_score', 'sat_score', 'order_score', 'coupon_ratio', 'cashback_score']
+            })
+            
+            # Debug output
+            st.sidebar.write("### 📊 Processed Features")
+            st.sidebar.json({name: float(value) for name, value in processed_df.iloc[0].items()})
         
         return processed_df
         
     except Exception as e:
         st.error(f"❌ Error in prepare_features: {str(e)}")
         st.exception(e)
-        return pd.DataFrame([[0.5, 0.5, 0.5]], columns=['Feature1', 'Feature2', 'Feature3'])
+        return pd.DataFrame([[0.5, 0.5, 0.5]], columns=FEATURE_NAMES)
 
 def display_prediction(prediction, probability):
     """Display the prediction result with improved styling and more nuanced output."""
@@ -1237,60 +1271,42 @@ def display_prediction(prediction, probability):
     except Exception as e:
         st.error(f"Error displaying prediction: {str(e)}")
 
-def calculate_clv(monetary_value, predicted_churn_prob, discount_rate=0.1, avg_customer_lifespan=36):
-    """Calculate Customer Lifetime Value."""
-    retention_rate = 1 - predicted_churn_prob
-    clv = (monetary_value * retention_rate) / (1 + discount_rate - retention_rate)
-    return clv
+def get_neighbor_index():
+    """Similar-customer index, or None if none has been built."""
+    from neighbors import DEFAULT_INDEX_DIR, NeighborIndex
+    
+    if not os.path.isdir(DEFAULT_INDEX_DIR):
+        return None
+    try:
+        return get_registry().get(DEFAULT_INDEX_DIR, loader=NeighborIndex.load)
+    except Exception:
+        return None
 
-def generate_persona(user_inputs):
-    """Generate customer persona based on inputs."""
-    # Default persona
-    persona = {
-        'type': 'Balanced Customer',
-        'description': 'This customer shows moderate engagement with your services.',
-        'strategies': [
-            'Monitor engagement metrics for changes',
-            'Offer personalized recommendations',
-            'Request feedback to improve experience'
-        ]
-    }
-    
-    # Check if we have the expected features
-    if 'Tenure' in user_inputs and 'SatisfactionScore' in user_inputs and 'OrderCount' in user_inputs:
-        tenure = user_inputs['Tenure']
-        satisfaction = user_inputs['SatisfactionScore']
-        order_count = user_inputs['OrderCount']
-        
-        # Define persona based on feature values
-        if tenure < 3:
-            persona['type'] = 'New Customer'
-            persona['description'] = 'This is a new customer who may need onboarding support.'
-            persona['strategies'] = [
-                'Provide comprehensive onboarding',
-                'Schedule a check-in call',
-                'Offer a welcome discount on next purchase'
-            ]
-        elif satisfaction < 3:
-            persona['type'] = 'At-Risk Customer'
-            persona['description'] = 'This customer has expressed low satisfaction and may be at risk of churn.'
-            persona['strategies'] = [
-                'Reach out to understand their concerns',
-                'Offer personalized support',
-                'Provide a special discount or perk'
-            ]
-        elif order_count > 50:
-            persona['type'] = 'Power User'
-            persona['description'] = 'This customer is highly engaged with your services.'
-            persona['strategies'] = [
-                'Offer loyalty rewards',
-                'Provide exclusive early access to new features',
-                'Request testimonials or referrals'
-            ]
-    
-    return persona
+def get_leaf_index():
+    """Forest proximity index for the active model, or None if none has been built for it."""
+    from leaf_index import DEFAULT_INDEX_DIR, LeafIndex
+    
+    if not os.path.isdir(DEFAULT_INDEX_DIR):
+        return None
+    try:
+        index = get_registry().get(DEFAULT_INDEX_DIR, loader=LeafIndex.load)
+    except Exception:
+        return None
+    # Leaves only mean something under the model the index was built with
+    if index.manifest.get('model_version') != get_model_version():
+        return None
+    return index
 
-def explain_with_shap(model, input_data, feature_names, debug=False):
+def get_segmenter():
+    """Fitted customer segments, or None if none have been fitted."""
+    if not os.path.exists(DEFAULT_SEGMENTS_PATH):
+        return None
+    try:
+        return get_registry().get(DEFAULT_SEGMENTS_PATH, loader=Segmenter.load)
+    except Exception:
+        return None
+
+def explain_with_shap(model, input_data, feature_names, debug=False, shap_result=None):
     """
     Generate SHAP values and plot for model explanation using synthetic data.
     
@@ -1299,6 +1315,7 @@ def explain_with_shap(model, input_data, feature_names, debug=False):
         input_data: Input data to generate explanations for
         feature_names: List of feature names
         debug: If True, show debug information (default: False)
+        shap_result: Precomputed ``explain.ShapResult`` for ``input_data``
         
     Returns:
         matplotlib.figure.Figure: The SHAP plot figure, or None if an error occurs
@@ -1310,7 +1327,6 @@ def explain_with_shap(model, input_data, feature_names, debug=False):
             import matplotlib.pyplot as plt
             import numpy as np
             import pandas as pd
-            from scipy import stats
         except ImportError as e:
             if debug:
                 st.warning(f"Required libraries not found: {str(e)}. Install with: `pip install shap scipy`")
@@ -1336,104 +1352,18 @@ def explain_with_shap(model, input_data, feature_names, debug=False):
                 st.write(f"Using feature names: {feature_names}")
                 st.write("Sample data:", df.head())
             
-            # Get the actual model (unwrap if it's wrapped)
-            model_to_explain = model.model if hasattr(model, 'model') else model
-            
-            # Generate synthetic data around the input point
-            n_samples = 100
-            X_original = df.values
-            n_features = X_original.shape[1]
-            
-            # Create synthetic data with some variation
-            np.random.seed(42)
-            X_synthetic = np.zeros((n_samples, n_features))
-            
-            for i in range(n_features):
-                center = X_original[0, i]
-                std_dev = max(0.1, 0.2 * abs(center)) if center != 0 else 0.1
-                X_synthetic[:, i] = np.random.normal(center, std_dev, n_samples)
-                X_synthetic[:, i] = np.clip(X_synthetic[:, i], 
-                                         center - 3*std_dev, 
-                                         center + 3*std_dev)
-            
-            # Combine and create DataFrame
-            X_combined = np.vstack([X_original, X_synthetic])
-            combined_df = pd.DataFrame(X_combined, columns=feature_names)
-            
-            if debug:
-                st.write(f"Generated {len(combined_df)} samples for SHAP analysis")
-            
-            # Generate synthetic data around the input point for better SHAP visualization
-            n_samples = 100  # Number of synthetic samples to generate
-            n_features = X_original.shape[1]
-            
-            # Create synthetic data with some variation around the input point
-            np.random.seed(42)  # For reproducibility
-            X_synthetic = np.zeros((n_samples, n_features))
-            
-            # For each feature, generate values around the input value
-            for i in range(n_features):
-                # Get the input value for this feature
-                center = X_original[0, i]
-                
-                # For numeric features, create a normal distribution around the input value
-                # with standard deviation of 20% of the absolute value (min 0.1)
-                std_dev = max(0.1, 0.2 * abs(center))
-                X_synthetic[:, i] = np.random.normal(center, std_dev, n_samples)
-                
-                # Ensure we don't get extreme outliers
-                X_synthetic[:, i] = np.clip(X_synthetic[:, i], 
-                                          center - 3*std_dev, 
-                                          center + 3*std_dev)
-            
-            # Combine original and synthetic data
-            X_combined = np.vstack([X_original, X_synthetic])
+            # SHAP values are computed once per prediction by the caller and
+            # shared with the raw-values view; compute them here otherwise
+            if shap_result is None:
+                shap_result = explain_customer(model, df, feature_names=feature_names)
+            shap_values = shap_result.values
+            combined_df = shap_result.data
             
             # Debug: Show data shape and model info if debug mode is on
             if debug:
-                st.write(f"Using {X_combined.shape[0]} samples (1 original + {n_samples} synthetic) for SHAP analysis")
-                st.write("### Debug: Model Information")
-                st.write(f"Model type: {type(model_to_explain).__name__}")
-                if hasattr(model_to_explain, 'feature_names_in_'):
-                    st.write(f"Model expects features: {model_to_explain.feature_names_in_}")
-            
-            # Try TreeExplainer first (faster for tree-based models)
-            try:
-                explainer = shap.TreeExplainer(model_to_explain)
-                if debug:
-                    st.info("Using TreeExplainer for model interpretation")
-                
-                # Calculate SHAP values with DataFrame to preserve feature names
-                shap_values = explainer.shap_values(combined_df)
-                
-                # Handle binary classification case
-                if isinstance(shap_values, list) and len(shap_values) == 2:
-                    shap_values = shap_values[1]  # Use SHAP values for positive class
-                
-                if debug:
-                    st.write(f"SHAP values shape: {np.array(shap_values).shape}")
-                
-            except Exception as e:
-                if debug:
-                    st.warning(f"TreeExplainer failed: {str(e)}. Trying KernelExplainer instead.")
-                
-                # For KernelExplainer, use predict_proba if available
-                if hasattr(model_to_explain, 'predict_proba'):
-                    predict_fn = model_to_explain.predict_proba
-                    if debug:
-                        st.info("Using predict_proba for SHAP values")
-                else:
-                    predict_fn = model_to_explain.predict
-                    if debug:
-                        st.info("Using predict for SHAP values")
-                
-                # Use a sample of the data for KernelExplainer (faster)
-                background = shap.sample(combined_df, min(50, len(combined_df)))
-                explainer = shap.KernelExplainer(predict_fn, background)
-                shap_values = explainer.shap_values(combined_df)
-                
-                if isinstance(shap_values, list) and len(shap_values) == 2:
-                    shap_values = shap_values[1]  # Use SHAP values for positive class
+                st.write(f"Using {len(combined_df)} samples (1 original + {len(combined_df) - 1} synthetic) for SHAP analysis")
+                st.write(f"Explainer: {shap_result.method} ({shap_result.seconds * 1e3:.1f} ms)")
+                st.write(f"SHAP values shape: {np.array(shap_values).shape}")
 
             # Only show the plot section, not the subheader (handled by the caller)
             try:
@@ -1457,7 +1387,8 @@ def explain_with_shap(model, input_data, feature_names, debug=False):
                 plt.tight_layout(rect=[0, 0.03, 1, 0.95])
                 
                 # Add a clean title with proper spacing
-                plt.suptitle("SHAP Value Impact per Feature", 
+                title = "Path Contribution per Feature" if shap_result.method == 'path' else "SHAP Value Impact per Feature"
+                plt.suptitle(title, 
                            fontsize=14, 
                            y=0.98,
                            fontweight='bold')
@@ -1486,9 +1417,47 @@ def explain_with_shap(model, input_data, feature_names, debug=False):
             st.error(f"Unexpected error in SHAP analysis: {str(e)}")
         return None
 
+def get_model_version():
+    """Content hash of the active model, or None if it is not loaded yet."""
+    active = get_registry().current(get_model_path())
+    return active.version if active is not None else None
+
+def get_cached(fields=None):
+    """Cached results for the last prediction of this session (a dict, possibly empty)."""
+    cache_key = st.session_state.get('cache_key')
+    if cache_key is None:
+        return {}
+    entry = get_cache().get(get_model_version(), cache_key) or {}
+    if fields:
+        return {name: entry[name] for name in fields if name in entry}
+    return entry
+
+def cache_results(**fields):
+    """Add ``fields`` to the cache entry of the last prediction of this session."""
+    cache_key = st.session_state.get('cache_key')
+    if cache_key is not None:
+        try:
+            get_cache().update(get_model_version(), cache_key, **fields)
+        except OSError:
+            # Caching is best effort; an unwritable cache directory is not fatal
+            pass
+
+def submit_shap_job(model, features):
+    """Start (or join) the background SHAP job for this prediction.
+
+    Jobs are shared by all sessions and keyed by model version and feature
+    vector, so identical requests reuse one computation.
+    """
+    version = get_model_version()
+    return get_runner().submit(
+        job_key(version, features), explain_customer, model, features.copy(), version=version
+    )
+
 def get_feature_importance(model, input_data, feature_names):
     """Calculate and display feature importance for the 3-feature model."""
     try:
+        import matplotlib.pyplot as plt
+        
         # For our simple 3-feature model, we'll use a simple bar chart
         # with the three features we're using
         features = ['Tenure (Normalized)', 'Satisfaction (Normalized)', 'Order Count (Normalized)']
@@ -1530,11 +1499,14 @@ def main():
     # Header
     st.markdown("<div class='header'><h1>📊 Strategic Retention Predictor</h1><p>Predict customer churn and implement proactive retention strategies</p></div>", unsafe_allow_html=True)
     
-    # Load model
-    model = load_model()
+    # Load model (shared by all sessions, loaded once per version)
+    model = get_model()
     if model is None:
         return
     
+    # Set when a background SHAP job is still running
+    shap_pending = False
+    
     # Create tabs for different sections
     tab1, tab2, tab3, tab4 = st.tabs(["🔍 Prediction", "📊 SHAP Analysis", "💰 CLV Calculator", "👤 Persona & Strategy"])
     
@@ -1556,8 +1528,14 @@ def main():
         if st.sidebar.button("Predict Churn Risk", use_container_width=True, key="predict_btn"):
             with st.spinner('Analyzing customer data...'):
                 try:
+                    # Same inputs under the same model version reuse earlier results
+                    cache = get_cache()
+                    model_hash = get_model_version()
+                    st.session_state.cache_key = cache.key(model_hash, user_inputs)
+                    cached = get_cached(['features', 'labels', 'probability'])
+                    
                     # Prepare features
-                    features = prepare_features(input_df)
+                    features = cached['features'] if 'features' in cached else prepare_features(input_df)
                     
                     # Debug information (commented out for production)
                     # st.sidebar.write("### Debug: Raw Input Values")
@@ -1594,8 +1572,12 @@ def main():
                         # st.sidebar.json(model_info)
                         
                         # Make prediction
-                        prediction = model.predict(features)[0]
-                        probability = model.predict_proba(features)
+                        if 'probability' in cached:
+                            labels, probability = cached['labels'], cached['probability']
+                        else:
+                            labels, probability = score_customer(model, features)
+                            cache_results(features=features, labels=labels, probability=probability)
+                        prediction = labels[0]
                         
                         # Debug: Prediction results (commented out for production)
                         # st.sidebar.write("### 📈 Prediction Results")
@@ -1669,6 +1651,19 @@ def main():
                         st.write(f"- Model type: {type(model).__name__}")
                         if hasattr(model, 'n_estimators'):
                             st.write(f"- Number of estimators: {model.n_estimators}")
+                        if getattr(model, 'engine', None) is not None:
+                            st.write(f"- Scoring: {model.engine.describe()}")
+                        model_version = get_registry().current(get_model_path())
+                        if model_version is not None:
+                            st.write(f"- Model version: {model_version.version[:12]}")
+                            st.write(f"- Load time: {model_version.load_seconds * 1000:.1f} ms")
+                            st.write(f"- Resident size: {model_version.resident_bytes / 1024:.1f} KB "
+                                     f"(+ {model_version.mapped_bytes / 1024:.1f} KB memory-mapped)")
+                        cache_stats = get_cache().stats()
+                        st.write(f"- Prediction cache: {cache_stats['hit_rate']:.0%} hit rate over "
+                                 f"{cache_stats['lookups']} lookups, {cache_stats['disk_items']} entries "
+                                 f"({cache_stats['disk_bytes'] / 1024:.1f} KB), "
+                                 f"{cache_stats['memory_evictions'] + cache_stats['disk_evictions']} evictions")
                         if hasattr(model, 'feature_importances_'):
                             st.write("- Feature importances:")
                             for feat, imp in zip(features.columns, model.feature_importances_):
@@ -1684,6 +1679,7 @@ def main():
                             'Feature': features.columns,
                             'Importance': model.feature_importances_
                         })
+                        import plotly.express as px
                         fig = px.bar(
                             feature_importance.sort_values('Importance', ascending=True).tail(5),
                             x='Importance',
@@ -1710,6 +1706,14 @@ def main():
             value=False,
             key="show_shap_analysis"
         )
+        shap_mode = st.radio(
+            "Explanation mode",
+            [SHAP_MODE_FAST, SHAP_MODE_EXACT],
+            horizontal=True,
+            key="shap_mode",
+            help="Path contributions follow each tree's decision path and are instant. "
+                 "Exact SHAP values are computed in the background."
+        )
         
         # Generate feature importance
         if 'prediction' in st.session_state and 'features' in st.session_state:
@@ -1748,18 +1752,65 @@ def main():
                             """)
                         
                         try:
-                            # Generate SHAP plot
-                            shap_fig = explain_with_shap(
-                                model, 
-                                st.session_state.features, 
-                                feature_names=feature_names,
-                                debug=False  # Set to True to show debug info
-                            )
+                            # Results for this prediction cached by an earlier run
+                            cached = get_cached(['shap_exact', 'shap_path', 'figure_tree', 'figure_kernel', 'figure_path'])
+                            shap_result = cached.get('shap_exact') if shap_mode == SHAP_MODE_EXACT else None
+                            waiting = False
+                            if shap_mode == SHAP_MODE_EXACT and shap_result is None:
+                                # Exact SHAP runs on the shared background pool; poll
+                                # until it finishes or the time budget runs out
+                                job = submit_shap_job(model, st.session_state.features)
+                                if job is not None and job.done() and job.error() is None:
+                                    shap_result = job.result()
+                                    cache_results(shap_exact=shap_result)
+                                elif job is not None and not job.done():
+                                    # Rerun at the end of main() only while the job is
+                                    # inside its time budget; past it, show the fast
+                                    # fallback and pick up the exact result on the next
+                                    # interaction instead of polling forever
+                                    waiting = job.elapsed() < DEFAULT_TIME_BUDGET
+                                    shap_pending = waiting
+                                    if waiting:
+                                        st.progress(
+                                            min(job.elapsed() / DEFAULT_TIME_BUDGET, 1.0),
+                                            text=f"Computing SHAP values ({job.state}, {job.elapsed():.1f}s)..."
+                                        )
+                                    else:
+                                        st.info("Exact SHAP values are taking longer than usual; showing fast "
+                                                "path contributions. Interact again to load the exact values "
+                                                "once the background job finishes.")
+                                else:
+                                    st.info("Exact SHAP values are unavailable right now; showing fast path contributions instead.")
+                            
+                            if shap_result is None and not waiting:
+                                # Path contributions: one cheap walk over the forest
+                                shap_result = cached.get('shap_path')
+                                if shap_result is None:
+                                    shap_result = explain_customer(model, st.session_state.features, method='path')
+                                    cache_results(shap_path=shap_result)
+                            
+                            # Generate SHAP plot (rendered once, then served as PNG bytes)
+                            shap_png = None
+                            if shap_result is not None:
+                                shap_png = cached.get(f'figure_{shap_result.method}')
+                                if shap_png is None:
+                                    shap_fig = explain_with_shap(
+                                        model, 
+                                        st.session_state.features, 
+                                        feature_names=feature_names,
+                                        debug=False,  # Set to True to show debug info
+                                        shap_result=shap_result
+                                    )
+                                    if shap_fig is not None:
+                                        import matplotlib.pyplot as plt
+                                        shap_png = figure_png(shap_fig)
+                                        plt.close(shap_fig)
+                                        cache_results(**{f'figure_{shap_result.method}': shap_png})
                             
                             # Display the SHAP plot if successful
-                            if shap_fig is not None:
+                            if shap_png is not None:
                                 # Display the plot with some spacing
-                                st.pyplot(shap_fig, use_container_width=True)
+                                st.image(shap_png)
                                 
                                 # Add spacing before interpretation
                                 st.markdown("")
@@ -1799,18 +1850,13 @@ def main():
                                     - Use these insights to guide customer retention strategies
                                     """)
                                     
-                                    # Show the raw SHAP values if available
-                                    if hasattr(model, 'predict_proba'):
-                                        try:
-                                            import shap
-                                            explainer = shap.TreeExplainer(model)
-                                            shap_values = explainer.shap_values(st.session_state.features)
-                                            st.markdown("**Raw SHAP values:**")
-                                            st.code(f"{shap_values}", language="python")
-                                        except Exception as e:
-                                            # Silently skip if we can't display raw SHAP values
-                                            pass
-                            else:
+                                    # Show the raw values of this customer
+                                    if shap_result.method == 'path':
+                                        st.markdown("**Raw path contributions:**")
+                                    else:
+                                        st.markdown("**Raw SHAP values:**")
+                                    st.code(f"{shap_result.customer_values}", language="python")
+                            elif shap_result is not None:
                                 st.warning("SHAP analysis couldn't be generated for this model.")
                                 st.info("""
                                 This could be due to:
@@ -1861,10 +1907,16 @@ def main():
                     else:
                         churn_prob = st.session_state.probability[1] if hasattr(st.session_state.probability, '__len__') else st.session_state.probability
                     
+                    # One discount rate for every CLV figure on this tab
+                    col1, col2 = st.columns(2)
+                    horizon = col1.slider("Projection horizon (months)", 6, 60, 12, key="clv_horizon")
+                    annual_rate = col2.slider("Annual discount rate (%)", 0, 30, 10, key="clv_discount") / 100
+                    
                     # Calculate CLV
                     clv = calculate_clv(
                         monthly_revenue * 12,  # Annual value
-                        churn_prob
+                        churn_prob,
+                        discount_rate=annual_rate
                     )
                     
                     # Display CLV
@@ -1875,20 +1927,67 @@ def main():
                         st.write(f"- Monthly Revenue: ${monthly_revenue:.2f}")
                         st.write(f"- Annual Revenue: ${monthly_revenue * 12:.2f}")
                         st.write(f"- Predicted Churn Probability: {churn_prob:.1%}")
-                        st.write(f"- Discount Rate: 10%")
+                        st.write(f"- Discount Rate: {annual_rate:.0%}")
+                    
+                    # Probabilistic CLV once BG/NBD + Gamma-Gamma have been fitted
+                    # on a transaction log (`python clv_model.py fit ...`)
+                    clv_model = get_clv_model()
+                    if clv_model is not None:
+                        from clv_model import summary_from_inputs
+                        
+                        customer_rfm = summary_from_inputs(st.session_state.user_inputs)
+                        clv_prediction = clv_model.predict(
+                            customer_rfm, months=12, monthly_discount_rate=monthly_discount(annual_rate)
+                        ).iloc[0]
+                        with st.expander("Probabilistic CLV (BG/NBD + Gamma-Gamma)"):
+                            col1, col2, col3 = st.columns(3)
+                            col1.metric("Expected Orders (12 months)", f"{clv_prediction['expected_purchases']:.1f}")
+                            col2.metric("Probability Active", f"{clv_prediction['probability_alive']:.0%}")
+                            if np.isfinite(clv_prediction['clv']):
+                                col3.metric("12-Month CLV", f"${clv_prediction['clv']:,.2f}")
+                            st.caption(
+                                f"Fitted on {clv_model.info.get('n_customers', 0):,} customers "
+                                f"({clv_model.info.get('n_tuples', 0):,} distinct RFM tuples). "
+                                "Orders, tenure, days since last order and monthly charges are mapped "
+                                "to frequency, age, recency and spend per order."
+                            )
+                    
+                    # Show CLV over time: survival-weighted, discounted monthly revenue
+                    from clv_projection import monthly_churn, project_clv
                     
-                    # Show CLV over time
-                    months = list(range(1, 13))
-                    clv_values = [calculate_clv(monthly_revenue * m, churn_prob) for m in months]
+                    projection = project_clv(
+                        [monthly_revenue],
+                        monthly_churn([churn_prob], period_months=12),
+                        horizon=horizon,
+                        monthly_discount_rate=monthly_discount(annual_rate),
+                        percentiles=(),
+                    )
                     
                     # Create and display the CLV over time plot
+                    import plotly.express as px
                     fig = px.line(
-                        x=months,
-                        y=clv_values,
+                        x=projection.months,
+                        y=projection.mean,
                         title="Projected CLV Over Time",
                         labels={"x": "Months", "y": "CLV ($)"}
                     )
                     st.plotly_chart(fig, use_container_width=True)
+                    
+                    # Uncertainty from simulated churn timing and revenue noise
+                    from clv_simulation import simulate_clv
+                    
+                    simulation = simulate_clv(
+                        [monthly_revenue],
+                        monthly_churn([churn_prob], period_months=12),
+                        horizon=horizon,
+                        monthly_discount_rate=monthly_discount(annual_rate),
+                        paths=2000,
+                    )
+                    low, median, high = simulation.quantiles[0]
+                    st.caption(
+                        f"{horizon}-month CLV 90% interval: ${low:,.2f} – ${high:,.2f} "
+                        f"(median ${median:,.2f}, mean ${simulation.mean[0]:,.2f}, 2,000 simulated paths)"
+                    )
                 
             except Exception as e:
                 st.error(f"Error calculating CLV: {str(e)}")
@@ -1908,13 +2007,61 @@ def main():
             st.info("Please make a prediction first to see the persona analysis.")
         else:
             try:
-                # Generate persona
-                persona = generate_persona(st.session_state.user_inputs)
+                # Generate persona from the customer's segment (or the rules if none are fitted)
+                persona = generate_persona(
+                    st.session_state.user_inputs,
+                    get_segmenter(),
+                    st.session_state.features.to_numpy()[0] if 'features' in st.session_state else None,
+                )
                 
                 # Display persona
                 st.subheader(f"Persona: {persona['type']}")
                 st.write(persona['description'])
                 
+                segment = persona.get('segment')
+                if segment:
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Segment", f"#{segment['id']}")
+                    col2.metric("Segment Size", f"{segment['size']:,}", f"{segment['share']:.1%} of customers",
+                                delta_color="off")
+                    if segment.get('churn_rate') is not None:
+                        col3.metric("Segment Churn Rate", f"{segment['churn_rate']:.1%}")
+                    elif segment.get('predicted_churn') is not None:
+                        col3.metric("Predicted Segment Churn", f"{segment['predicted_churn']:.1%}")
+                
+                # Most similar historical customers and whether they churned
+                neighbor_index = get_neighbor_index()
+                if neighbor_index is not None and 'features' in st.session_state:
+                    distances, ids, outcomes = neighbor_index.query(
+                        st.session_state.features.to_numpy()[0], k=5
+                    )
+                    st.subheader("Similar Past Customers")
+                    known = ~np.isnan(outcomes)
+                    if known.any():
+                        st.write(f"{int(outcomes[known].sum())} of the {int(known.sum())} most similar "
+                                 f"customers churned.")
+                    st.dataframe(pd.DataFrame({
+                        'CustomerID': ids,
+                        'Distance': np.round(distances, 4),
+                        'Churned': np.where(known, np.where(outcomes == 1, 'Yes', 'No'), 'Unknown'),
+                    }), hide_index=True)
+                    st.caption(f"Nearest of {len(neighbor_index):,} historical customers by engineered features.")
+                
+                # Customers the model itself treats alike: most trees sharing a leaf
+                leaf_index = get_leaf_index()
+                if leaf_index is not None and 'features' in st.session_state:
+                    from explain import model_forest
+                    
+                    leaves = model_forest(get_model()).apply(st.session_state.features)[0]
+                    ids, shared, outcomes = leaf_index.query(leaves, k=5)
+                    st.subheader("Customers the Model Treats Alike")
+                    known = ~np.isnan(outcomes)
+                    st.dataframe(pd.DataFrame({
+                        'CustomerID': ids,
+                        'Shared Trees': [f"{count}/{leaf_index.n_trees}" for count in shared],
+                        'Churned': np.where(known, np.where(outcomes == 1, 'Yes', 'No'), 'Unknown'),
+                    }), hide_index=True)
+                
                 # Display strategies
                 st.subheader("Recommended Strategies")
                 for i, strategy in enumerate(persona['strategies'], 1):
@@ -1947,6 +2094,11 @@ def main():
         <p>For demonstration purposes only</p>
     </div>
     """, unsafe_allow_html=True)
+    
+    # Poll the background SHAP job without holding up the other tabs
+    if shap_pending:
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
 
 # Add custom JavaScript for dropdown styling
 st.components.v1.html("""
@@ -0,0 +1,178 @@
+"""Batch TreeSHAP explanations for customer files.
+
+Reads a CSV or Parquet customer file (the same columns as
+``score_customers.py``) chunk by chunk and computes exact TreeSHAP values
+for every customer on a process pool. Each worker memory-maps the model
+artifact and builds its explainer once, at start-up. Per-customer churn
+probability and one ``shap_<feature>`` column per model feature are
+streamed to a Parquet file, and the global mean |SHAP| per feature is
+accumulated on the fly and written to ``<output>.summary.json``.
+
+Usage:
+    python batch_explain.py customers.csv shap_values.parquet [--chunk-size 50000] [--workers 4]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from explain import get_explainer, positive_class
+from features import FEATURE_NAMES, engineer_features
+from forest_engine import load_forest
+from score_customers import iter_chunks
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Chunks queued per worker; bounds the memory held by pending results
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+_worker = {}
+
+
+def _init_worker(model_path):
+    # Runs once per worker process: map the model and build its explainer
+    forest = load_forest(model_path)
+    _worker['forest'] = forest
+    _worker['explainer'] = get_explainer(forest)
+
+
+def explain_chunk(chunk, id_column=None):
+    """Churn probability and TreeSHAP values for one chunk (runs in a worker)."""
+    forest = _worker['forest']
+    explainer = _worker['explainer']
+    features = engineer_features(chunk)
+    proba = forest.predict_proba(features)
+    classes = list(forest.classes_)
+    values = positive_class(explainer.shap_values(features), forest.classes_)
+
+    result = pd.DataFrame({
+        'churn_probability': proba[:, classes.index(1) if 1 in classes else -1],
+    })
+    if id_column and id_column in chunk.columns:
+        result.insert(0, id_column, chunk[id_column].to_numpy())
+    for i, name in enumerate(forest.feature_names or FEATURE_NAMES):
+        result[f'shap_{name}'] = values[:, i]
+    expected = float(positive_class(explainer.expected_value, forest.classes_))
+    return result, expected
+
+
+class ShapSummary:
+    """Running mean |SHAP| (and mean SHAP) per feature."""
+
+    def __init__(self, feature_names):
+        self.feature_names = list(feature_names)
+        self.count = 0
+        self.abs_sum = np.zeros(len(self.feature_names))
+        self.sum = np.zeros(len(self.feature_names))
+
+    def update(self, values):
+        self.count += len(values)
+        self.abs_sum += np.abs(values).sum(axis=0)
+        self.sum += values.sum(axis=0)
+
+    def to_dict(self, expected_value=None):
+        count = max(self.count, 1)
+        mean_abs = self.abs_sum / count
+        order = np.argsort(mean_abs)[::-1]
+        return {
+            'rows': self.count,
+            'expected_value': expected_value,
+            'mean_abs_shap': {self.feature_names[i]: float(mean_abs[i]) for i in order},
+            'mean_shap': {name: float(total / count) for name, total in zip(self.feature_names, self.sum)},
+        }
+
+
+def explain_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, model_path=None,
+                 id_column='CustomerID', workers=None, log=print):
+    """Write TreeSHAP values for every row of ``input_path`` to Parquet.
+
+    Returns:
+        dict: The global summary (also written next to the output).
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Writing Parquet needs pyarrow: `pip install pyarrow`")
+
+    workers = workers or os.cpu_count() or 1
+    summary = None
+    writer = None
+    expected = None
+    start = time.perf_counter()
+    pending = deque()
+
+    def write(result):
+        nonlocal writer, summary
+        table = pa.Table.from_pandas(result, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(output_path, table.schema)
+            shap_columns = [c for c in result.columns if c.startswith('shap_')]
+            summary = ShapSummary([c[len('shap_'):] for c in shap_columns])
+        writer.write_table(table)
+        summary.update(result[[f'shap_{name}' for name in summary.feature_names]].to_numpy())
+        log(f"Explained {summary.count} rows "
+            f"({summary.count / max(time.perf_counter() - start, 1e-9):,.0f} rows/sec)")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path,)) as pool:
+            for chunk in iter_chunks(input_path, chunk_size, id_column=id_column):
+                pending.append(pool.submit(explain_chunk, chunk, id_column))
+                # Write finished chunks in input order; never queue too far ahead
+                while pending and (pending[0].done() or
+                                   len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER):
+                    result, expected = pending.popleft().result()
+                    write(result)
+            while pending:
+                result, expected = pending.popleft().result()
+                write(result)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if summary is None:
+        raise RuntimeError(f"No rows found in {input_path}")
+    report = summary.to_dict(expected)
+    report['seconds'] = time.perf_counter() - start
+    report['rows_per_sec'] = summary.count / max(report['seconds'], 1e-9)
+    with open(f"{output_path}.summary.json", 'w') as f:
+        json.dump(report, f, indent=2)
+
+    log(f"Wrote {summary.count} rows to {output_path} in {report['seconds']:.2f}s")
+    log("Mean |SHAP| per feature:")
+    for name, value in report['mean_abs_shap'].items():
+        log(f"  {name}: {value:.4f}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute TreeSHAP values for a customer file.")
+    parser.add_argument('input', help="CSV or Parquet file with the app's customer columns")
+    parser.add_argument('output', help="Parquet file to write SHAP values to")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes (default: one per CPU)")
+    parser.add_argument('--model', default=None,
+                        help="Model artifact directory or pickle (default: the app's model)")
+    parser.add_argument('--id-column', default='CustomerID',
+                        help="Column copied to the output to identify rows (if present)")
+    args = parser.parse_args(argv)
+
+    try:
+        explain_file(args.input, args.output, chunk_size=args.chunk_size, model_path=args.model,
+                     id_column=args.id_column, workers=args.workers)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,12 @@
 import streamlit as st
-import pickle
 import pandas as pd
 import os
 
-# Load model
+from model_registry import get_registry
+
+# Load model (shared by all sessions; reloaded only when the file changes)
 model_path = os.path.join(os.path.dirname(__file__), 'churn_model.pkl')
-with open(model_path, 'rb') as file:
-    model = pickle.load(file)
+model = get_registry().get(model_path)
 
 # Set page config
 st.set_page_config(
@@ -0,0 +1,16 @@
+"""Customer lifetime value calculations shared by the app and batch tools."""
+
+
+def calculate_clv(monetary_value, predicted_churn_prob, discount_rate=0.1, avg_customer_lifespan=36):
+    """Calculate Customer Lifetime Value.
+
+    Works element-wise on NumPy arrays as well as on scalars.
+    """
+    retention_rate = 1 - predicted_churn_prob
+    clv = (monetary_value * retention_rate) / (1 + discount_rate - retention_rate)
+    return clv
+
+
+def monthly_discount(annual_rate):
+    """Monthly discount rate equivalent to ``annual_rate``."""
+    return (1.0 + annual_rate) ** (1.0 / 12) - 1.0
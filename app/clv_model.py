@@ -0,0 +1,357 @@
+"""Probabilistic CLV: BG/NBD purchase model and Gamma-Gamma spend model.
+
+Fits the two ``lifetimes`` models on an RFM summary of a transaction log
+and predicts expected purchases, probability alive and discounted CLV.
+
+Customers with the same (frequency, recency, T, monetary value) have the
+same likelihood and the same predictions, so both fitting and prediction
+work on the distinct tuples only: the fitters get one row per tuple with
+its customer count as weight, and predictions are computed per tuple in
+vectorized batches and broadcast back to customers. Fitted parameters are
+saved as JSON together with a fingerprint of the training tuples, so a
+refit on unchanged data is skipped.
+
+Usage:
+    python clv_model.py fit transactions.csv --customer-id CustomerID --date InvoiceDate --amount Amount
+    python clv_model.py predict transactions.csv clv.csv [--months 12] [--annual-discount-rate 0.1]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from clv import monthly_discount
+
+DEFAULT_PARAMS_PATH = os.path.join(os.path.dirname(__file__), 'clv_params.json')
+
+FORMAT_VERSION = 1
+
+RFM_COLUMNS = ['frequency', 'recency', 'T', 'monetary_value']
+
+# Days per month when projecting CLV month by month (as lifetimes does)
+DAYS_PER_MONTH = 30
+
+# Tuples evaluated per prediction batch
+PREDICT_BATCH_ROWS = 1 << 16
+
+
+def summary_from_transactions(transactions, customer_col, date_col, amount_col=None,
+                              observation_end=None):
+    """RFM summary (in days) of a transaction log, one row per customer.
+
+    Transactions on the same day count as one purchase. ``frequency`` is the
+    number of repeat purchase days, ``recency`` the age of the customer at
+    the last purchase, ``T`` the age at ``observation_end`` and
+    ``monetary_value`` the mean spend of the repeat purchases (0 without).
+    """
+    dates = pd.to_datetime(transactions[date_col]).dt.floor('D')
+    end = pd.Timestamp(observation_end).floor('D') if observation_end is not None else dates.max()
+    frame = pd.DataFrame({
+        'customer': transactions[customer_col].to_numpy(),
+        'day': dates.to_numpy(),
+        'amount': transactions[amount_col].to_numpy(dtype=np.float64) if amount_col else 0.0,
+    })
+    frame = frame[frame['day'] <= end]
+    daily = frame.groupby(['customer', 'day'], sort=True)['amount'].sum().reset_index()
+
+    grouped = daily.groupby('customer', sort=False)
+    first_day = grouped['day'].min()
+    last_day = grouped['day'].max()
+    n_days = grouped['day'].size()
+    total = grouped['amount'].sum()
+    first_amount = grouped['amount'].first()
+
+    frequency = (n_days - 1).astype(np.float64)
+    repeat_total = total - first_amount
+    summary = pd.DataFrame({
+        'frequency': frequency,
+        'recency': (last_day - first_day).dt.days.astype(np.float64),
+        'T': (end - first_day).dt.days.astype(np.float64),
+        'monetary_value': np.where(frequency > 0, repeat_total / frequency.where(frequency > 0, 1), 0.0),
+    })
+    summary.index.name = customer_col
+    return summary
+
+
+def collapse(summary, columns=RFM_COLUMNS):
+    """Distinct rows of ``summary[columns]`` with their counts.
+
+    Returns:
+        tuple: ``(tuples, weights, inverse)`` where ``tuples.iloc[inverse]``
+        rebuilds the original rows.
+    """
+    frame = summary[columns].reset_index(drop=True)
+    groups = frame.groupby(columns, sort=False)
+    inverse = groups.ngroup().to_numpy()
+    tuples = groups.size().reset_index(name='weight')
+    # ngroup numbers groups in order of first appearance, like size() with sort=False
+    return tuples[columns], tuples['weight'].to_numpy(dtype=np.float64), inverse
+
+
+def tuples_fingerprint(tuples, weights):
+    """Hash of the weighted tuples that does not depend on customer order."""
+    values = tuples.to_numpy(dtype=np.float64)
+    order = np.lexsort(values.T[::-1])
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(values[order]).tobytes())
+    digest.update(np.ascontiguousarray(weights[order]).tobytes())
+    return digest.hexdigest()
+
+
+def _fit_weighted(fitter, *columns, weights):
+    """Fit a lifetimes model on weighted tuples.
+
+    The weighted likelihood sums fewer, larger terms than the per-customer
+    one, and BFGS can stop just short of the default tolerance with a
+    precision-loss warning. Retry once with a looser tolerance in that case.
+    """
+    import contextlib
+    import io
+
+    from lifetimes.utils import ConvergenceError
+
+    for tol in (1e-7, 1e-6):
+        try:
+            # lifetimes prints the optimizer result when it fails to converge
+            with contextlib.redirect_stdout(io.StringIO()):
+                return fitter.fit(*columns, weights=weights, tol=tol)
+        except ConvergenceError:
+            if tol == 1e-6:
+                raise
+
+
+class CLVModel:
+    """Fitted BG/NBD and Gamma-Gamma parameters with vectorized predictions."""
+
+    def __init__(self, bgnbd, gamma_gamma=None, info=None):
+        self.bgnbd = dict(bgnbd)
+        self.gamma_gamma = dict(gamma_gamma) if gamma_gamma else None
+        self.info = dict(info or {})
+
+    @classmethod
+    def fit(cls, summary, penalizer_coef=0.0):
+        """Fit both models on the distinct RFM tuples of ``summary``."""
+        try:
+            from lifetimes import BetaGeoFitter, GammaGammaFitter
+        except ImportError:
+            raise RuntimeError("Fitting CLV models needs lifetimes: `pip install lifetimes`")
+
+        start = time.perf_counter()
+        tuples, weights, _ = collapse(summary, ['frequency', 'recency', 'T'])
+        bgf = BetaGeoFitter(penalizer_coef=penalizer_coef)
+        _fit_weighted(bgf, tuples['frequency'], tuples['recency'], tuples['T'], weights=weights)
+        bgnbd = {name: float(bgf.params_[name]) for name in ['r', 'alpha', 'a', 'b']}
+
+        gamma_gamma = None
+        repeat = summary[(summary['frequency'] > 0) & (summary['monetary_value'] > 0)]
+        if len(repeat):
+            spend, spend_weights, _ = collapse(repeat, ['frequency', 'monetary_value'])
+            ggf = GammaGammaFitter(penalizer_coef=penalizer_coef)
+            _fit_weighted(ggf, spend['frequency'], spend['monetary_value'], weights=spend_weights)
+            gamma_gamma = {name: float(ggf.params_[name]) for name in ['p', 'q', 'v']}
+
+        all_tuples, all_weights, _ = collapse(summary)
+        info = {
+            'fingerprint': tuples_fingerprint(all_tuples, all_weights),
+            'n_customers': int(len(summary)),
+            'n_tuples': int(len(tuples)),
+            'n_spend_tuples': int(len(spend)) if gamma_gamma else 0,
+            'fit_seconds': time.perf_counter() - start,
+            'fitted_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'time_unit': 'days',
+        }
+        return cls(bgnbd, gamma_gamma, info)
+
+    def save(self, path=DEFAULT_PARAMS_PATH):
+        payload = {
+            'format_version': FORMAT_VERSION,
+            'bgnbd': self.bgnbd,
+            'gamma_gamma': self.gamma_gamma,
+            'info': self.info,
+        }
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(payload, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PARAMS_PATH):
+        with open(path) as f:
+            payload = json.load(f)
+        if payload.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported CLV parameter format in {path}")
+        return cls(payload['bgnbd'], payload.get('gamma_gamma'), payload.get('info'))
+
+    @classmethod
+    def fit_or_load(cls, summary, path=DEFAULT_PARAMS_PATH, penalizer_coef=0.0):
+        """Reuse the parameters in ``path`` if they were fitted on the same tuples."""
+        if os.path.exists(path):
+            cached = cls.load(path)
+            tuples, weights, _ = collapse(summary)
+            if cached.info.get('fingerprint') == tuples_fingerprint(tuples, weights):
+                return cached
+        model = cls.fit(summary, penalizer_coef=penalizer_coef)
+        model.save(path)
+        return model
+
+    def expected_purchases(self, t, frequency, recency, T):
+        """Expected purchases in the next ``t`` days (BG/NBD, conditional on history).
+
+        ``t`` may be an array broadcasting against the customer arrays.
+        """
+        from scipy.special import hyp2f1
+
+        r, alpha, a, b = (self.bgnbd[name] for name in ['r', 'alpha', 'a', 'b'])
+        x, t_x, T, t = (np.asarray(v, dtype=np.float64) for v in (frequency, recency, T, t))
+        _a, _b, _c = r + x, b + x, a + b + x - 1
+        z = t / (alpha + T + t)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ln_hyp = np.log(hyp2f1(_a, _b, _c, z))
+            # Equivalent (Euler) form where the direct series overflows
+            ln_hyp_alt = np.log(hyp2f1(_c - _a, _c - _b, _c, z)) + (_c - _a - _b) * np.log1p(-z)
+            ln_hyp = np.where(np.isinf(ln_hyp), ln_hyp_alt, ln_hyp)
+            numerator = (_c / (a - 1)) * -np.expm1(ln_hyp + (r + x) * np.log((alpha + T) / (alpha + T + t)))
+            denominator = 1 + (x > 0) * (a / np.maximum(b + x - 1, 1e-12)) * ((alpha + T) / (alpha + t_x)) ** (r + x)
+        return numerator / denominator
+
+    def probability_alive(self, frequency, recency, T):
+        from scipy.special import expit
+
+        r, alpha, a, b = (self.bgnbd[name] for name in ['r', 'alpha', 'a', 'b'])
+        x, t_x, T = (np.asarray(v, dtype=np.float64) for v in (frequency, recency, T))
+        log_div = (r + x) * np.log((alpha + T) / (alpha + t_x)) + np.log(a / (b + np.maximum(x, 1) - 1))
+        return np.where(x == 0, 1.0, expit(-log_div))
+
+    def expected_average_value(self, frequency, monetary_value):
+        """Gamma-Gamma expected spend per purchase (population mean without repeats)."""
+        if self.gamma_gamma is None:
+            raise RuntimeError("No Gamma-Gamma parameters: the training data had no repeat purchases")
+        p, q, v = (self.gamma_gamma[name] for name in ['p', 'q', 'v'])
+        x = np.asarray(frequency, dtype=np.float64)
+        m = np.asarray(monetary_value, dtype=np.float64)
+        weight = p * x / (p * x + q - 1)
+        return (1 - weight) * (v * p / (q - 1)) + weight * m
+
+    def customer_lifetime_value(self, frequency, recency, T, monetary_value, months=12,
+                                monthly_discount_rate=0.01):
+        """Discounted CLV over ``months``, summed month by month.
+
+        Returns:
+            np.ndarray: CLV per customer.
+        """
+        x, t_x, T = (np.asarray(v, dtype=np.float64) for v in (frequency, recency, T))
+        horizon = np.arange(months + 1, dtype=np.float64) * DAYS_PER_MONTH
+        # (n, months + 1) cumulative purchases -> purchases per month
+        cumulative = self.expected_purchases(horizon[None, :], x[:, None], t_x[:, None], T[:, None])
+        per_month = np.diff(cumulative, axis=1)
+        discount = (1 + monthly_discount_rate) ** -np.arange(1, months + 1, dtype=np.float64)
+        return self.expected_average_value(x, monetary_value) * (per_month @ discount)
+
+    def predict(self, summary, months=12, monthly_discount_rate=0.01, batch_rows=PREDICT_BATCH_ROWS):
+        """Predictions for every customer of ``summary``, computed per distinct tuple.
+
+        Returns:
+            pd.DataFrame: ``expected_purchases``, ``probability_alive``,
+            ``expected_average_value`` and ``clv`` indexed like ``summary``.
+        """
+        tuples, _, inverse = collapse(summary)
+        values = {name: tuples[name].to_numpy(dtype=np.float64) for name in RFM_COLUMNS}
+        n = len(tuples)
+        out = {name: np.empty(n) for name in
+               ['expected_purchases', 'probability_alive', 'expected_average_value', 'clv']}
+        for start in range(0, n, batch_rows):
+            batch = slice(start, min(start + batch_rows, n))
+            x, t_x, T, m = (values[name][batch] for name in RFM_COLUMNS)
+            out['expected_purchases'][batch] = self.expected_purchases(months * DAYS_PER_MONTH, x, t_x, T)
+            out['probability_alive'][batch] = self.probability_alive(x, t_x, T)
+            if self.gamma_gamma is not None:
+                out['expected_average_value'][batch] = self.expected_average_value(x, m)
+                out['clv'][batch] = self.customer_lifetime_value(
+                    x, t_x, T, m, months=months, monthly_discount_rate=monthly_discount_rate
+                )
+            else:
+                out['expected_average_value'][batch] = np.nan
+                out['clv'][batch] = np.nan
+        return pd.DataFrame({name: column[inverse] for name, column in out.items()}, index=summary.index)
+
+
+def summary_from_inputs(inputs):
+    """Approximate RFM summary (in days) for one customer of the app's sidebar.
+
+    Tenure gives the customer's age, OrderCount the purchases, DaySinceLastOrder
+    the recency and monthly charges over tenure the spend per order.
+    """
+    tenure_days = float(inputs.get('Tenure', 0)) * DAYS_PER_MONTH
+    orders = float(inputs.get('OrderCount', 0))
+    frequency = max(orders - 1, 0.0)
+    recency = min(max(tenure_days - float(inputs.get('DaySinceLastOrder', 0)), 0.0), tenure_days)
+    spend = float(inputs.get('MonthlyCharges', 0)) * float(inputs.get('Tenure', 0))
+    return pd.DataFrame({
+        'frequency': [frequency],
+        'recency': [recency if frequency > 0 else 0.0],
+        'T': [tenure_days],
+        'monetary_value': [spend / orders if orders > 0 else 0.0],
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit BG/NBD + Gamma-Gamma and predict CLV.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ['fit', 'predict']:
+        command = sub.add_parser(name)
+        command.add_argument('transactions', help="CSV or Parquet transaction log")
+        if name == 'predict':
+            command.add_argument('output', help="CSV file to write per-customer predictions to")
+            command.add_argument('--months', type=int, default=12)
+            command.add_argument('--annual-discount-rate', type=float, default=0.1)
+        command.add_argument('--customer-id', default='CustomerID')
+        command.add_argument('--date', default='InvoiceDate')
+        command.add_argument('--amount', default='Amount')
+        command.add_argument('--observation-end', default=None,
+                             help="End of the observation period (default: last transaction)")
+        command.add_argument('--params', default=DEFAULT_PARAMS_PATH,
+                             help="JSON file the fitted parameters are cached in")
+        command.add_argument('--refit', action='store_true', help="Ignore cached parameters")
+    args = parser.parse_args(argv)
+
+    try:
+        usecols = [args.customer_id, args.date, args.amount]
+        if args.transactions.lower().endswith(('.parquet', '.pq')):
+            transactions = pd.read_parquet(args.transactions, columns=usecols)
+        else:
+            transactions = pd.read_csv(args.transactions, usecols=usecols)
+        start = time.perf_counter()
+        summary = summary_from_transactions(transactions, args.customer_id, args.date, args.amount,
+                                            args.observation_end)
+        print(f"Summarized {len(transactions)} transactions into {len(summary)} customers "
+              f"in {time.perf_counter() - start:.2f}s")
+
+        if args.refit and os.path.exists(args.params):
+            os.remove(args.params)
+        start = time.perf_counter()
+        model = CLVModel.fit_or_load(summary, args.params)
+        print(f"Parameters ({model.info['n_tuples']} distinct tuples for {model.info['n_customers']} "
+              f"customers) ready in {time.perf_counter() - start:.2f}s: {args.params}")
+        print(f"  BG/NBD: {model.bgnbd}")
+        print(f"  Gamma-Gamma: {model.gamma_gamma}")
+
+        if args.command == 'predict':
+            start = time.perf_counter()
+            predictions = model.predict(summary, months=args.months,
+                                        monthly_discount_rate=monthly_discount(args.annual_discount_rate))
+            elapsed = time.perf_counter() - start
+            predictions.to_csv(args.output)
+            print(f"Predicted {len(predictions)} customers in {elapsed:.2f}s "
+                  f"({len(predictions) / max(elapsed, 1e-9):,.0f} customers/sec): {args.output}")
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
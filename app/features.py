@@ -0,0 +1,130 @@
+"""Vectorized feature engineering for the churn model.
+
+The deployed model takes three engineered features computed from the raw
+customer inputs collected by ``get_user_inputs()`` in ``app.py``:
+
+- Feature1 (engagement): low satisfaction and short tenure
+- Feature2 (usage): few orders and heavy coupon use
+- Feature3 (value & issues): little cashback and recent complaints
+
+Each is squashed into (0, 1) with a sigmoid. The functions here work on a
+DataFrame or a mapping of column arrays of any length, in one vectorized
+pass with no Streamlit dependency, so the interactive app and batch jobs
+share exactly the same feature logic.
+"""
+import numpy as np
+import pandas as pd
+
+FEATURE_NAMES = ['Feature1', 'Feature2', 'Feature3']
+
+# Raw inputs used by the features and the value assumed when one is missing
+INPUT_DEFAULTS = {
+    'Tenure': 0.0,
+    'SatisfactionScore': 3.0,
+    'OrderCount': 0.0,
+    'CouponUsed': 0.0,
+    'CashbackAmount': 0.0,
+    'Complain': 0.0,
+}
+
+MAX_TENURE_MONTHS = 72
+MAX_CASHBACK = 300.0
+
+
+def _as_column(values, default, n_rows):
+    if values is None:
+        return np.full(n_rows, default, dtype=np.float64)
+    values = np.asarray(values)
+    if values.dtype.kind in 'OUS':
+        # Accept "Yes"/"No" style flags as well as numeric strings
+        text = pd.Series(values.ravel()).astype(str).str.strip().str.lower()
+        flags = text.map({'yes': 1.0, 'no': 0.0, 'true': 1.0, 'false': 0.0})
+        values = flags.fillna(pd.to_numeric(text, errors='coerce')).to_numpy(dtype=np.float64)
+    column = np.array(values, dtype=np.float64, ndmin=1).ravel()
+    if column.size == 1 and n_rows != 1:
+        column = np.full(n_rows, column[0])
+    column[np.isnan(column)] = default
+    return column
+
+
+def extract_inputs(data):
+    """Return the raw model inputs as float64 arrays of equal length.
+
+    Args:
+        data: DataFrame, dict of column arrays, or dict of scalars (one customer).
+    """
+    if isinstance(data, pd.DataFrame):
+        n_rows = len(data)
+        get = lambda name: data[name].to_numpy() if name in data.columns else None
+    else:
+        lengths = [np.size(data[name]) for name in INPUT_DEFAULTS if name in data]
+        n_rows = max(lengths) if lengths else 1
+        get = data.get
+    inputs = {name: _as_column(get(name), default, n_rows) for name, default in INPUT_DEFAULTS.items()}
+    # Complaints are a 0/1 flag
+    inputs['Complain'] = np.trunc(inputs['Complain'])
+    return inputs
+
+
+def compute_components(inputs):
+    """Intermediate scores behind the engineered features (float64 arrays)."""
+    tenure = inputs['Tenure']
+    orders = inputs['OrderCount']
+
+    # Feature 1: Engagement Score (combines Tenure and Satisfaction)
+    tenure_score = np.log1p(tenure) / np.log1p(MAX_TENURE_MONTHS)
+    sat_score = (inputs['SatisfactionScore'] / 5.0) ** 2
+    feature1 = 0.6 * (1 - sat_score) + 0.4 * (1 - tenure_score)
+
+    # Feature 2: Usage Pattern (combines OrderCount and CouponUsed)
+    order_score = np.minimum(orders / 50.0, 2.0)
+    coupon_ratio = np.minimum(inputs['CouponUsed'] / (orders + 1), 1.0)
+    feature2 = 0.7 * (1 - order_score / 2.0) + 0.3 * coupon_ratio
+
+    # Feature 3: Value & Issues (combines Cashback and Complaints)
+    cashback_score = 1.0 - np.minimum(inputs['CashbackAmount'] / MAX_CASHBACK, 1.0)
+    feature3 = cashback_score + 0.5 * inputs['Complain']
+
+    return {
+        'tenure_score': tenure_score,
+        'sat_score': sat_score,
+        'order_score': order_score,
+        'coupon_ratio': coupon_ratio,
+        'cashback_score': cashback_score,
+        'Feature1': feature1,
+        'Feature2': feature2,
+        'Feature3': feature3,
+    }
+
+
+def _sigmoid(x, out):
+    # 1 / (1 + exp(-10 * (x - 0.5))), evaluated in place
+    np.subtract(x, 0.5, out=out)
+    np.multiply(out, -10.0, out=out)
+    np.exp(out, out=out)
+    np.add(out, 1.0, out=out)
+    return np.reciprocal(out, out=out)
+
+
+def engineer_features(data, dtype=np.float32):
+    """Compute Feature1..Feature3 for every row.
+
+    Intermediate math runs in float64 so values match the scalar computation
+    the app used before; the result is cast once to ``dtype``.
+
+    Returns:
+        np.ndarray: Array of shape (n_rows, 3).
+    """
+    components = compute_components(extract_inputs(data))
+    n_rows = len(components['Feature1'])
+    features = np.empty((n_rows, len(FEATURE_NAMES)), dtype=dtype)
+    scratch = np.empty(n_rows, dtype=np.float64)
+    for i, name in enumerate(FEATURE_NAMES):
+        features[:, i] = _sigmoid(components[name], scratch)
+    return features
+
+
+def features_frame(data, dtype=np.float32):
+    """Engineered features as a DataFrame with the model's column names."""
+    index = data.index if isinstance(data, pd.DataFrame) else None
+    return pd.DataFrame(engineer_features(data, dtype=dtype), columns=FEATURE_NAMES, index=index)
@@ -0,0 +1,279 @@
+"""Flattened NumPy inference engine for the churn RandomForest.
+
+All trees of a fitted forest are packed into one set of contiguous node
+arrays (struct-of-arrays), so a batch is scored with vectorized NumPy and a
+single traversal yields both the class and its probability. Nothing in here
+imports sklearn; the forest is read through its public ``estimators_`` /
+``tree_`` attributes only.
+"""
+import os
+import pickle
+
+import numpy as np
+
+# Rows x trees visited per step when all trees are walked together; bounds
+# the temporary index arrays regardless of batch size.
+MAX_NODES_PER_STEP = 1 << 20
+
+# From this many rows on it is cheaper to walk one tree at a time over
+# contiguous feature columns than all trees at once.
+TREE_AT_A_TIME_ROWS = 512
+
+
+class FlatForest:
+    """A forest flattened into contiguous node arrays.
+
+    Node ``i`` splits on ``feature[i]`` at ``threshold[i]``. ``children[i]``
+    holds ``(right, left)``, so the next node is ``children[i, x <= threshold]``.
+    Leaves point to themselves, which lets every tree be walked for a fixed
+    number of steps without branching. ``value`` holds the normalized class
+    probabilities of every node and ``cover`` the weighted number of training
+    samples that reached it.
+    """
+
+    ARRAYS = ('feature', 'threshold', 'children', 'value', 'cover', 'roots', 'depth')
+
+    def __init__(self, feature, threshold, children, value, cover, roots, depth,
+                 classes, feature_names=None, n_features=None,
+                 feature_importances=None, manifest=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.cover = cover
+        self.roots = roots
+        self.depth = depth
+        self.classes_ = np.asarray(classes)
+        self.n_classes_ = len(self.classes_)
+        self.tree_depth = np.maximum.reduceat(depth, roots) if len(roots) else np.zeros(0, dtype=depth.dtype)
+        self.max_depth = int(self.tree_depth.max()) if len(roots) else 0
+        if n_features is None:
+            n_features = len(feature_names) if feature_names is not None else int(feature.max()) + 1
+        self.n_features_in_ = int(n_features)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        if feature_importances is not None:
+            self.feature_importances_ = np.asarray(feature_importances, dtype=np.float64)
+        self.manifest = manifest
+
+    @classmethod
+    def from_estimator(cls, model, feature_names=None):
+        """Flatten a fitted RandomForestClassifier (or compatible) model."""
+        estimators = getattr(model, 'estimators_', None)
+        if not estimators:
+            raise ValueError("Model has no fitted estimators_ to flatten")
+        if feature_names is None and getattr(model, 'feature_names_in_', None) is not None:
+            feature_names = [str(name) for name in model.feature_names_in_]
+        try:
+            feature_importances = model.feature_importances_
+        except Exception:
+            feature_importances = None
+
+        features, thresholds, children, values, covers, roots, depths = [], [], [], [], [], [], []
+        offset = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            n_nodes = int(tree.node_count)
+            left = np.asarray(tree.children_left[:n_nodes], dtype=np.intp)
+            right = np.asarray(tree.children_right[:n_nodes], dtype=np.intp)
+            is_leaf = left < 0
+            node_ids = np.arange(n_nodes)
+            left = np.where(is_leaf, node_ids, left)
+            right = np.where(is_leaf, node_ids, right)
+
+            feature = np.asarray(tree.feature[:n_nodes], dtype=np.intp).copy()
+            feature[is_leaf] = 0
+            threshold = np.asarray(tree.threshold[:n_nodes], dtype=np.float64).copy()
+            threshold[is_leaf] = 0.0
+
+            features.append(feature)
+            thresholds.append(threshold)
+            children.append(np.stack([right, left], axis=1) + offset)
+            values.append(_normalize(np.asarray(tree.value[:n_nodes])[:, 0, :]))
+            covers.append(np.asarray(tree.weighted_n_node_samples[:n_nodes], dtype=np.float64))
+            depths.append(_node_depths(left, right, is_leaf))
+            roots.append(offset)
+            offset += n_nodes
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            children=np.concatenate(children),
+            value=np.concatenate(values),
+            cover=np.concatenate(covers),
+            roots=np.asarray(roots, dtype=np.intp),
+            depth=np.concatenate(depths),
+            classes=model.classes_,
+            feature_names=feature_names,
+            n_features=getattr(model, 'n_features_in_', None),
+            feature_importances=feature_importances,
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def children_left(self):
+        return self.children[:, 1]
+
+    @property
+    def children_right(self):
+        return self.children[:, 0]
+
+    @property
+    def is_leaf(self):
+        return self.children[:, 1] == np.arange(self.n_nodes)
+
+    @property
+    def nbytes(self):
+        return int(sum(getattr(self, name).nbytes for name in self.ARRAYS))
+
+    def as_array(self, X):
+        """Convert input rows to the float32 matrix the trees were fitted on."""
+        if hasattr(X, 'columns') and self.feature_names is not None:
+            if all(name in X.columns for name in self.feature_names):
+                X = X[self.feature_names]
+        if hasattr(X, 'values'):
+            X = X.values
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has {X.shape[1]} features, but the forest expects {self.n_features_in_}"
+            )
+        return X
+
+    def apply(self, X):
+        """Return the global leaf index reached in every tree, shape (n_rows, n_trees)."""
+        X = self.as_array(X)
+        leaves = np.empty((X.shape[0], self.n_trees), dtype=np.intp)
+        for start, chunk in self._iter_leaves(X):
+            leaves[start:start + len(chunk)] = chunk
+        return leaves
+
+    def _iter_leaves(self, X):
+        """Yield ``(start_row, leaves)`` with all trees walked together."""
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        children = self.children.ravel()
+        step = max(1, MAX_NODES_PER_STEP // max(1, self.n_trees))
+        for start in range(0, n_rows, step):
+            stop = min(start + step, n_rows)
+            row_offsets = (np.arange(start, stop, dtype=np.intp) * n_features)[:, None]
+            nodes = np.repeat(self.roots[None, :], stop - start, axis=0)
+            for _ in range(self.max_depth):
+                x = np.take(flat, row_offsets + np.take(self.feature, nodes))
+                go_left = x <= np.take(self.threshold, nodes)
+                nodes = np.take(children, 2 * nodes + go_left)
+            yield start, nodes
+
+    def _proba_from_leaves(self, leaves):
+        # Accumulate tree by tree (reduction over a non-contiguous axis), which
+        # matches the summation order of sklearn's forest predict_proba.
+        proba = np.take(self.value, leaves.T, axis=0).sum(axis=0)
+        proba /= self.n_trees
+        return proba
+
+    def _predict_proba(self, X):
+        n_rows = X.shape[0]
+        if n_rows < TREE_AT_A_TIME_ROWS:
+            proba = np.empty((n_rows, self.n_classes_), dtype=np.float64)
+            for start, leaves in self._iter_leaves(X):
+                proba[start:start + len(leaves)] = self._proba_from_leaves(leaves)
+            return proba
+
+        columns = np.ascontiguousarray(X.T)
+        flat = columns.ravel()
+        children = self.children.ravel()
+        row_ids = np.arange(n_rows, dtype=np.intp)
+        proba = np.zeros((n_rows, self.n_classes_), dtype=np.float64)
+        for root, depth in zip(self.roots, self.tree_depth):
+            # Every row starts at the root, so the first split reads one
+            # contiguous column instead of gathering.
+            go_left = columns[self.feature[root]] <= self.threshold[root]
+            nodes = np.take(children, 2 * root + go_left)
+            for _ in range(depth - 1):
+                x = np.take(flat, np.take(self.feature, nodes) * n_rows + row_ids)
+                go_left = x <= np.take(self.threshold, nodes)
+                nodes = np.take(children, 2 * nodes + go_left)
+            proba += np.take(self.value, nodes, axis=0)
+        proba /= self.n_trees
+        return proba
+
+    def predict_proba(self, X):
+        """Class probabilities averaged over all trees."""
+        return self._predict_proba(self.as_array(X))
+
+    def predict(self, X):
+        """Most likely class label for each row."""
+        return self.predict_with_proba(X)[0]
+
+    def predict_with_proba(self, X):
+        """Return ``(labels, probabilities)`` from a single traversal."""
+        proba = self.predict_proba(X)
+        return self.classes_[np.argmax(proba, axis=1)], proba
+
+
+def _normalize(value):
+    """Turn per-node class counts (or fractions) into probabilities."""
+    value = np.asarray(value, dtype=np.float64)
+    normalizer = value.sum(axis=1, keepdims=True)
+    if np.allclose(normalizer, 1.0):
+        return value.copy()
+    normalizer[normalizer == 0.0] = 1.0
+    return value / normalizer
+
+
+def _node_depths(left, right, is_leaf):
+    """Depth of every node; children always have larger ids than parents."""
+    depth = np.zeros(len(left), dtype=np.intp)
+    for node in np.flatnonzero(~is_leaf):
+        depth[left[node]] = depth[node] + 1
+        depth[right[node]] = depth[node] + 1
+    return depth
+
+
+def load_forest(path=None):
+    """Load the churn forest as a FlatForest.
+
+    ``path`` may be an exported artifact directory (see ``model_artifact``),
+    which is memory-mapped, or a pickled model, which is flattened after
+    unpickling. By default the exported artifact is used when present.
+    """
+    from model_artifact import DEFAULT_ARTIFACT_DIR, is_artifact, load_artifact
+
+    if path is None:
+        path = DEFAULT_ARTIFACT_DIR
+        if not is_artifact(path):
+            path = os.path.join(os.path.dirname(__file__), 'churn_model.pkl')
+    if is_artifact(path):
+        return load_artifact(path)
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+    return FlatForest.from_estimator(model)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    forest = load_forest(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"Trees: {forest.n_trees}, nodes: {forest.n_nodes}, "
+          f"max depth: {forest.max_depth}, size: {forest.nbytes / 1024:.1f} KB")
+
+    rng = np.random.default_rng(0)
+    for n_rows, repeats in [(1, 2000), (100_000, 5)]:
+        X = rng.random((n_rows, forest.n_features_in_), dtype=np.float32)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            forest.predict_with_proba(X)
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"{n_rows:>7} rows: {elapsed * 1e3:.3f} ms per call")
@@ -0,0 +1,179 @@
+"""Exact threshold-grid compilation of a low-dimensional forest.
+
+The churn model only sees Feature1..Feature3, so the whole forest is a
+piecewise-constant function of three inputs. Along each feature the split
+thresholds of all trees cut the line into intervals. Every tree makes the
+same decision for all points of a cell of the resulting grid. Evaluating
+the forest once per cell gives a dense probability table, and scoring
+becomes one ``np.searchsorted`` per feature plus a single table lookup.
+
+Cells are evaluated with the same traversal code as ``FlatForest``, so
+grid output is bit-identical to the tree traversal (and to sklearn's
+``predict_proba``). When the table would exceed the memory cap, the
+compiled scorer falls back to tree traversal.
+"""
+import numpy as np
+
+from forest_engine import FlatForest
+
+# Largest probability table compiled by default
+DEFAULT_MAX_GRID_BYTES = 64 * 1024 * 1024
+
+# Cells evaluated per traversal batch while compiling
+COMPILE_BATCH_CELLS = 1 << 16
+
+
+class ForestGrid:
+    """Dense table of forest probabilities over the threshold grid."""
+
+    def __init__(self, thresholds, table, classes):
+        self.thresholds = thresholds
+        self.table = table
+        self.classes_ = np.asarray(classes)
+        self.shape = tuple(len(t) + 1 for t in thresholds)
+        self.strides = np.array(
+            [int(np.prod(self.shape[i + 1:])) for i in range(len(self.shape))], dtype=np.intp
+        )
+
+    @classmethod
+    def compile(cls, forest, max_bytes=DEFAULT_MAX_GRID_BYTES):
+        """Evaluate ``forest`` on every grid cell.
+
+        Raises:
+            MemoryError: If the table would need more than ``max_bytes``.
+        """
+        thresholds = grid_thresholds(forest)
+        n_cells = grid_cells(thresholds)
+        n_bytes = grid_nbytes(forest, thresholds)
+        if n_bytes > max_bytes:
+            raise MemoryError(
+                f"Threshold grid needs {n_bytes / 2**20:.1f} MB "
+                f"({n_cells} cells), over the {max_bytes / 2**20:.1f} MB cap"
+            )
+
+        # A cell is identified by how many thresholds of each feature lie
+        # strictly below x. Threshold i itself lies in cell i (x <= t goes
+        # left) and +inf in the last one, so they are exact representatives.
+        representatives = [np.append(t, np.inf) for t in thresholds]
+        shape = tuple(len(t) + 1 for t in thresholds)
+        table = np.empty((n_cells, forest.n_classes_), dtype=np.float64)
+        for start in range(0, n_cells, COMPILE_BATCH_CELLS):
+            cells = np.arange(start, min(start + COMPILE_BATCH_CELLS, n_cells))
+            index = np.unravel_index(cells, shape)
+            points = np.column_stack([rep[i] for rep, i in zip(representatives, index)])
+            # float64 points skip the float32 cast; the cell ids are exact
+            table[start:start + len(cells)] = forest._predict_proba(points)
+        return cls(thresholds, table, forest.classes_)
+
+    @property
+    def n_cells(self):
+        return len(self.table)
+
+    @property
+    def nbytes(self):
+        return int(self.table.nbytes + sum(t.nbytes for t in self.thresholds))
+
+    def cell_index(self, X):
+        """Flat cell index of every row of a float32 matrix."""
+        index = np.zeros(X.shape[0], dtype=np.intp)
+        for feature, (thresholds, stride) in enumerate(zip(self.thresholds, self.strides)):
+            index += np.searchsorted(thresholds, X[:, feature], side='left') * stride
+        return index
+
+    def predict_proba(self, X):
+        return np.take(self.table, self.cell_index(X), axis=0)
+
+
+class CompiledForest:
+    """A FlatForest that scores through its threshold grid when one fits.
+
+    Other attributes are forwarded to the underlying forest.
+    """
+
+    def __init__(self, forest, max_bytes=DEFAULT_MAX_GRID_BYTES):
+        self.forest = forest
+        self.grid_nbytes = grid_nbytes(forest)
+        try:
+            self.grid = ForestGrid.compile(forest, max_bytes=max_bytes)
+        except MemoryError:
+            self.grid = None
+
+    @property
+    def mode(self):
+        return 'grid' if self.grid is not None else 'trees'
+
+    def describe(self):
+        """Short report of how this forest is scored."""
+        if self.grid is not None:
+            return (f"threshold grid: {self.grid.n_cells} cells, "
+                    f"{self.grid.nbytes / 1024:.1f} KB")
+        return (f"tree traversal: grid would need {self.grid_nbytes / 2**20:.1f} MB, "
+                f"over the cap")
+
+    def predict_proba(self, X):
+        X = self.forest.as_array(X)
+        if self.grid is not None:
+            return self.grid.predict_proba(X)
+        return self.forest._predict_proba(X)
+
+    def predict(self, X):
+        return self.predict_with_proba(X)[0]
+
+    def predict_with_proba(self, X):
+        proba = self.predict_proba(X)
+        return self.forest.classes_[np.argmax(proba, axis=1)], proba
+
+    def __getattr__(self, name):
+        return getattr(self.forest, name)
+
+
+def grid_thresholds(forest):
+    """Sorted unique split thresholds of every feature."""
+    is_split = ~forest.is_leaf
+    return [
+        np.unique(np.asarray(forest.threshold)[is_split & (forest.feature == feature)])
+        for feature in range(forest.n_features_in_)
+    ]
+
+
+def grid_cells(thresholds):
+    return int(np.prod([len(t) + 1 for t in thresholds], dtype=np.float64))
+
+
+def grid_nbytes(forest, thresholds=None):
+    """Memory the probability table of ``forest`` would need."""
+    if thresholds is None:
+        thresholds = grid_thresholds(forest)
+    return grid_cells(thresholds) * forest.n_classes_ * np.dtype(np.float64).itemsize
+
+
+def compile_forest(forest, max_bytes=DEFAULT_MAX_GRID_BYTES):
+    """Wrap ``forest`` in a CompiledForest (no-op if it already is one)."""
+    if isinstance(forest, CompiledForest):
+        return forest
+    if not isinstance(forest, FlatForest):
+        forest = FlatForest.from_estimator(forest)
+    return CompiledForest(forest, max_bytes=max_bytes)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from forest_engine import load_forest
+
+    forest = load_forest(sys.argv[1] if len(sys.argv) > 1 else None)
+    start = time.perf_counter()
+    compiled = compile_forest(forest)
+    print(f"Compiled in {(time.perf_counter() - start) * 1e3:.1f} ms: {compiled.describe()}")
+
+    rng = np.random.default_rng(0)
+    for n_rows, repeats in [(1, 2000), (100_000, 5)]:
+        X = rng.random((n_rows, forest.n_features_in_), dtype=np.float32)
+        assert np.array_equal(compiled.predict_proba(X), forest.predict_proba(X))
+        for name, scorer in [('trees', forest), (compiled.mode, compiled)]:
+            start = time.perf_counter()
+            for _ in range(repeats):
+                scorer.predict_with_proba(X)
+            elapsed = (time.perf_counter() - start) / repeats
+            print(f"{n_rows:>7} rows, {name:>5}: {elapsed * 1e3:.3f} ms per call")
@@ -0,0 +1,139 @@
+"""Import-time report and startup budget for the Streamlit app.
+
+Runs the top-level imports of a script (``app.py`` by default) in a fresh
+interpreter with ``python -X importtime``, sums the self time of every
+module per top-level package, and prints the most expensive packages.
+Exits with status 1 when the total import time exceeds the budget, so it
+can guard startup time in CI or before a deploy.
+
+Most of the app's import time is Streamlit, pandas and NumPy, which it
+cannot avoid and whose cost depends on the machine. The default budget is
+therefore measured, not fixed: the time to import ``BASELINE_MODULES`` in
+the same way, plus ``DEFAULT_OVERHEAD_MS`` for everything else the app
+imports. ``--budget-ms`` sets an absolute budget instead.
+
+Usage:
+    python import_budget.py [app.py] [--overhead-ms 150] [--budget-ms MS] [--repeat 3] [--top 15]
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+# Imports the app cannot do without; their time is the baseline
+BASELINE_MODULES = ('streamlit', 'pandas', 'numpy')
+
+# Import time allowed on top of the baseline, in milliseconds
+DEFAULT_OVERHEAD_MS = 150.0
+
+
+def top_level_imports(script):
+    """Source of the module-level import statements of ``script``."""
+    with open(script) as f:
+        source = f.read()
+    tree = ast.parse(source, filename=script)
+    return '\n'.join(
+        ast.get_source_segment(source, node)
+        for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+def parse_importtime(stderr):
+    """Parse ``-X importtime`` output into ``[(module, self_us, cumulative_us, depth)]``."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(script, python=sys.executable, code=None):
+    """Import the top-level imports of ``script`` (or run ``code``) once in a fresh interpreter."""
+    code = code or top_level_imports(script)
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', code],
+        cwd=os.path.dirname(os.path.abspath(script)),
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing the modules of {script} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def _fastest(runs):
+    rows = min(runs, key=lambda r: sum(self_us for _, self_us, _, _ in r))
+    return rows, sum(self_us for _, self_us, _, _ in rows) / 1e3
+
+
+def summarize(rows):
+    """Self time per top-level package in ms, most expensive first."""
+    packages = defaultdict(float)
+    for name, self_us, _, _ in rows:
+        packages[name.split('.')[0]] += self_us / 1e3
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def report(script, budget_ms=None, overhead_ms=DEFAULT_OVERHEAD_MS, repeat=3, top=15, log=print):
+    """Print the import report; return True when within budget.
+
+    The fastest of ``repeat`` runs is used so a cold disk cache does not
+    dominate the result. Without ``budget_ms`` the budget is the baseline
+    import time plus ``overhead_ms``; app and baseline runs alternate so
+    both see the same machine load.
+    """
+    runs, baseline_runs = [], []
+    baseline_code = 'import ' + ', '.join(BASELINE_MODULES)
+    for _ in range(max(1, repeat)):
+        runs.append(measure(script))
+        if budget_ms is None:
+            baseline_runs.append(measure(script, code=baseline_code))
+    rows, total_ms = _fastest(runs)
+    packages = summarize(rows)
+    if budget_ms is None:
+        baseline_ms = _fastest(baseline_runs)[1]
+        budget_ms = baseline_ms + overhead_ms
+        basis = f"{', '.join(BASELINE_MODULES)} {baseline_ms:.0f} ms + {overhead_ms:.0f} ms"
+    else:
+        basis = "fixed"
+
+    log(f"Import time of {os.path.basename(script)}: {total_ms:.0f} ms "
+        f"({len(rows)} modules, budget {budget_ms:.0f} ms: {basis})")
+    for name, ms in packages[:top]:
+        log(f"  {ms:8.1f} ms  {100 * ms / max(total_ms, 1e-9):5.1f}%  {name}")
+    if total_ms > budget_ms:
+        log(f"Over budget by {total_ms - budget_ms:.0f} ms")
+        return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the app's import time against a budget.")
+    parser.add_argument('script', nargs='?', default=DEFAULT_SCRIPT)
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="Absolute budget (default: baseline import time plus --overhead-ms)")
+    parser.add_argument('--overhead-ms', type=float, default=DEFAULT_OVERHEAD_MS,
+                        help="Time allowed beyond importing " + ', '.join(BASELINE_MODULES))
+    parser.add_argument('--repeat', type=int, default=3, help="Runs to take the fastest of")
+    parser.add_argument('--top', type=int, default=15, help="Packages to list")
+    args = parser.parse_args(argv)
+
+    try:
+        within = report(args.script, args.budget_ms, args.overhead_ms, args.repeat, args.top)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 2
+    return 0 if within else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""Random-forest proximity search through an inverted leaf index.
+
+Two customers are as similar as the number of trees that put them in the
+same leaf (the forest's proximity). Instead of a dense customers x
+customers matrix, the index stores for every leaf the customers that
+reach it, in compressed sparse row form. A query walks the forest once to
+get its leaf in every tree, gathers the posting lists of those leaves and
+counts how often each customer appears.
+
+Customers reaching exactly the same leaves in every tree (the same *leaf
+signature*) are interchangeable for any query, so posting lists hold
+signature codes rather than customers: the index is proportional to the
+number of distinct signatures times trees, and a second CSR maps each
+signature to its customers. Top-k queries pick the k best signatures with
+``argpartition`` and expand them. The index is a directory of ``.npy``
+files plus ``manifest.json``, memory-mapped on load, and records the
+model's content hash so it is never used with another model. Offsets and
+customer positions are int64, so posting lists of signatures x trees and
+member lists past 2**31 entries are fine; signature codes stay int32.
+
+Usage:
+    python leaf_index.py build customers.csv [--index leaf_index] [--model churn_model]
+    python leaf_index.py benchmark [--customers 1000000] [--trees 100] [--depth 10]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from neighbors import customer_ids, decode_ids, read_customers
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(__file__), 'leaf_index')
+
+DEFAULT_K = 10
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Posting entries per query below which counting sorts the gathered
+# signatures instead of allocating one counter per signature
+SPARSE_COUNT_RATIO = 8
+
+INDEX_ARRAYS = ['leaf_code', 'signatures', 'leaf_indptr', 'leaf_postings',
+                'member_indptr', 'members', 'ids', 'outcomes']
+
+
+def leaf_codes(forest):
+    """Dense code of every leaf node (-1 for split nodes)."""
+    is_leaf = forest.is_leaf
+    codes = np.full(forest.n_nodes, -1, dtype=np.int32)
+    codes[is_leaf] = np.arange(int(is_leaf.sum()), dtype=np.int32)
+    return codes
+
+
+def _signature_hash(rows, multipliers):
+    # 64-bit hash of each row of leaf codes; uint64 arithmetic wraps around
+    return (rows.astype(np.uint64) * multipliers).sum(axis=1, dtype=np.uint64)
+
+
+class SignatureTable:
+    """Distinct leaf signatures seen so far, fed one chunk of customers at a time."""
+
+    def __init__(self, n_trees):
+        self.multipliers = np.random.default_rng(0).integers(1, 2 ** 63, n_trees, dtype=np.uint64) | 1
+        self._hashes = pd.Index(np.empty(0, dtype=np.uint64))
+        self._rows = np.empty((1024, n_trees), dtype=np.int32)
+        self.n_signatures = 0
+
+    @property
+    def signatures(self):
+        return self._rows[:self.n_signatures]
+
+    def add(self, rows):
+        """Signature code of every row of leaf codes, adding unseen signatures."""
+        inverse, hashes = pd.factorize(_signature_hash(rows, self.multipliers))
+        known = self._hashes.get_indexer(hashes)
+        new = np.flatnonzero(known < 0)
+        if len(new):
+            first = np.full(len(hashes), len(rows), dtype=np.int64)
+            np.minimum.at(first, inverse, np.arange(len(rows)))
+            known[new] = np.arange(self.n_signatures, self.n_signatures + len(new))
+            size = self.n_signatures + len(new)
+            if size > len(self._rows):
+                grown = np.empty((max(size, 2 * len(self._rows)), self._rows.shape[1]), dtype=np.int32)
+                grown[:self.n_signatures] = self.signatures
+                self._rows = grown
+            self._rows[self.n_signatures:size] = rows[first[new]]
+            self._hashes = self._hashes.append(pd.Index(hashes[new]))
+            self.n_signatures = size
+            if size > np.iinfo(np.int32).max:
+                raise RuntimeError("More than 2**31 distinct leaf signatures; int32 codes overflow")
+        codes = known[inverse].astype(np.int32)
+        if not np.array_equal(self._rows[codes], rows):
+            raise RuntimeError("Leaf signature hash collision; rebuild with another hash seed")
+        return codes
+
+
+def csr(keys, n_keys):
+    """``(indptr, order)``: positions of ``order`` grouped by key, both int64."""
+    if n_keys <= np.iinfo(np.uint16).max:
+        # NumPy's stable sort is a radix sort for 16-bit keys
+        keys = keys.astype(np.uint16)
+    order = np.argsort(keys, kind='stable').astype(np.int64, copy=False)
+    indptr = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=indptr[1:])
+    return indptr, order
+
+
+class LeafIndex:
+    """Inverted leaf -> signature -> customer index for one forest."""
+
+    def __init__(self, arrays, manifest):
+        self.arrays = arrays
+        self.manifest = manifest
+        self.n_trees = manifest['n_trees']
+
+    def __getattr__(self, name):
+        arrays = self.__dict__.get('arrays', {})
+        if name in arrays:
+            return arrays[name]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.arrays['ids'])
+
+    @property
+    def n_signatures(self):
+        return len(self.arrays['signatures'])
+
+    @classmethod
+    def build(cls, forest, X, ids=None, outcomes=None, model_version=None,
+              chunk_size=DEFAULT_CHUNK_SIZE):
+        """Index customers ``X`` (engineered features) under ``forest``.
+
+        ``chunk_size`` rows are walked through the forest at a time.
+        """
+        from explain import model_forest, model_version as forest_version
+
+        forest = model_forest(forest)
+        codes = leaf_codes(forest)
+        n_leaves = int(codes.max()) + 1
+        table = SignatureTable(forest.n_trees)
+        n = len(X)
+        inverse = np.empty(n, dtype=np.int32)
+        # Walk the forest chunk by chunk; only distinct signatures are kept
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            inverse[start:stop] = table.add(codes[forest.apply(X[start:stop])])
+        signatures = table.signatures
+
+        # Leaf -> signatures that reach it, and signature -> its customers
+        leaf_indptr, order = csr(signatures.ravel(), n_leaves)
+        leaf_postings = (order // signatures.shape[1]).astype(np.int32)
+        member_indptr, members = csr(inverse, len(signatures))
+
+        arrays = {
+            'leaf_code': codes,
+            'signatures': signatures.astype(np.int32),
+            'leaf_indptr': leaf_indptr,
+            'leaf_postings': leaf_postings,
+            'member_indptr': member_indptr,
+            'members': members,
+            'ids': np.arange(n, dtype=np.int64) if ids is None else customer_ids(ids),
+            'outcomes': (np.full(n, np.nan, dtype=np.float32) if outcomes is None
+                         else np.asarray(outcomes, dtype=np.float32)),
+        }
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'model_version': model_version or forest_version(forest),
+            'n_trees': forest.n_trees,
+            'n_leaves': n_leaves,
+            'n_customers': n,
+            'n_signatures': len(signatures),
+        }
+        return cls(arrays, manifest)
+
+    def query(self, leaves, k=DEFAULT_K):
+        """Customers sharing the most leaves with a query customer.
+
+        Args:
+            leaves: The query's global leaf index in every tree (one row of
+                ``forest.apply()``).
+
+        Returns:
+            tuple: ``(ids, shared, outcomes)``, most shared trees first.
+        """
+        codes = self.leaf_code[np.asarray(leaves).ravel()]
+        indptr, postings = self.leaf_indptr, self.leaf_postings
+        gathered = np.concatenate([postings[indptr[c]:indptr[c + 1]] for c in codes])
+
+        # Shared trees per signature: sort the few gathered entries, or count densely
+        if len(gathered) * SPARSE_COUNT_RATIO < self.n_signatures:
+            candidates, shared = np.unique(gathered, return_counts=True)
+        else:
+            counts = np.bincount(gathered, minlength=self.n_signatures)
+            candidates = np.argpartition(-counts, k - 1)[:k] if len(counts) > k else np.arange(len(counts))
+            candidates = candidates[counts[candidates] > 0]
+            shared = counts[candidates]
+
+        # Every signature has at least one customer, so k signatures are enough
+        if len(candidates) > k:
+            top = np.argpartition(-shared, k - 1)[:k]
+            candidates, shared = candidates[top], shared[top]
+        order = np.lexsort((candidates, -shared))
+        candidates, shared = candidates[order], shared[order]
+
+        rows, counts = [], []
+        for signature, count in zip(candidates, shared):
+            members = self.members[self.member_indptr[signature]:self.member_indptr[signature + 1]]
+            members = members[:k - sum(len(r) for r in rows)]
+            rows.append(members)
+            counts.append(np.full(len(members), count))
+            if sum(len(r) for r in rows) >= k:
+                break
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        counts = np.concatenate(counts) if counts else np.empty(0, dtype=np.int64)
+        return decode_ids(self.ids[rows]), counts, self.outcomes[rows]
+
+    def proximity(self, leaves):
+        """Shared-tree fraction of every indexed customer with the query (dense)."""
+        codes = self.leaf_code[np.asarray(leaves).ravel()]
+        per_signature = (self.signatures == codes).sum(axis=1)
+        signature_of = np.empty(len(self), dtype=np.int64)
+        signature_of[self.members] = np.repeat(np.arange(self.n_signatures),
+                                               np.diff(self.member_indptr))
+        return per_signature[signature_of] / self.n_trees
+
+    def save(self, path=DEFAULT_INDEX_DIR):
+        """Write the index to ``path``, replacing any previous one atomically."""
+        path = os.path.abspath(path)
+        tmp_dir = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        digest = hashlib.sha256(self.manifest['model_version'].encode())
+        for name in INDEX_ARRAYS:
+            array = np.ascontiguousarray(self.arrays[name])
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+            digest.update(array.tobytes())
+        self.manifest['content_hash'] = digest.hexdigest()
+        self.manifest['built_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+        old_dir = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old_dir)
+        os.rename(tmp_dir, path)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_DIR, mmap=True):
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format {manifest.get('format_version')!r} in {path}")
+        arrays = {
+            name: np.asarray(np.load(os.path.join(path, f"{name}.npy"),
+                                     mmap_mode='r' if mmap else None, allow_pickle=False))
+            for name in INDEX_ARRAYS
+        }
+        return cls(arrays, manifest)
+
+
+def benchmark(n_customers=1_000_000, n_trees=100, depth=10, k=DEFAULT_K, queries=100, log=print):
+    """Time building and querying an index for a forest of realistic depth."""
+    from sklearn.ensemble import RandomForestClassifier
+
+    from forest_engine import FlatForest
+
+    rng = np.random.default_rng(0)
+    X = rng.random((n_customers, 3), dtype=np.float32)
+    y = (X[:, 0] + 0.5 * X[:, 1] ** 2 + 0.1 * rng.standard_normal(n_customers) > 0.8).astype(int)
+    fit_rows = min(n_customers, 50_000)
+    model = RandomForestClassifier(n_estimators=n_trees, max_depth=depth, random_state=0, n_jobs=-1)
+    forest = FlatForest.from_estimator(model.fit(X[:fit_rows], y[:fit_rows]))
+
+    start = time.perf_counter()
+    index = LeafIndex.build(forest, X, outcomes=y, model_version='benchmark')
+    log(f"Indexed {n_customers:,} customers x {n_trees} trees ({index.manifest['n_leaves']:,} leaves, "
+        f"{index.n_signatures:,} signatures) in {time.perf_counter() - start:.2f}s")
+
+    targets = forest.apply(rng.random((queries, 3), dtype=np.float32))
+    start = time.perf_counter()
+    results = [index.query(leaves, k) for leaves in targets]
+    query_ms = (time.perf_counter() - start) / queries * 1e3
+
+    start = time.perf_counter()
+    for leaves, (_, shared, _) in zip(targets[:10], results):
+        dense = np.sort(index.proximity(leaves))[::-1][:k] * n_trees
+        assert np.array_equal(np.sort(shared)[::-1], np.round(dense).astype(int))
+    dense_ms = (time.perf_counter() - start) / 10 * 1e3
+    log(f"Top-{k} query: {query_ms:.2f} ms (dense proximity row {dense_ms:.0f} ms)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the forest proximity (shared leaf) index.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="Index a customer file under the churn model")
+    build.add_argument('input', help="CSV or Parquet file with the app's customer columns")
+    build.add_argument('--index', default=DEFAULT_INDEX_DIR, help="Index directory")
+    build.add_argument('--model', default=None,
+                       help="Model artifact directory or pickle (default: the app's model)")
+    build.add_argument('--id-column', default='CustomerID')
+    build.add_argument('--churn-column', default='Churn', help="Observed churn label column")
+    build.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    bench = sub.add_parser('benchmark', help="Time queries for a forest fitted on random customers")
+    bench.add_argument('--customers', type=int, default=1_000_000)
+    bench.add_argument('--trees', type=int, default=100)
+    bench.add_argument('--depth', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'benchmark':
+            benchmark(args.customers, args.trees, args.depth)
+            return 0
+        from forest_engine import load_forest
+
+        start = time.perf_counter()
+        X, ids, outcomes = read_customers(args.input, args.chunk_size, args.id_column, args.churn_column)
+        index = LeafIndex.build(load_forest(args.model), X, ids, outcomes,
+                                chunk_size=args.chunk_size)
+        index.save(args.index)
+        print(f"Indexed {len(index)} customers ({index.n_signatures} distinct leaf signatures) "
+              f"in {time.perf_counter() - start:.2f}s: {args.index}")
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""Version-neutral, memory-mapped model artifact for the churn forest.
+
+A fitted forest is exported as a directory of raw ``.npy`` arrays plus a
+small ``manifest.json`` recording the feature schema, classes, the sklearn
+version the model was trained with and a content hash. Loading maps the
+arrays read-only with ``np.load(mmap_mode='r')``: no unpickling and no
+sklearn import, and every process that loads the artifact shares the same
+page-cached copy.
+
+Usage:
+    python model_artifact.py export [--model churn_model.pkl] [--out churn_model]
+    python model_artifact.py check [--model churn_model.pkl] [--artifact churn_model]
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+import warnings
+
+import numpy as np
+
+from forest_engine import FlatForest
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'churn_model.pkl')
+DEFAULT_ARTIFACT_DIR = os.path.join(os.path.dirname(__file__), 'churn_model')
+
+
+def is_artifact(path):
+    """Return True if ``path`` is an exported artifact directory."""
+    return os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+
+def read_pickled_model(path):
+    """Unpickle a model and return it with the sklearn version it was trained with."""
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+
+    trained_with = None
+    for warning in caught:
+        trained_with = getattr(warning.message, 'original_sklearn_version', None)
+        if trained_with:
+            break
+    if trained_with is None:
+        sklearn = sys.modules.get('sklearn')
+        trained_with = getattr(sklearn, '__version__', None)
+    return model, trained_with
+
+
+def content_hash(forest):
+    """SHA-256 over the forest arrays, classes and feature schema."""
+    digest = hashlib.sha256()
+    for name in FlatForest.ARRAYS:
+        array = np.ascontiguousarray(getattr(forest, name))
+        digest.update(f"{name}:{array.dtype.str}:{array.shape}".encode())
+        digest.update(memoryview(array).cast('B'))
+    digest.update(json.dumps({
+        'classes': forest.classes_.tolist(),
+        'feature_names': forest.feature_names,
+        'n_features': forest.n_features_in_,
+    }, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def export_artifact(model, out_dir=DEFAULT_ARTIFACT_DIR, sklearn_version=None, feature_names=None):
+    """Write ``model`` (a fitted forest or a FlatForest) as an artifact directory.
+
+    The artifact is assembled next to ``out_dir`` and moved into place at the
+    end, so readers never observe a half-written directory.
+
+    Returns:
+        dict: The manifest that was written.
+    """
+    if isinstance(model, FlatForest):
+        forest = model
+    else:
+        forest = FlatForest.from_estimator(model, feature_names=feature_names)
+
+    out_dir = os.path.abspath(out_dir)
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    arrays = {}
+    for name in FlatForest.ARRAYS:
+        array = np.ascontiguousarray(getattr(forest, name))
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        arrays[name] = {'file': f"{name}.npy", 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    importances = getattr(forest, 'feature_importances_', None)
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'model_type': 'RandomForestClassifier',
+        'feature_names': forest.feature_names,
+        'n_features': forest.n_features_in_,
+        'classes': forest.classes_.tolist(),
+        'n_trees': forest.n_trees,
+        'n_nodes': forest.n_nodes,
+        'max_depth': forest.max_depth,
+        'feature_importances': importances.tolist() if importances is not None else None,
+        'sklearn_version': sklearn_version,
+        'numpy_version': np.__version__,
+        'exported_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'content_hash': content_hash(forest),
+        'arrays': arrays,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    old_dir = f"{out_dir}.old-{os.getpid()}"
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(path=DEFAULT_ARTIFACT_DIR):
+    """Read and validate an artifact manifest."""
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported artifact format {manifest.get('format_version')!r} in {path}"
+        )
+    return manifest
+
+
+def load_artifact(path=DEFAULT_ARTIFACT_DIR, mmap=True, verify=False):
+    """Load an exported artifact as a FlatForest.
+
+    Args:
+        path: Artifact directory.
+        mmap: Map the arrays read-only instead of reading them into memory.
+        verify: Recompute the content hash and compare it with the manifest.
+
+    Returns:
+        FlatForest: The forest, with the manifest attached as ``.manifest``.
+    """
+    manifest = read_manifest(path)
+    arrays = {}
+    for name in FlatForest.ARRAYS:
+        spec = manifest['arrays'][name]
+        array = np.load(os.path.join(path, spec['file']), mmap_mode='r' if mmap else None,
+                        allow_pickle=False)
+        if array.dtype.str != spec['dtype'] or list(array.shape) != spec['shape']:
+            raise ValueError(f"Array '{name}' in {path} does not match the manifest")
+        # A plain ndarray view keeps the mapping but drops the memmap subclass
+        arrays[name] = np.asarray(array)
+
+    forest = FlatForest(
+        classes=manifest['classes'],
+        feature_names=manifest['feature_names'],
+        n_features=manifest['n_features'],
+        feature_importances=manifest.get('feature_importances'),
+        manifest=manifest,
+        **arrays,
+    )
+    if verify and content_hash(forest) != manifest['content_hash']:
+        raise ValueError(f"Content hash mismatch for artifact {path}")
+    return forest
+
+
+def reference_predict_proba(model, X):
+    """sklearn probabilities with per-tree normalization, independent of sklearn version."""
+    proba = np.zeros((len(X), len(model.classes_)))
+    for estimator in model.estimators_:
+        tree_proba = estimator.predict_proba(X)
+        normalizer = tree_proba.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        proba += tree_proba / normalizer
+    return proba / len(model.estimators_)
+
+
+def check_parity(model, forest, n_samples=10000, seed=0):
+    """Compare the artifact with the original model on random inputs.
+
+    Inputs are drawn uniformly around the range of the split thresholds, and
+    the thresholds themselves are included so ties are exercised.
+
+    Returns:
+        dict: ``max_abs_diff``, ``label_mismatches`` and ``n_samples``.
+    """
+    rng = np.random.default_rng(seed)
+    is_split = ~forest.is_leaf
+    columns = []
+    for feature in range(forest.n_features_in_):
+        thresholds = np.asarray(forest.threshold[is_split & (forest.feature == feature)])
+        low, high = (thresholds.min(), thresholds.max()) if len(thresholds) else (0.0, 1.0)
+        margin = max(high - low, 1.0) * 0.25
+        column = rng.uniform(low - margin, high + margin, n_samples)
+        if len(thresholds):
+            column[:len(thresholds)] = thresholds[:n_samples]
+        columns.append(rng.permutation(column))
+    X = np.column_stack(columns).astype(np.float32)
+
+    expected = reference_predict_proba(model, X)
+    labels, proba = forest.predict_with_proba(X)
+    expected_labels = model.classes_[np.argmax(expected, axis=1)]
+    return {
+        'n_samples': n_samples,
+        'max_abs_diff': float(np.abs(proba - expected).max()),
+        'label_mismatches': int((labels != expected_labels).sum()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or verify the churn model artifact.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export = subparsers.add_parser('export', help="Export a pickled forest as an artifact")
+    export.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    export.add_argument('--out', default=DEFAULT_ARTIFACT_DIR)
+
+    check = subparsers.add_parser('check', help="Check an artifact against the pickled model")
+    check.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    check.add_argument('--artifact', default=DEFAULT_ARTIFACT_DIR)
+    check.add_argument('--samples', type=int, default=10000)
+    check.add_argument('--seed', type=int, default=0)
+    check.add_argument('--tolerance', type=float, default=1e-12)
+
+    args = parser.parse_args(argv)
+    model, trained_with = read_pickled_model(args.model)
+
+    if args.command == 'export':
+        manifest = export_artifact(model, args.out, sklearn_version=trained_with)
+        print(f"Exported {manifest['n_trees']} trees ({manifest['n_nodes']} nodes) to {args.out}")
+        print(f"Content hash: {manifest['content_hash']}")
+        return 0
+
+    start = time.perf_counter()
+    forest = load_artifact(args.artifact, verify=True)
+    load_ms = (time.perf_counter() - start) * 1e3
+    result = check_parity(model, forest, n_samples=args.samples, seed=args.seed)
+    print(f"Loaded artifact in {load_ms:.2f} ms")
+    print(f"Max |proba difference|: {result['max_abs_diff']:.3g} over {result['n_samples']} rows")
+    print(f"Label mismatches: {result['label_mismatches']}")
+    ok = result['max_abs_diff'] <= args.tolerance and result['label_mismatches'] == 0
+    print("Parity check passed" if ok else "Parity check FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
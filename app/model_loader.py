@@ -3,6 +3,8 @@ import pickle
 import numpy as np
 from sklearn.tree import DecisionTreeClassifier
 
+from model_artifact import DEFAULT_ARTIFACT_DIR, is_artifact, load_artifact
+
 class SafeModel:
     def __init__(self, model):
         self.model = model
@@ -48,6 +50,10 @@ def load_model_safely():
     
     warnings.filterwarnings("ignore", category=InconsistentVersionWarning)
     
+    # The exported artifact needs neither unpickling nor a matching sklearn
+    if is_artifact(DEFAULT_ARTIFACT_DIR):
+        return SafeModel(load_artifact(DEFAULT_ARTIFACT_DIR))
+    
     model_path = os.path.join(os.path.dirname(__file__), 'churn_model.pkl')
     
     try:
@@ -0,0 +1,211 @@
+"""Process-wide model registry with hot reload.
+
+Streamlit re-executes the app script on every interaction and for every
+session, but imported modules live for the whole server process. Keeping the
+registry here means each model version is loaded once and shared by all
+sessions. The registry watches the model file (or the manifest of an
+exported artifact) and swaps in a new version when its content changes,
+without restarting the server.
+"""
+import gc
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import sys
+import threading
+import time
+import types
+import warnings
+
+import numpy as np
+
+# Seconds between stat() calls on a model path
+DEFAULT_CHECK_INTERVAL = 2.0
+
+# Number of previously loaded versions kept in the stats history
+HISTORY_SIZE = 10
+
+
+class ModelVersion:
+    """A loaded model together with its load statistics."""
+
+    def __init__(self, model, path, version, signature, load_seconds):
+        self.model = model
+        self.path = path
+        self.version = version
+        self.signature = signature
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.checked_at = time.monotonic()
+        self.resident_bytes, self.mapped_bytes = measure_size(model)
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'version': self.version,
+            'load_ms': self.load_seconds * 1e3,
+            'resident_bytes': self.resident_bytes,
+            'mapped_bytes': self.mapped_bytes,
+            'loaded_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.loaded_at)),
+        }
+
+
+class ModelRegistry:
+    """Loads each model version once and hot-swaps it when the file changes."""
+
+    def __init__(self, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._current = {}
+        self._history = {}
+        self._errors = {}
+
+    def get(self, path, loader=None):
+        """Return the current model for ``path``, reloading it if its content changed.
+
+        Args:
+            path: Model file or exported artifact directory.
+            loader: Callable taking the path and returning the model. Defaults
+                to unpickling the file.
+        """
+        key = os.path.abspath(path)
+        entry = self._current.get(key)
+        if entry is not None and time.monotonic() - entry.checked_at < self.check_interval:
+            return entry.model
+
+        with self._lock:
+            entry = self._current.get(key)
+            if entry is not None and time.monotonic() - entry.checked_at < self.check_interval:
+                return entry.model
+
+            signature = file_signature(key)
+            if entry is not None and signature == entry.signature:
+                entry.checked_at = time.monotonic()
+                return entry.model
+
+            version = content_version(key)
+            if entry is not None and version == entry.version:
+                entry.signature = signature
+                entry.checked_at = time.monotonic()
+                return entry.model
+
+            start = time.perf_counter()
+            try:
+                model = (loader or load_pickle)(key)
+                if model is None:
+                    raise RuntimeError(f"Loader returned no model for {key}")
+            except Exception as e:
+                self._errors[key] = str(e)
+                if entry is None:
+                    raise
+                # Keep serving the previous version until the new one loads
+                entry.checked_at = time.monotonic()
+                return entry.model
+
+            new_entry = ModelVersion(model, key, version, signature, time.perf_counter() - start)
+            self._current[key] = new_entry
+            self._errors.pop(key, None)
+            history = self._history.setdefault(key, [])
+            history.append(new_entry.stats())
+            del history[:-HISTORY_SIZE]
+            return new_entry.model
+
+    def current(self, path):
+        """Return the active ModelVersion for ``path``, or None if not loaded."""
+        return self._current.get(os.path.abspath(path))
+
+    def stats(self):
+        """Load time and size of every version loaded so far, per path."""
+        report = {}
+        for key, history in self._history.items():
+            active = self._current.get(key)
+            report[key] = {
+                'active_version': active.version if active else None,
+                'last_error': self._errors.get(key),
+                'versions': list(history),
+            }
+        return report
+
+    def clear(self):
+        with self._lock:
+            self._current.clear()
+            self._history.clear()
+            self._errors.clear()
+
+
+def file_signature(path):
+    """Cheap change detector: size and mtime of the file (or artifact manifest)."""
+    target = os.path.join(path, 'manifest.json') if os.path.isdir(path) else path
+    stat = os.stat(target)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def content_version(path):
+    """Content hash identifying a model version."""
+    if os.path.isdir(path):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            return json.load(f)['content_hash']
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_pickle(path):
+    """Default loader: unpickle a model file."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def measure_size(model):
+    """Return ``(resident_bytes, mapped_bytes)`` reachable from ``model``.
+
+    Arrays backed by a memory-mapped file are counted separately since their
+    pages live in the shared page cache rather than in this process's heap.
+    """
+    resident = mapped = 0
+    seen = set()
+    stack = [model]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, np.ndarray):
+            base = obj
+            while isinstance(base, np.ndarray) and base.base is not None:
+                base = base.base
+            if isinstance(base, mmap.mmap):
+                if id(base) not in seen:
+                    seen.add(id(base))
+                    mapped += len(base)
+                continue
+            if obj.base is None:
+                resident += obj.nbytes
+            resident += sys.getsizeof(obj) - (obj.nbytes if obj.flags.owndata else 0)
+            stack.append(obj.base)
+            continue
+        resident += sys.getsizeof(obj)
+        if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+            continue
+        stack.extend(gc.get_referents(obj))
+    return resident, mapped
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the registry shared by every session in this process."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
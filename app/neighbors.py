@@ -0,0 +1,481 @@
+"""Similar-customer lookup over historical customers.
+
+Historical customers' engineered features are indexed in a KD-tree laid
+out as flat arrays: points are reordered so every node covers a contiguous
+range, nodes are numbered heap-style (children of ``i`` are ``2i+1`` and
+``2i+2``) and each node stores its split and bounding box. The index is a
+directory of ``.npy`` files plus ``manifest.json``, like the model
+artifact, and is loaded with ``np.load(mmap_mode='r')``: opening an index
+of millions of customers costs nothing, and a query only touches the
+leaves it visits.
+
+Customers appended after the build go to a small delta buffer that is
+searched by brute force next to the tree. A customer appended again
+replaces their earlier row: tree rows whose ID reappears in the delta, and
+all but the last delta row of an ID, are skipped by queries. Once the
+buffer outgrows a fraction of the tree, the next append rebuilds the tree
+over both.
+
+Customer IDs are stored as int64 when they are integers and as UTF-8
+bytes otherwise, so either kind can be memory-mapped without pickling.
+
+Usage:
+    python neighbors.py build customers.csv [--index neighbors_index] [--churn-column Churn]
+    python neighbors.py append new_customers.csv [--index neighbors_index]
+    python neighbors.py benchmark [--customers 1000000]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from features import FEATURE_NAMES, engineer_features
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(__file__), 'neighbors_index')
+
+# Points per leaf; leaves are scanned with one vectorized distance computation
+LEAF_SIZE = 64
+
+DEFAULT_K = 5
+DEFAULT_CHUNK_SIZE = 100_000
+
+# The tree is rebuilt when the delta buffer exceeds this fraction of it
+# (and at least MIN_REBUILD_ROWS rows)
+REBUILD_FRACTION = 0.1
+MIN_REBUILD_ROWS = 10_000
+
+TREE_ARRAYS = ['points', 'ids', 'outcomes', 'split_dim', 'split_value', 'box_min', 'box_max']
+DELTA_ARRAYS = ['points', 'ids', 'outcomes']
+
+
+def build_tree(points, leaf_size=LEAF_SIZE):
+    """Build the flat KD-tree arrays over ``points``.
+
+    Returns:
+        tuple: ``(order, arrays)`` where ``order`` is the permutation applied
+        to the points and ``arrays`` holds the reordered points and the node
+        arrays.
+    """
+    points = np.array(points, dtype=np.float32)
+    n, d = points.shape
+    depth = int(np.ceil(np.log2(max(n / leaf_size, 1))))
+    n_nodes = 2 ** (depth + 1) - 1
+    order = np.arange(n, dtype=np.int64)
+    split_dim = np.zeros(n_nodes, dtype=np.int8)
+    split_value = np.zeros(n_nodes, dtype=np.float32)
+    box_min = np.full((n_nodes, d), np.inf, dtype=np.float32)
+    box_max = np.full((n_nodes, d), -np.inf, dtype=np.float32)
+
+    stack = [(0, 0, n)]
+    while stack:
+        node, lo, hi = stack.pop()
+        if hi > lo:
+            box_min[node] = points[lo:hi].min(axis=0)
+            box_max[node] = points[lo:hi].max(axis=0)
+        if 2 * node + 1 >= n_nodes:
+            continue
+        # Split the widest dimension at the median
+        dim = int(np.argmax(box_max[node] - box_min[node])) if hi > lo else 0
+        mid = (lo + hi) // 2
+        if hi - lo > 1:
+            part = np.argpartition(points[lo:hi, dim], mid - lo)
+            points[lo:hi] = points[lo:hi][part]
+            order[lo:hi] = order[lo:hi][part]
+        split_dim[node] = dim
+        split_value[node] = points[mid, dim] if mid < hi else np.inf
+        stack.append((2 * node + 1, lo, mid))
+        stack.append((2 * node + 2, mid, hi))
+    return order, {
+        'points': points,
+        'split_dim': split_dim,
+        'split_value': split_value,
+        'box_min': box_min,
+        'box_max': box_max,
+    }
+
+
+def leaf_ranges(n_points, n_nodes):
+    """``(start, stop)`` of every node's points, for a tree over ``n_points``."""
+    start = np.zeros(n_nodes, dtype=np.int64)
+    stop = np.zeros(n_nodes, dtype=np.int64)
+    stop[0] = n_points
+    # One level at a time: parents first..last split their ranges at the midpoint
+    first, last = 0, 1
+    while 2 * first + 1 < n_nodes:
+        mid = (start[first:last] + stop[first:last]) // 2
+        start[2 * first + 1:2 * last + 1:2], stop[2 * first + 1:2 * last + 1:2] = start[first:last], mid
+        start[2 * first + 2:2 * last + 2:2], stop[2 * first + 2:2 * last + 2:2] = mid, stop[first:last]
+        first, last = 2 * first + 1, 2 * last + 1
+    return start, stop
+
+
+def customer_ids(values):
+    """Customer IDs as int64 when they are integers, else as UTF-8 bytes."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iub':
+        return values.astype(np.int64)
+    if values.dtype.kind == 'f' and np.isfinite(values).all() and (values == np.round(values)).all():
+        return values.astype(np.int64)
+    if values.dtype.kind == 'S':
+        return values
+    return np.char.encode(values.astype(str), 'utf-8')
+
+
+def unify_ids(*arrays):
+    """The ID arrays in one representation: int64 if all are, else bytes."""
+    if all(array.dtype.kind == 'i' for array in arrays):
+        return arrays
+    return tuple(array if array.dtype.kind == 'S' else array.astype('S') for array in arrays)
+
+
+def decode_ids(ids):
+    """IDs as returned to callers: integers, or text for byte-string IDs."""
+    return np.char.decode(ids, 'utf-8') if ids.dtype.kind == 'S' else ids
+
+
+def _content_hash(*arrays):
+    digest = hashlib.sha256()
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def _save_array(path, array):
+    # Write-then-rename so a reader never maps a half-written file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+class NeighborIndex:
+    """KD-tree over historical customers plus a brute-force delta buffer."""
+
+    def __init__(self, tree, delta=None, feature_names=FEATURE_NAMES, path=None, manifest=None):
+        self.tree = tree
+        self.feature_names = list(feature_names)
+        self.path = path
+        self.manifest = manifest or {}
+        self.n_nodes = len(tree['split_dim'])
+        self._start, self._stop = leaf_ranges(len(tree['points']), self.n_nodes)
+        self._first_leaf = (self.n_nodes - 1) // 2
+        empty = {
+            'points': np.empty((0, len(self.feature_names)), dtype=np.float32),
+            'ids': np.empty(0, dtype=np.int64),
+            'outcomes': np.empty(0, dtype=np.float32),
+        }
+        self.delta = delta or empty
+        self._index_delta()
+
+    def _index_delta(self):
+        # Rows of the delta still current (the last one of every ID), and
+        # the sorted distinct delta IDs that supersede tree rows
+        ids = self.delta['ids']
+        distinct, last = np.unique(ids[::-1], return_index=True)
+        self._delta_live = np.sort(len(ids) - 1 - last)
+        self._delta_ids = distinct
+
+    def _superseded(self, ids):
+        """Mask of tree IDs that were appended again to the delta."""
+        if not len(self._delta_ids) or not len(ids):
+            return np.zeros(len(ids), dtype=bool)
+        ids, delta_ids = unify_ids(ids, self._delta_ids)
+        position = np.minimum(np.searchsorted(delta_ids, ids), len(delta_ids) - 1)
+        return delta_ids[position] == ids
+
+    @classmethod
+    def build(cls, points, ids, outcomes, feature_names=FEATURE_NAMES, leaf_size=LEAF_SIZE):
+        order, tree = build_tree(points, leaf_size)
+        tree['ids'] = customer_ids(ids)[order]
+        tree['outcomes'] = np.asarray(outcomes, dtype=np.float32)[order]
+        return cls(tree, feature_names=feature_names)
+
+    @property
+    def n_tree(self):
+        return len(self.tree['points'])
+
+    @property
+    def n_delta(self):
+        return len(self.delta['points'])
+
+    def __len__(self):
+        return self.n_tree + self.n_delta
+
+    def query(self, x, k=DEFAULT_K):
+        """The ``k`` customers nearest to ``x``.
+
+        Returns:
+            tuple: ``(distances, ids, outcomes)`` arrays, nearest first.
+        """
+        x = np.asarray(x, dtype=np.float32).ravel()
+        # Ask the tree for more neighbours while superseded rows crowd out
+        # the k nearest current ones
+        k_tree = k
+        while True:
+            distances, rows = self._search_tree(x, k_tree)
+            found = rows >= 0
+            distances, rows = distances[found], rows[found]
+            ids = self.tree['ids'][rows]
+            current = ~self._superseded(ids)
+            if current.sum() >= k or k_tree >= self.n_tree:
+                break
+            k_tree = min(2 * k_tree, self.n_tree)
+        distances, ids = distances[current], ids[current]
+        outcomes = self.tree['outcomes'][rows[current]]
+
+        if self.n_delta:
+            live = self._delta_live
+            diff = self.delta['points'][live] - x
+            delta_d = np.einsum('ij,ij->i', diff, diff)
+            distances = np.concatenate([distances, delta_d])
+            ids = np.concatenate(unify_ids(ids, self.delta['ids'][live]))
+            outcomes = np.concatenate([outcomes, self.delta['outcomes'][live]])
+        order = np.argsort(distances, kind='stable')[:k]
+        order = order[np.isfinite(distances[order])]
+        return np.sqrt(distances[order]), decode_ids(ids[order]), outcomes[order]
+
+    def _search_tree(self, x, k):
+        """Squared distances and tree rows of the ``k`` nearest tree points (-1 pads)."""
+        points, box_min, box_max = self.tree['points'], self.tree['box_min'], self.tree['box_max']
+        split_dim, split_value = self.tree['split_dim'], self.tree['split_value']
+        best_d = np.full(k, np.inf, dtype=np.float32)
+        best_i = np.full(k, -1, dtype=np.int64)
+        worst = np.inf
+
+        stack = [(0.0, 0)] if self.n_tree else []
+        while stack:
+            bound, node = stack.pop()
+            if bound > worst:
+                continue
+            if node >= self._first_leaf:
+                start, stop = self._start[node], self._stop[node]
+                if stop == start:
+                    continue
+                diff = points[start:stop] - x
+                distances = np.einsum('ij,ij->i', diff, diff)
+                candidates_d = np.concatenate([best_d, distances])
+                candidates_i = np.concatenate([best_i, np.arange(start, stop)])
+                keep = np.argpartition(candidates_d, k - 1)[:k] if len(candidates_d) > k else slice(None)
+                best_d, best_i = candidates_d[keep], candidates_i[keep]
+                worst = float(best_d.max())
+                continue
+            dim = split_dim[node]
+            near, far = (2 * node + 1, 2 * node + 2) if x[dim] <= split_value[node] else \
+                (2 * node + 2, 2 * node + 1)
+            # Squared distance from x to the far child's bounding box
+            gap = np.maximum(box_min[far] - x, 0) + np.maximum(x - box_max[far], 0)
+            far_bound = float(gap @ gap)
+            if far_bound <= worst:
+                stack.append((far_bound, far))
+            stack.append((bound, near))
+        return best_d, best_i
+
+    def append(self, points, ids, outcomes):
+        """Add customers to the delta buffer, rebuilding the tree once it grows too large.
+
+        Returns:
+            bool: True if the tree was rebuilt.
+        """
+        points = np.asarray(points, dtype=np.float32).reshape(-1, len(self.feature_names))
+        self.delta = {
+            'points': np.concatenate([self.delta['points'], points]),
+            'ids': np.concatenate(unify_ids(self.delta['ids'], customer_ids(ids))),
+            'outcomes': np.concatenate([self.delta['outcomes'], np.asarray(outcomes, dtype=np.float32)]),
+        }
+        self._index_delta()
+        if self.n_delta >= max(MIN_REBUILD_ROWS, REBUILD_FRACTION * self.n_tree):
+            self.rebuild()
+            return True
+        return False
+
+    def rebuild(self):
+        """Rebuild the tree over the tree and delta customers.
+
+        A customer appended again replaces their earlier row.
+        """
+        ids = np.concatenate(unify_ids(np.asarray(self.tree['ids']), self.delta['ids']))
+        # Last occurrence of every ID, in the original order
+        _, last = np.unique(ids[::-1], return_index=True)
+        keep = np.sort(len(ids) - 1 - last)
+        merged = NeighborIndex.build(
+            np.concatenate([self.tree['points'], self.delta['points']])[keep],
+            ids[keep],
+            np.concatenate([self.tree['outcomes'], self.delta['outcomes']])[keep],
+            self.feature_names,
+            self.manifest.get('leaf_size', LEAF_SIZE),
+        )
+        self.__init__(merged.tree, feature_names=self.feature_names, path=self.path,
+                      manifest={'leaf_size': self.manifest.get('leaf_size', LEAF_SIZE)})
+
+    def save(self, path=DEFAULT_INDEX_DIR):
+        """Write the whole index to ``path``, replacing any previous one atomically."""
+        path = os.path.abspath(path)
+        tmp_dir = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in TREE_ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(self.tree[name]))
+        for name in DELTA_ARRAYS:
+            np.save(os.path.join(tmp_dir, f"delta_{name}.npy"), self.delta[name])
+        tree_hash = _content_hash(self.tree['ids'], self.tree['points'])
+        self.manifest = {
+            'format_version': FORMAT_VERSION,
+            'feature_names': self.feature_names,
+            'n_tree': self.n_tree,
+            'n_delta': self.n_delta,
+            'n_nodes': self.n_nodes,
+            'leaf_size': self.manifest.get('leaf_size', LEAF_SIZE),
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'tree_hash': tree_hash,
+            'content_hash': _content_hash(np.frombuffer(tree_hash.encode(), np.uint8),
+                                          self.delta['ids'], self.delta['points']),
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+        old_dir = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old_dir)
+        os.rename(tmp_dir, path)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        self.path = path
+
+    def save_delta(self):
+        """Persist only the delta buffer; the tree files are left untouched."""
+        for name in DELTA_ARRAYS:
+            _save_array(os.path.join(self.path, f"delta_{name}.npy"), self.delta[name])
+        self.manifest['n_delta'] = self.n_delta
+        self.manifest['content_hash'] = _content_hash(
+            np.frombuffer(self.manifest['tree_hash'].encode(), np.uint8),
+            self.delta['ids'], self.delta['points'],
+        )
+        tmp = os.path.join(self.path, f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, os.path.join(self.path, MANIFEST_NAME))
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_DIR, mmap=True):
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format {manifest.get('format_version')!r} in {path}")
+        tree = {
+            name: np.asarray(np.load(os.path.join(path, f"{name}.npy"),
+                                     mmap_mode='r' if mmap else None, allow_pickle=False))
+            for name in TREE_ARRAYS
+        }
+        # The delta is small: read it, and only the rows the manifest vouches for
+        delta = {
+            name: np.load(os.path.join(path, f"delta_{name}.npy"), allow_pickle=False)[:manifest['n_delta']]
+            for name in DELTA_ARRAYS
+        }
+        return cls(tree, delta, manifest['feature_names'], os.path.abspath(path), manifest)
+
+
+def read_customers(input_path, chunk_size=DEFAULT_CHUNK_SIZE, id_column='CustomerID',
+                   churn_column='Churn'):
+    """Engineered features, IDs and observed churn of every customer of a file."""
+    from score_customers import iter_chunks
+    from segmentation import churn_labels
+
+    points, ids, outcomes = [], [], []
+    rows = 0
+    for chunk in iter_chunks(input_path, chunk_size, id_column=id_column, extra_columns=[churn_column]):
+        points.append(engineer_features(chunk))
+        if id_column in chunk.columns:
+            ids.append(customer_ids(chunk[id_column].to_numpy()))
+        else:
+            ids.append(np.arange(rows, rows + len(chunk), dtype=np.int64))
+        if churn_column in chunk.columns:
+            outcomes.append(churn_labels(chunk[churn_column]).astype(np.float32))
+        else:
+            outcomes.append(np.full(len(chunk), np.nan, dtype=np.float32))
+        rows += len(chunk)
+    if not rows:
+        raise RuntimeError(f"No customers found in {input_path}")
+    # Chunks may disagree on whether the IDs look numeric
+    return np.concatenate(points), np.concatenate(unify_ids(*ids)), np.concatenate(outcomes)
+
+
+def benchmark(n_customers=1_000_000, k=DEFAULT_K, queries=200, log=print):
+    """Time building, loading and querying an index of random customers."""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    points = rng.random((n_customers, len(FEATURE_NAMES)), dtype=np.float32)
+    start = time.perf_counter()
+    index = NeighborIndex.build(points, np.arange(n_customers), rng.random(n_customers) < 0.2)
+    log(f"Built index over {n_customers:,} customers in {time.perf_counter() - start:.2f}s")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'index')
+        index.save(path)
+        start = time.perf_counter()
+        index = NeighborIndex.load(path)
+        log(f"Loaded (memory-mapped) in {(time.perf_counter() - start) * 1e3:.1f} ms")
+        index.append(rng.random((1000, len(FEATURE_NAMES)), dtype=np.float32),
+                     np.arange(n_customers, n_customers + 1000), np.zeros(1000))
+        all_points = np.concatenate([points, index.delta['points']])
+
+        targets = rng.random((queries, len(FEATURE_NAMES)), dtype=np.float32)
+        start = time.perf_counter()
+        results = [index.query(x, k) for x in targets]
+        tree_ms = (time.perf_counter() - start) / queries * 1e3
+        start = time.perf_counter()
+        for x, (distances, _, _) in zip(targets[:20], results):
+            diff = all_points - x
+            brute = np.sort(np.einsum('ij,ij->i', diff, diff))[:k]
+            assert np.allclose(np.sqrt(brute), distances, atol=1e-6)
+        brute_ms = (time.perf_counter() - start) / 20 * 1e3
+    log(f"{k}-NN query: {tree_ms:.2f} ms (brute force {brute_ms:.0f} ms)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and update the similar-customer index.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="Build the index from a customer file")
+    append = sub.add_parser('append', help="Append customers to an existing index")
+    for command in (build, append):
+        command.add_argument('input', help="CSV or Parquet file with the app's customer columns")
+        command.add_argument('--index', default=DEFAULT_INDEX_DIR, help="Index directory")
+        command.add_argument('--id-column', default='CustomerID')
+        command.add_argument('--churn-column', default='Churn', help="Observed churn label column")
+        command.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    bench = sub.add_parser('benchmark', help="Time queries on an index of random customers")
+    bench.add_argument('--customers', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'benchmark':
+            benchmark(args.customers)
+            return 0
+        start = time.perf_counter()
+        points, ids, outcomes = read_customers(args.input, args.chunk_size, args.id_column,
+                                               args.churn_column)
+        if args.command == 'build':
+            index = NeighborIndex.build(points, ids, outcomes)
+            index.save(args.index)
+            print(f"Indexed {len(index)} customers in {time.perf_counter() - start:.2f}s: {args.index}")
+        else:
+            index = NeighborIndex.load(args.index)
+            if index.append(points, ids, outcomes):
+                index.save(args.index)
+                print(f"Rebuilt the index over {len(index)} customers")
+            else:
+                index.save_delta()
+                print(f"Appended {len(ids)} customers ({index.n_delta} in the delta buffer)")
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,516 @@
+"""Out-of-core, partitioned batch scoring for very large customer extracts.
+
+``score_customers.py`` streams one file through one process. This engine
+splits the input into independent partitions and scores them on a process
+pool, so a nightly extract of any size runs on every core with bounded
+memory and can be resumed partition by partition:
+
+- CSV inputs are cut into byte ranges of about ``--partition-mb``, each
+  boundary moved forward to the next line start (fields must not contain
+  embedded newlines). Parquet inputs are partitioned by row group.
+- Each worker parses its range in chunks with pyarrow's typed,
+  column-selective CSV reader: only the model's input columns, the ID and
+  ``MonthlyCharges`` are converted. Input columns parse as numbers; a
+  chunk with unparsable values falls back to text, which ``score_columns()``
+  coerces to the feature defaults. IDs stay text, so every partition has
+  the same schema.
+- The chunk size is derived from ``--memory-cap-mb``, the working memory
+  allowed per worker, and the average line length of the file.
+- Every chunk goes through ``score_columns()`` (the app's vectorized
+  feature math and the compiled churn model), and each partition is
+  written to its own Parquet file under a temporary name, then renamed, so
+  a partition file is either complete or absent.
+- ``manifest.json`` in the output directory records the input
+  fingerprint, the model's content hash and every partition's state; it
+  is rewritten atomically as partitions finish. ``--resume`` re-runs only
+  the partitions that are not done.
+
+Usage:
+    python partitioned_scorer.py customers.csv scores_dir [--workers 4] [--memory-cap-mb 512]
+        [--partition-mb 128] [--resume]
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from score_customers import INPUT_COLUMNS, input_fingerprint, score_columns
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+DEFAULT_PARTITION_BYTES = 128 * 1024 * 1024
+
+# Working memory per worker, beyond the interpreter and the model
+DEFAULT_MEMORY_CAP_BYTES = 512 * 1024 * 1024
+
+# Copies of a chunk's raw text alive while it is parsed (the bytes read
+# plus pyarrow's parse buffers), and bytes per parsed value across the
+# Arrow column, its NumPy view and the float64 feature inputs
+RAW_COPIES = 3
+BYTES_PER_VALUE = 24
+
+# Engineered features, probabilities, labels, CLV and output buffers per row
+BYTES_PER_ROW_OUTPUT = 160
+
+MIN_CHUNK_ROWS = 1_000
+
+# Bytes of the file sampled to estimate the average line length
+SAMPLE_BYTES = 1024 * 1024
+
+# Flag values accepted in the Complain column
+TRUE_VALUES = ['Yes', 'yes', 'YES', 'True', 'true', 'TRUE', '1', '1.0']
+FALSE_VALUES = ['No', 'no', 'NO', 'False', 'false', 'FALSE', '0', '0.0']
+
+_worker = {}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise RuntimeError("Partitioned scoring needs pyarrow: `pip install pyarrow`")
+
+
+def is_parquet(path):
+    return path.lower().endswith(('.parquet', '.pq'))
+
+
+def chunk_rows_for_memory(memory_cap, bytes_per_row, n_columns):
+    """Rows per chunk that keep a worker's working memory under ``memory_cap``."""
+    per_row = RAW_COPIES * bytes_per_row + BYTES_PER_VALUE * n_columns + BYTES_PER_ROW_OUTPUT
+    return max(MIN_CHUNK_ROWS, int(memory_cap // per_row))
+
+
+def read_header(path):
+    """Column names of a CSV file and the byte offset where its data starts."""
+    with open(path, 'rb') as f:
+        line = f.readline()
+        names = next(csv.reader([line.decode('utf-8-sig')]))
+        return [name.strip() for name in names], f.tell()
+
+
+def plan_csv_partitions(path, partition_bytes=DEFAULT_PARTITION_BYTES):
+    """Split a CSV file into byte ranges that start and end on line boundaries.
+
+    Returns:
+        list: ``(start, stop)`` byte offsets, covering every data line once.
+    """
+    _, data_start = read_header(path)
+    size = os.path.getsize(path)
+    bounds = [data_start]
+    with open(path, 'rb') as f:
+        offset = data_start + partition_bytes
+        while offset < size:
+            # The line containing the nominal offset belongs to the
+            # partition before it
+            f.seek(offset)
+            f.readline()
+            boundary = f.tell()
+            if boundary >= size:
+                break
+            bounds.append(boundary)
+            offset = boundary + partition_bytes
+    bounds.append(size)
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def plan_parquet_partitions(path):
+    """One partition per row group: ``(first_group, last_group + 1)``."""
+    import pyarrow.parquet as pq
+
+    return [(i, i + 1) for i in range(pq.ParquetFile(path).num_row_groups)]
+
+
+def mean_line_bytes(path, data_start):
+    with open(path, 'rb') as f:
+        f.seek(data_start)
+        sample = f.read(SAMPLE_BYTES)
+    lines = sample.count(b'\n')
+    return len(sample) / lines if lines else max(len(sample), 1)
+
+
+def column_types(names, id_column, typed=True):
+    """Arrow types for the columns read from a CSV file.
+
+    With ``typed``, input columns parse straight to float64 (``Complain``
+    to bool); otherwise they stay text for ``score_columns()`` to coerce.
+    The ID column is always text: its type cannot be known for a whole
+    file from a sample, and every partition must write the same schema.
+    """
+    import pyarrow as pa
+
+    types = {name: pa.float64() if typed else pa.string() for name in INPUT_COLUMNS if name in names}
+    if typed and 'Complain' in types:
+        types['Complain'] = pa.bool_()
+    if id_column in names:
+        types[id_column] = pa.string()
+    return types
+
+
+def iter_csv_range(path, start, stop, names, chunk_bytes, id_column=None):
+    """Yield Arrow tables for the lines in ``[start, stop)``, ``chunk_bytes`` at a time.
+
+    Chunks are parsed with fixed numeric types; a chunk holding a value
+    that does not parse (``'$5'``, ``'n/a'``) is re-read as text, so
+    ``score_columns()`` coerces bad values to the feature defaults exactly
+    as ``score_customers.py`` does instead of failing the job.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    read_options = pacsv.ReadOptions(column_names=names, use_threads=False,
+                                     block_size=max(1 << 20, min(chunk_bytes, 1 << 30)))
+    typed, text = (column_types(names, id_column, typed) for typed in (True, False))
+    typed_options = pacsv.ConvertOptions(
+        include_columns=list(typed), column_types=typed,
+        true_values=TRUE_VALUES, false_values=FALSE_VALUES, strings_can_be_null=True,
+    )
+    text_options = pacsv.ConvertOptions(include_columns=list(text), column_types=text,
+                                        strings_can_be_null=True)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        while position < stop:
+            data = f.read(min(chunk_bytes, stop - position))
+            position += len(data)
+            if position < stop and not data.endswith(b'\n'):
+                # Finish the current line; partitions end on line boundaries
+                tail = f.readline()
+                data += tail
+                position += len(tail)
+            if not data.strip():
+                continue
+            buffer = pa.py_buffer(data)
+            try:
+                yield pacsv.read_csv(buffer, read_options=read_options, convert_options=typed_options)
+            except pa.ArrowInvalid:
+                yield pacsv.read_csv(buffer, read_options=read_options, convert_options=text_options)
+
+
+def iter_parquet_groups(path, first, last, columns, chunk_rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    present = [name for name in parquet.schema_arrow.names if name in columns]
+    for batch in parquet.iter_batches(batch_size=chunk_rows, row_groups=range(first, last),
+                                      columns=present, use_threads=False):
+        yield pa.Table.from_batches([batch])
+
+
+def _init_worker(model_path):
+    # Runs once per worker process: map and compile the model
+    from forest_engine import load_forest
+    from forest_grid import compile_forest
+
+    _worker['forest'] = compile_forest(load_forest(model_path))
+
+
+def score_table(forest, table, id_column=None):
+    """Score an Arrow table of raw inputs and return the output as an Arrow table."""
+    import pyarrow as pa
+
+    columns = {
+        name: table.column(name).to_numpy(zero_copy_only=False)
+        for name in INPUT_COLUMNS if name in table.column_names
+    }
+    if not columns:
+        # Without input columns every row takes the feature defaults
+        columns = {INPUT_COLUMNS[0]: np.full(table.num_rows, np.nan)}
+    result = score_columns(forest, columns)
+    output = {}
+    if id_column and id_column in table.column_names:
+        output[id_column] = table.column(id_column)
+    output['churn_probability'] = pa.array(result['churn_probability'], type=pa.float64())
+    output['churn_label'] = pa.array(np.asarray(result['churn_label']))
+    output['clv'] = pa.array(result['clv'], type=pa.float64(), from_pandas=True)
+    return pa.table(output)
+
+
+def score_partition(task):
+    """Score one partition into its Parquet file (runs in a worker).
+
+    Several attempts at the same partition may run at once (the cluster
+    re-queues partitions of workers it lost, which may still be running),
+    so every attempt writes its own temporary file and the first to finish
+    publishes it; later attempts find the file in place and discard theirs.
+
+    Returns:
+        dict: Partition index, rows, seconds and the worker's peak RSS.
+    """
+    import pyarrow.parquet as pq
+
+    start_time = time.perf_counter()
+    forest = _worker['forest']
+    path = task['output']
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    id_column = task['id_column']
+    if task['format'] == 'parquet':
+        tables = iter_parquet_groups(task['input'], task['start'], task['stop'],
+                                     set(INPUT_COLUMNS) | {id_column}, task['chunk_rows'])
+    else:
+        tables = iter_csv_range(task['input'], task['start'], task['stop'], task['names'],
+                                task['chunk_bytes'], id_column)
+
+    rows = 0
+    writer = None
+    duplicate = False
+    try:
+        for table in tables:
+            scored = score_table(forest, table, id_column)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, scored.schema)
+            writer.write_table(scored)
+            rows += scored.num_rows
+        if writer is not None:
+            writer.close()
+            duplicate = not _publish(tmp_path, path)
+    finally:
+        if writer is not None:
+            writer.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return {'index': task['index'], 'rows': rows, 'file': os.path.basename(path) if writer else None,
+            'duplicate': duplicate, 'seconds': time.perf_counter() - start_time,
+            'peak_rss': _peak_rss()}
+
+
+def _publish(tmp_path, path):
+    """Move a finished partition into place unless another attempt already did.
+
+    Returns:
+        bool: True if this file was published.
+    """
+    try:
+        # link() fails if the target exists, so the first attempt wins
+        os.link(tmp_path, path)
+    except FileExistsError:
+        return False
+    except OSError:
+        # Filesystems without hard links: every published file is complete
+        os.replace(tmp_path, path)
+        return True
+    os.remove(tmp_path)
+    return True
+
+
+def _peak_rss():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(output_dir, manifest):
+    # Write-then-rename so a crash never leaves a truncated manifest
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def partition_name(index):
+    return f"part-{index:05d}.parquet"
+
+
+def _new_manifest(input_path, model_version, partitions, settings):
+    return {
+        'format_version': FORMAT_VERSION,
+        'input': input_fingerprint(input_path),
+        'model_version': model_version,
+        'settings': settings,
+        'partitions': [
+            {'index': i, 'start': start, 'stop': stop, 'file': partition_name(i), 'rows': None,
+             'done': False}
+            for i, (start, stop) in enumerate(partitions)
+        ],
+        'rows_done': 0,
+        'complete': False,
+    }
+
+
+def prepare_job(input_path, output_dir, model_version, memory_cap=DEFAULT_MEMORY_CAP_BYTES,
+                partition_bytes=DEFAULT_PARTITION_BYTES, chunk_rows=None, id_column='CustomerID',
+                resume=False, log=print):
+    """Plan the partitions of a job, write its manifest and list the work left.
+
+    Shared by the local process pool and the multi-host scoring cluster.
+
+    Returns:
+        tuple: ``(manifest, tasks)``, one task dict per partition still to
+        score, as accepted by ``score_partition()``.
+    """
+    _require_pyarrow()
+    parquet_input = is_parquet(input_path)
+
+    if parquet_input:
+        import pyarrow.parquet as pq
+
+        metadata = pq.ParquetFile(input_path).metadata
+        names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+        bytes_per_row = metadata.serialized_size / max(metadata.num_rows, 1) + 8 * len(names)
+        partitions = plan_parquet_partitions(input_path)
+    else:
+        names, data_start = read_header(input_path)
+        bytes_per_row = mean_line_bytes(input_path, data_start)
+        partitions = plan_csv_partitions(input_path, partition_bytes)
+    used = [name for name in names if name in INPUT_COLUMNS or name == id_column]
+    if chunk_rows is None:
+        chunk_rows = chunk_rows_for_memory(memory_cap, bytes_per_row, len(used))
+    settings = {
+        'format': 'parquet' if parquet_input else 'csv',
+        'partition_bytes': None if parquet_input else partition_bytes,
+        'id_column': id_column if id_column in names else None,
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = read_manifest(output_dir) if resume else None
+    if manifest is not None:
+        if (manifest['input'] != input_fingerprint(input_path) or manifest['model_version'] != model_version
+                or manifest['settings'] != settings):
+            raise RuntimeError(
+                "Cannot resume: the input file, model or partitioning changed since the interrupted run"
+            )
+        # A partition counts as done only if its file survived too
+        for part in manifest['partitions']:
+            if part['done'] and part['rows'] and not os.path.exists(os.path.join(output_dir, part['file'])):
+                part['done'] = False
+        done = sum(part['done'] for part in manifest['partitions'])
+        log(f"Resuming: {done} of {len(manifest['partitions'])} partitions already done")
+    else:
+        for name in os.listdir(output_dir):
+            if name.startswith('part-') and name.endswith(('.parquet', '.tmp')):
+                os.remove(os.path.join(output_dir, name))
+        manifest = _new_manifest(input_path, model_version, partitions, settings)
+    manifest['chunk_rows'] = chunk_rows
+    write_manifest(output_dir, manifest)
+
+    todo = [part for part in manifest['partitions'] if not part['done']]
+    log(f"{len(manifest['partitions'])} partitions ({len(todo)} to score), "
+        f"{chunk_rows:,} rows per chunk for a {memory_cap / 2**20:.0f} MB cap")
+    tasks = [{
+        'index': part['index'],
+        'input': os.path.abspath(input_path),
+        'output': os.path.join(output_dir, part['file']),
+        'format': settings['format'],
+        'start': part['start'],
+        'stop': part['stop'],
+        'names': names,
+        'id_column': settings['id_column'],
+        'chunk_rows': chunk_rows,
+        'chunk_bytes': max(1, int(chunk_rows * bytes_per_row)),
+    } for part in todo]
+    return manifest, tasks
+
+
+def record_result(output_dir, manifest, result):
+    """Mark a scored partition done in the manifest and persist it."""
+    part = manifest['partitions'][result['index']]
+    part.update(rows=result['rows'], done=True, seconds=round(result['seconds'], 3))
+    if result['file'] is None:
+        part['file'] = None
+    manifest['rows_done'] = sum(p['rows'] or 0 for p in manifest['partitions'])
+    write_manifest(output_dir, manifest)
+
+
+def score_partitioned(input_path, output_dir, workers=None, memory_cap=DEFAULT_MEMORY_CAP_BYTES,
+                      partition_bytes=DEFAULT_PARTITION_BYTES, chunk_rows=None, model_path=None,
+                      id_column='CustomerID', resume=False, log=print):
+    """Score ``input_path`` into partitioned Parquet files under ``output_dir``.
+
+    Args:
+        workers: Worker processes (default: one per CPU).
+        memory_cap: Working memory per worker; sets the chunk size.
+        partition_bytes: Target CSV partition size (Parquet uses row groups).
+        chunk_rows: Rows per chunk, overriding the memory cap.
+        resume: Keep finished partitions of a previous run and score the rest.
+
+    Returns:
+        dict: The final manifest.
+    """
+    from forest_engine import load_forest
+    from model_artifact import content_hash
+
+    workers = max(1, workers or os.cpu_count() or 1)
+    manifest, tasks = prepare_job(input_path, output_dir, content_hash(load_forest(model_path)),
+                                  memory_cap=memory_cap, partition_bytes=partition_bytes,
+                                  chunk_rows=chunk_rows, id_column=id_column, resume=resume, log=log)
+    manifest['workers'] = workers
+    log(f"Scoring on {workers} workers")
+
+    start = time.perf_counter()
+    rows_this_run = 0
+    peak_rss = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init_worker,
+                                 initargs=(model_path,)) as pool:
+            futures = [pool.submit(score_partition, task) for task in tasks]
+            for future in as_completed(futures):
+                result = future.result()
+                record_result(output_dir, manifest, result)
+                rows_this_run += result['rows']
+                peak_rss = max(peak_rss, result['peak_rss'])
+                finished = sum(p['done'] for p in manifest['partitions'])
+                elapsed = time.perf_counter() - start
+                log(f"Partition {result['index']}: {result['rows']:,} rows in {result['seconds']:.2f}s "
+                    f"({finished}/{len(manifest['partitions'])} done, "
+                    f"{rows_this_run / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+    elapsed = time.perf_counter() - start
+    manifest['complete'] = True
+    manifest['rows_per_sec'] = rows_this_run / max(elapsed, 1e-9)
+    manifest['peak_worker_rss'] = peak_rss
+    write_manifest(output_dir, manifest)
+    log(f"Scored {rows_this_run:,} rows in {elapsed:.2f}s ({manifest['rows_per_sec']:,.0f} rows/sec); "
+        f"{manifest['rows_done']:,} rows total, peak worker RSS {peak_rss / 2**20:.0f} MB")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a large customer file in parallel partitions.")
+    parser.add_argument('input', help="CSV or Parquet file with the app's customer columns")
+    parser.add_argument('output', help="Directory for the Parquet partitions and manifest.json")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes (default: one per CPU)")
+    parser.add_argument('--memory-cap-mb', type=float, default=DEFAULT_MEMORY_CAP_BYTES / 2**20,
+                        help="Working memory per worker; sets the chunk size")
+    parser.add_argument('--chunk-rows', type=int, default=None,
+                        help="Rows per chunk (default: derived from the memory cap)")
+    parser.add_argument('--partition-mb', type=float, default=DEFAULT_PARTITION_BYTES / 2**20,
+                        help="Target CSV partition size")
+    parser.add_argument('--model', default=None,
+                        help="Model artifact directory or pickle (default: the app's model)")
+    parser.add_argument('--id-column', default='CustomerID',
+                        help="Column copied to the output to identify rows (if present)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Score only the partitions an interrupted run did not finish")
+    args = parser.parse_args(argv)
+
+    try:
+        score_partitioned(args.input, args.output, workers=args.workers,
+                          memory_cap=int(args.memory_cap_mb * 2**20),
+                          partition_bytes=int(args.partition_mb * 2**20), chunk_rows=args.chunk_rows,
+                          model_path=args.model, id_column=args.id_column, resume=args.resume)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,368 @@
+"""Content-addressed cache of predictions, explanations and charts.
+
+Entries are keyed by the model's content hash plus the raw customer inputs
+rounded to a fixed precision, so the same slider combination is only
+scored, explained and plotted once per model version. A small in-process
+LRU sits in front of a size-capped on-disk store that survives restarts.
+Each model version gets its own ``pc-<hash>`` directory, marked with a
+``VERSION_MARKER`` file, so stale entries are never served. When the
+active model changes, marked directories of other versions that no process
+has used for ``STALE_VERSION_SECONDS`` are deleted; nothing the cache did
+not create is ever removed, even if the cache directory is shared.
+
+Entries are written as NumPy ``.npz`` archives (plain arrays plus a JSON
+manifest) and read with ``allow_pickle=False``, so a file planted in a
+shared cache directory can at worst be a wrong cache hit, never code run
+in this process. Objects are only rebuilt for the classes in
+``RECORD_TYPES``; fields that cannot be encoded stay in memory only.
+"""
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'PREDICTION_CACHE_DIR', os.path.join(os.path.dirname(__file__), '.prediction_cache')
+)
+
+# Disk space used by cached entries before the least recently used are evicted
+DEFAULT_MAX_DISK_BYTES = 256 * 1024 * 1024
+
+# Entries kept in the in-process LRU
+DEFAULT_MAX_MEMORY_ITEMS = 256
+
+# Decimal places numeric inputs are rounded to before hashing
+DEFAULT_DECIMALS = 2
+
+ENTRY_SUFFIX = '.npz'
+
+# Classes whose instances are stored field by field and rebuilt on load
+RECORD_TYPES = {'explain.ShapResult'}
+
+# Exceptions meaning an entry file is missing, truncated or not one of ours
+READ_ERRORS = (OSError, ValueError, KeyError, TypeError, zipfile.BadZipFile)
+
+# Version directories are named VERSION_PREFIX + hash and hold a marker
+# file that a process in use refreshes; only such directories are deleted
+VERSION_PREFIX = 'pc-'
+VERSION_MARKER = '.prediction_cache_version'
+
+# Other versions' directories unused for this long are deleted on a switch
+STALE_VERSION_SECONDS = 24 * 3600
+
+# Minimum seconds between refreshes of the active version's marker
+MARKER_REFRESH_SECONDS = 60
+
+
+def input_key(model_hash, inputs, decimals=DEFAULT_DECIMALS):
+    """Cache key for ``inputs`` (a mapping of raw input values) under ``model_hash``."""
+    canonical = {}
+    for name in sorted(inputs):
+        value = inputs[name]
+        if isinstance(value, (bool, np.bool_)):
+            value = bool(value)
+        elif isinstance(value, (int, float, np.integer, np.floating)):
+            # Round, then normalise -0.0 and integral floats
+            value = round(float(value), decimals) + 0.0
+        else:
+            value = str(value)
+        canonical[name] = value
+    payload = json.dumps([model_hash, canonical], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _encode(value, arrays):
+    """JSON description of ``value``; its array data is appended to ``arrays``."""
+    def array(a):
+        arrays.append(a)
+        return f'a{len(arrays) - 1}'
+
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {'json': value}
+    if isinstance(value, bytes):
+        return {'bytes': array(np.frombuffer(value, dtype=np.uint8))}
+    if isinstance(value, np.generic):
+        return {'scalar': array(np.asarray(value))}
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise TypeError("object arrays are not cached on disk")
+        return {'array': array(value)}
+    if isinstance(value, pd.DataFrame):
+        columns = []
+        for name in value.columns:
+            column = value[name]
+            if column.dtype.kind in 'biufcmM':
+                columns.append({'name': str(name), 'array': array(column.to_numpy())})
+            else:
+                columns.append({'name': str(name), 'text': array(column.to_numpy(dtype=str))})
+        index = None if isinstance(value.index, pd.RangeIndex) else _encode(value.index.to_numpy(), arrays)
+        return {'frame': columns, 'index': index}
+    if isinstance(value, dict):
+        return {'dict': {str(k): _encode(v, arrays) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {'list': [_encode(v, arrays) for v in value]}
+    type_name = f"{type(value).__module__}.{type(value).__qualname__}"
+    if type_name in RECORD_TYPES:
+        return {'record': type_name, 'fields': _encode(vars(value), arrays)['dict']}
+    raise TypeError(f"cannot cache {type_name} on disk")
+
+
+def _decode(spec, arrays):
+    """Rebuild a value from its ``_encode()`` description."""
+    if 'json' in spec:
+        return spec['json']
+    if 'bytes' in spec:
+        return arrays[spec['bytes']].tobytes()
+    if 'scalar' in spec:
+        return arrays[spec['scalar']][()]
+    if 'array' in spec:
+        return arrays[spec['array']]
+    if 'frame' in spec:
+        frame = pd.DataFrame({
+            column['name']: arrays[column['array']] if 'array' in column else arrays[column['text']].astype(object)
+            for column in spec['frame']
+        })
+        if spec['index'] is not None:
+            frame.index = _decode(spec['index'], arrays)
+        return frame
+    if 'dict' in spec:
+        return {k: _decode(v, arrays) for k, v in spec['dict'].items()}
+    if 'list' in spec:
+        return [_decode(v, arrays) for v in spec['list']]
+    if spec.get('record') in RECORD_TYPES:
+        module, _, name = spec['record'].rpartition('.')
+        record = object.__new__(getattr(importlib.import_module(module), name))
+        record.__dict__.update({k: _decode(v, arrays) for k, v in spec['fields'].items()})
+        return record
+    raise ValueError(f"unknown cache entry field {sorted(spec)}")
+
+
+def dump_entry(entry):
+    """Serialise an entry dict to ``.npz`` bytes, skipping fields that cannot be encoded."""
+    arrays = []
+    fields = {}
+    for name, value in entry.items():
+        start = len(arrays)
+        try:
+            fields[name] = _encode(value, arrays)
+        except TypeError:
+            del arrays[start:]
+    manifest = json.dumps(fields, separators=(',', ':'))
+    buffer = io.BytesIO()
+    np.savez(buffer, manifest=np.array(manifest), **{f'a{i}': a for i, a in enumerate(arrays)})
+    return buffer.getvalue()
+
+
+def load_entry(path):
+    """Read an entry written by ``dump_entry()`` without unpickling anything."""
+    with np.load(path, allow_pickle=False) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    fields = json.loads(str(arrays.pop('manifest')))
+    return {name: _decode(spec, arrays) for name, spec in fields.items()}
+
+
+class PredictionCache:
+    """Two-level cache of per-customer results for one model version at a time."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_disk_bytes=DEFAULT_MAX_DISK_BYTES,
+                 max_memory_items=DEFAULT_MAX_MEMORY_ITEMS, decimals=DEFAULT_DECIMALS):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_items = max_memory_items
+        self.decimals = decimals
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._model_hash = None
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._marker_touched = 0.0
+        self.memory_hits = self.disk_hits = self.misses = 0
+        self.memory_evictions = self.disk_evictions = self.invalidations = 0
+
+    def key(self, model_hash, inputs):
+        return input_key(model_hash, inputs, self.decimals)
+
+    def _model_dir(self, model_hash):
+        return os.path.join(self.cache_dir, VERSION_PREFIX + str(model_hash)[:16])
+
+    def _version_dirs(self):
+        # Directories this cache created: prefixed and marked
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+            if name.startswith(VERSION_PREFIX)
+            and os.path.isfile(os.path.join(self.cache_dir, name, VERSION_MARKER))
+        ]
+
+    def _touch_marker(self, model_hash):
+        now = time.time()
+        if now - self._marker_touched < MARKER_REFRESH_SECONDS:
+            return
+        with open(os.path.join(self._model_dir(model_hash), VERSION_MARKER), 'a'):
+            pass
+        os.utime(os.path.join(self._model_dir(model_hash), VERSION_MARKER))
+        self._marker_touched = now
+
+    def _path(self, model_hash, key):
+        return os.path.join(self._model_dir(model_hash), key + ENTRY_SUFFIX)
+
+    def _use_model(self, model_hash):
+        # Called with the lock held. Switching models drops stale versions.
+        if model_hash == self._model_hash:
+            self._touch_marker(model_hash)
+            return
+        self._memory.clear()
+        self._disk.clear()
+        self._disk_bytes = 0
+        self._model_hash = model_hash
+        model_dir = self._model_dir(model_hash)
+        os.makedirs(model_dir, exist_ok=True)
+        self._marker_touched = 0.0
+        self._touch_marker(model_hash)
+        # Another process may still be serving a different model from a
+        # version whose marker it keeps fresh; leave those alone
+        cutoff = time.time() - STALE_VERSION_SECONDS
+        for path in self._version_dirs():
+            if path == model_dir:
+                continue
+            try:
+                if os.path.getmtime(os.path.join(path, VERSION_MARKER)) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    self.invalidations += 1
+            except OSError:
+                pass
+        # Rebuild the disk index, oldest access first
+        entries = []
+        for name in os.listdir(model_dir):
+            if name.endswith(ENTRY_SUFFIX):
+                stat = os.stat(os.path.join(model_dir, name))
+                entries.append((stat.st_mtime_ns, name[:-len(ENTRY_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def get(self, model_hash, key):
+        """Return the cached entry (a dict) or None."""
+        with self._lock:
+            self._use_model(model_hash)
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+            if key not in self._disk:
+                self.misses += 1
+                return None
+            path = self._path(model_hash, key)
+            try:
+                entry = load_entry(path)
+                os.utime(path)
+            except READ_ERRORS:
+                self._disk_bytes -= self._disk.pop(key)
+                self.misses += 1
+                return None
+            self._disk.move_to_end(key)
+            self.disk_hits += 1
+            self._remember(key, entry)
+            return entry
+
+    def update(self, model_hash, key, **fields):
+        """Merge ``fields`` into the entry for ``key`` and persist it."""
+        with self._lock:
+            self._use_model(model_hash)
+            entry = dict(self._memory.get(key) or {})
+            if not entry and key in self._disk:
+                try:
+                    entry = load_entry(self._path(model_hash, key))
+                except READ_ERRORS:
+                    entry = {}
+            entry.update(fields)
+            entry['updated_at'] = time.time()
+            self._remember(key, entry)
+            self._store(model_hash, key, entry)
+            return entry
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    def _store(self, model_hash, key, entry):
+        path = self._path(model_hash, key)
+        data = dump_entry(entry)
+        if len(data) > self.max_disk_bytes:
+            return
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._disk_bytes += len(data) - self._disk.pop(key, 0)
+        self._disk[key] = len(data)
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            old_key, size = self._disk.popitem(last=False)
+            try:
+                os.remove(self._path(model_hash, old_key))
+            except OSError:
+                pass
+            self._disk_bytes -= size
+            self._memory.pop(old_key, None)
+            self.disk_evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._disk.clear()
+            self._disk_bytes = 0
+            self._model_hash = None
+            for path in self._version_dirs():
+                shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'lookups': lookups,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_items': len(self._memory),
+                'disk_items': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'memory_evictions': self.memory_evictions,
+                'disk_evictions': self.disk_evictions,
+                'invalidated_versions': self.invalidations,
+            }
+
+
+def figure_png(fig, dpi=100):
+    """Render a matplotlib figure to PNG bytes for caching."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    return buffer.getvalue()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the cache shared by every session in this process."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PredictionCache()
+    return _cache
@@ -0,0 +1,416 @@
+"""Pre-forked multi-process scoring server sharing one copy of the model.
+
+One Python process scores on one core. This server loads and compiles the
+churn model in the parent, reserves the port, then forks N workers running
+the ``scoring_service.py`` event loop and micro-batcher. Where the platform
+has ``SO_REUSEPORT`` (Linux 3.9+), each worker listens on its own socket
+bound to that port and the kernel hashes new connections evenly across
+them. Otherwise all workers accept() on one inherited socket; the kernel
+then wakes whichever worker is idle first, so a warm worker takes most of
+the connections (4 workers once split 20,000 requests 3398/2988/1398/216).
+Workers inherit the model arrays copy-on-write
+(an exported artifact is memory-mapped, so its pages sit in the shared
+page cache either way) and ``gc.freeze()`` keeps the collector from
+touching, and so copying, everything allocated before the fork.
+
+Each worker publishes its request counters into a small shared-memory
+table. ``GET /workers`` on any worker returns per-worker counters plus RSS,
+PSS and private memory from ``/proc/<pid>/smaps_rollup``: PSS charges each
+shared page to the processes mapping it, so the PSS total is the real
+footprint and stays near one model and one interpreter as workers are
+added. Dead workers are restarted in their slot.
+
+Usage:
+    python prefork_server.py serve [--workers 4] [--port 8000]
+    python prefork_server.py benchmark [--workers 1,2,4] [--requests 20000]
+"""
+import argparse
+import asyncio
+import gc
+import mmap
+import os
+import signal
+import socket
+import sys
+import time
+
+import numpy as np
+
+from scoring_service import (DEFAULT_HOST, DEFAULT_PORT, ScoringService, ServiceMetrics,
+                             add_service_arguments, load_test, service_options)
+
+# Columns of the shared per-worker counter table
+STAT_FIELDS = ('pid', 'started', 'requests', 'rows', 'errors', 'batches', 'shed', 'degraded', 'coalesced')
+PID, STARTED, REQUESTS, ROWS, ERRORS, BATCHES, SHED, DEGRADED, COALESCED = range(len(STAT_FIELDS))
+
+# How long stopped workers get to finish in-flight requests before SIGKILL
+STOP_TIMEOUT_SECONDS = 5.0
+
+# A worker dying sooner than this after its start is restarted only after
+# the same delay, so a crashing worker cannot spin the parent
+RESTART_BACKOFF_SECONDS = 1.0
+
+LISTEN_BACKLOG = 1024
+
+# Whether workers can get their own listening socket on the shared port
+HAS_REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+
+
+def bind_socket(host, port, reuse_port=False, listen=True):
+    """TCP socket bound to ``(host, port)``, listening unless ``listen`` is False."""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        if listen:
+            sock.listen(LISTEN_BACKLOG)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def process_memory(pid):
+    """RSS, PSS and private bytes of ``pid`` from /proc, or None off Linux."""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+class SharedMetrics(ServiceMetrics):
+    """ServiceMetrics that also publishes its counters to a shared table row."""
+
+    def __init__(self, table, slot):
+        super().__init__()
+        self.row = table[slot]
+        self.row[:] = 0
+        self.row[PID] = os.getpid()
+        self.row[STARTED] = time.time()
+
+    def record_request(self, seconds, rows, error=False):
+        super().record_request(seconds, rows, error)
+        self.row[REQUESTS] = self.requests
+        self.row[ROWS] = self.rows
+        self.row[ERRORS] = self.errors
+
+    def record_batch(self, rows, seconds):
+        super().record_batch(rows, seconds)
+        self.row[BATCHES] = self.batches
+
+    def record_shed(self, request_class):
+        super().record_shed(request_class)
+        self.row[SHED] += 1
+
+    def record_degraded(self, request_class):
+        super().record_degraded(request_class)
+        self.row[DEGRADED] += 1
+
+    def record_coalesced(self, request_class):
+        super().record_coalesced(request_class)
+        self.row[COALESCED] += 1
+
+
+class WorkerService(ScoringService):
+    """ScoringService with a ``GET /workers`` report of the whole server."""
+
+    def __init__(self, forest, report, **kwargs):
+        super().__init__(forest, **kwargs)
+        self.report = report
+
+    async def _dispatch(self, method, path, body):
+        if path.split('?', 1)[0] == '/workers' and method == 'GET':
+            return 200, self.report(), 0
+        return await super()._dispatch(method, path, body)
+
+
+class PreforkServer:
+    """Parent process that owns the socket and the model and forks workers."""
+
+    def __init__(self, forest, workers=None, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 model_version=None, reuse_port=None, **service_options):
+        if not hasattr(os, 'fork'):
+            raise RuntimeError("Pre-forking needs os.fork (Linux or macOS)")
+        self.forest = forest
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.host = host
+        self.port = port
+        # One listening socket per worker where available (None: when supported)
+        self.reuse_port = HAS_REUSE_PORT if reuse_port is None else reuse_port
+        if self.reuse_port and not HAS_REUSE_PORT:
+            raise RuntimeError("SO_REUSEPORT is not available on this platform")
+        self.service_options = {**service_options, 'model_version': model_version}
+        self.sock = None
+        self.table = None
+        self.parent_pid = None
+        self.pids = [0] * self.workers
+        self.spawned = [0.0] * self.workers
+        self.restarts = 0
+        self._stopping = False
+
+    @property
+    def address(self):
+        return self.sock.getsockname()[:2]
+
+    def start(self):
+        """Bind the socket, set up the shared counters and fork the workers."""
+        self.parent_pid = os.getpid()
+        # With SO_REUSEPORT the parent only binds, to claim the port (and
+        # resolve port 0); a listening parent socket would be handed a share
+        # of the connections that no worker ever accepts
+        self.sock = bind_socket(self.host, self.port, self.reuse_port, listen=not self.reuse_port)
+        # Anonymous mappings are shared with forked children
+        self._buffer = mmap.mmap(-1, self.workers * len(STAT_FIELDS) * 8)
+        self.table = np.frombuffer(self._buffer, dtype=np.float64).reshape(self.workers, len(STAT_FIELDS))
+        # Import SHAP and build the explainer once, here, so workers share it
+        try:
+            from explain import get_explainer
+            get_explainer(self.forest, self.service_options['model_version'])
+        except ImportError:
+            pass
+        # Move everything allocated so far out of the collector's reach;
+        # otherwise the first collection in each worker writes to (and so
+        # copies) every page holding a tracked object
+        gc.collect()
+        gc.freeze()
+        for slot in range(self.workers):
+            self._spawn(slot)
+        return self
+
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._run_worker(slot)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        self.pids[slot] = pid
+        self.spawned[slot] = time.monotonic()
+
+    def _run_worker(self, slot):
+        # The parent handles Ctrl-C and tells workers to stop with SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        asyncio.run(self._worker_main(slot))
+
+    async def _worker_main(self, slot):
+        service = WorkerService(self.forest, self.report, metrics=SharedMetrics(self.table, slot),
+                                **self.service_options)
+        sock = self.sock
+        if self.reuse_port:
+            sock = bind_socket(self.host, self.address[1], reuse_port=True)
+            self.sock.close()
+        await service.start(sock=sock)
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        await stop.wait()
+        await service.stop()
+
+    def report(self, memory=True):
+        """Per-worker counters and memory, plus totals over all processes."""
+        now = time.time()
+        workers = []
+        for slot, row in enumerate(self.table):
+            pid = int(row[PID])
+            if not pid:
+                continue
+            uptime = max(now - row[STARTED], 1e-9)
+            worker = {
+                'slot': slot,
+                'pid': pid,
+                'requests': int(row[REQUESTS]),
+                'rows': int(row[ROWS]),
+                'errors': int(row[ERRORS]),
+                'batches': int(row[BATCHES]),
+                'shed': int(row[SHED]),
+                'degraded': int(row[DEGRADED]),
+                'coalesced': int(row[COALESCED]),
+                'requests_per_sec': row[REQUESTS] / uptime,
+            }
+            if memory:
+                worker['memory'] = process_memory(pid)
+            workers.append(worker)
+        result = {
+            'workers': workers,
+            'restarts': self.restarts,
+            'balancing': 'reuseport' if self.reuse_port else 'shared accept',
+        }
+        if memory:
+            parent = process_memory(self.parent_pid)
+            processes = [w['memory'] for w in workers if w['memory']] + ([parent] if parent else [])
+            result['parent_memory'] = parent
+            result['total_memory'] = {
+                name: sum(m[name] for m in processes) for name in ('rss', 'pss', 'private')
+            } if processes else None
+        return result
+
+    def serve_forever(self, log=print):
+        """Wait on the workers, restarting any that die, until stopped."""
+        def terminate(signum, frame):
+            raise KeyboardInterrupt
+
+        previous = signal.signal(signal.SIGTERM, terminate)
+        try:
+            while not self._stopping:
+                pid, status = os.wait()
+                if pid not in self.pids or self._stopping:
+                    continue
+                slot = self.pids.index(pid)
+                log(f"Worker {slot} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; "
+                    f"restarting")
+                if time.monotonic() - self.spawned[slot] < RESTART_BACKOFF_SECONDS:
+                    time.sleep(RESTART_BACKOFF_SECONDS)
+                self.restarts += 1
+                self._spawn(slot)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            self.stop()
+
+    def stop(self):
+        """Ask every worker to finish, then kill stragglers."""
+        self._stopping = True
+        alive = [pid for pid in self.pids if pid]
+        for pid in alive:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + STOP_TIMEOUT_SECONDS
+        while alive:
+            still = []
+            for pid in alive:
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    continue
+                if not done:
+                    still.append(pid)
+            alive = still
+            if alive and time.monotonic() > deadline:
+                for pid in alive:
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                break
+            if alive:
+                time.sleep(0.01)
+        self.pids = [0] * self.workers
+        if self.sock is not None:
+            self.sock.close()
+
+
+def load_server(model_path=None, **kwargs):
+    """PreforkServer over the app's churn model (or ``model_path``), loaded in this process."""
+    from forest_engine import load_forest
+    from forest_grid import compile_forest
+    from model_artifact import content_hash
+
+    forest = load_forest(model_path)
+    return PreforkServer(compile_forest(forest), model_version=content_hash(forest), **kwargs)
+
+
+def _megabytes(n_bytes):
+    return f"{n_bytes / 2**20:.1f}" if n_bytes is not None else "-"
+
+
+def benchmark(worker_counts, model_path=None, n_requests=20_000, concurrency=64, log=print, **kwargs):
+    """Load-test the server at each worker count and report throughput and memory."""
+    from model_registry import measure_size
+
+    results = []
+    for count in worker_counts:
+        server = load_server(model_path, workers=count, port=0, **kwargs)
+        if count == worker_counts[0]:
+            resident, mapped = measure_size(server.forest)
+            log(f"Model: {server.forest.describe()}; {_megabytes(resident)} MB resident, "
+                f"{_megabytes(mapped)} MB memory-mapped")
+        server.start()
+        try:
+            url = f"http://{server.host}:{server.address[1]}"
+            load = asyncio.run(load_test(url, concurrency, n_requests))
+            report = server.report()
+        finally:
+            server.stop()
+
+        log(f"{count} worker(s), {report['balancing']}: {load['requests_per_sec']:,.0f} req/s, "
+            f"p50 {load['latency_ms']['p50']:.2f} ms, p99 {load['latency_ms']['p99']:.2f} ms")
+        total_requests = max(1, sum(w['requests'] for w in report['workers']))
+        for worker in report['workers']:
+            memory = worker['memory'] or {}
+            log(f"  worker {worker['slot']} (pid {worker['pid']}): {worker['requests']} requests "
+                f"({100 * worker['requests'] / total_requests:.0f}%), "
+                f"RSS {_megabytes(memory.get('rss'))} MB, PSS {_megabytes(memory.get('pss'))} MB, "
+                f"private {_megabytes(memory.get('private'))} MB")
+        total = report['total_memory']
+        if total:
+            log(f"  all processes incl. parent: RSS {_megabytes(total['rss'])} MB, "
+                f"PSS {_megabytes(total['pss'])} MB, private {_megabytes(total['private'])} MB")
+        results.append({'workers': count, 'load': load, 'report': report})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the churn model from pre-forked worker processes.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="Run the pre-forked server")
+    serve_parser.add_argument('--host', default=DEFAULT_HOST)
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--workers', type=int, default=None,
+                              help="Worker processes (default: one per CPU)")
+
+    bench_parser = commands.add_parser('benchmark', help="Load-test at several worker counts")
+    bench_parser.add_argument('--workers', default=None,
+                              help="Comma-separated worker counts (default: 1 up to the CPU count)")
+    bench_parser.add_argument('--requests', type=int, default=20_000)
+    bench_parser.add_argument('--concurrency', type=int, default=64)
+
+    for sub in (serve_parser, bench_parser):
+        sub.add_argument('--shared-socket', action='store_true',
+                         help="Accept on one inherited socket even where SO_REUSEPORT is available")
+        add_service_arguments(sub)
+    args = parser.parse_args(argv)
+
+    try:
+        options = service_options(args)
+        if args.shared_socket:
+            options['reuse_port'] = False
+        if args.command == 'serve':
+            server = load_server(args.model, workers=args.workers, host=args.host, port=args.port,
+                                 **options)
+            server.start()
+            print(f"Serving {server.forest.describe()} on http://{args.host}:{server.address[1]} "
+                  f"with {server.workers} workers (pids {', '.join(map(str, server.pids))})")
+            server.serve_forever()
+        else:
+            if args.workers:
+                counts = [int(n) for n in args.workers.split(',')]
+            else:
+                cpus = os.cpu_count() or 1
+                counts = sorted({1, max(1, cpus // 2), cpus})
+            benchmark(counts, args.model, args.requests, args.concurrency, **options)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+"""Streaming RFM summary of order event logs.
+
+Order events (customer, timestamp, amount and optionally coupon, cashback
+and complaint columns) are read chunk by chunk, so the log can be far
+larger than memory. Per-customer running aggregates live in flat NumPy
+arrays indexed by a dense customer code; only the ID lookup and those
+arrays grow with the number of customers, never with the number of events.
+
+The aggregator state is saved to an ``.npz`` file, so new days of events
+can be folded in later without reading the history again. From the state
+it emits:
+
+- the RFM summary used by ``clv_model.py`` (frequency, recency, T and
+  monetary value in days, as ``summary_from_transactions()`` computes it)
+- the raw inputs collected by ``get_user_inputs()`` in ``app.py`` (Tenure,
+  OrderCount, DaySinceLastOrder, CouponUsed, CashbackAmount, Complain,
+  MonthlyCharges), ready for ``features.py`` and ``score_customers.py``.
+
+Events are expected roughly in time order, as logs are appended: a late
+event for a day before a customer's last purchase day (other than their
+first) is counted as an extra purchase day.
+
+Usage:
+    python rfm.py update events.csv [--state rfm_state.npz] [--customer-id CustomerID] [--date InvoiceDate]
+    python rfm.py export customers.csv [--state rfm_state.npz] [--observation-end 2024-01-31]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_STATE_PATH = os.path.join(os.path.dirname(__file__), 'rfm_state.npz')
+
+DEFAULT_CHUNK_SIZE = 500_000
+
+FORMAT_VERSION = 1
+
+# Days per month used for tenure and monthly charges
+DAYS_PER_MONTH = 30
+
+# Complaints within this many days of the observation end set ``Complain``
+COMPLAINT_WINDOW_DAYS = 30
+
+# Day numbers (days since 1970-01-01) of customers without a purchase yet
+NO_FIRST_DAY = np.iinfo(np.int32).max
+NO_LAST_DAY = np.iinfo(np.int32).min
+
+# Per-customer aggregate arrays and their dtypes
+AGGREGATES = {
+    'first_day': np.int32,
+    'last_day': np.int32,
+    'purchase_days': np.int32,
+    'orders': np.int64,
+    'total_amount': np.float64,
+    'first_day_amount': np.float64,
+    'coupons': np.float64,
+    'cashback': np.float64,
+    'last_complaint_day': np.int32,
+}
+
+
+def day_numbers(values):
+    """Days since 1970-01-01 of timestamps (strings or datetimes)."""
+    return pd.to_datetime(values).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def _first_per_group(codes):
+    # ``codes`` is sorted: True where a new group starts
+    starts = np.ones(len(codes), dtype=bool)
+    starts[1:] = codes[1:] != codes[:-1]
+    return starts
+
+
+class RFMAccumulator:
+    """Running per-customer order aggregates.
+
+    Args:
+        ids: Known customer IDs, in code order.
+        arrays: Aggregate arrays (see ``AGGREGATES``), one value per ID.
+        sources: Fingerprints of the event files already folded in.
+    """
+
+    def __init__(self, ids=None, arrays=None, sources=None):
+        ids = pd.Index([] if ids is None else ids)
+        self._index = ids
+        self._ids = ids.to_numpy()
+        self.n_customers = len(ids)
+        self.sources = list(sources or [])
+        self.events = 0
+        self.watermark = NO_LAST_DAY
+        capacity = max(self.n_customers, 1024)
+        self.arrays = {}
+        for name, dtype in AGGREGATES.items():
+            array = np.empty(capacity, dtype=dtype)
+            array[:] = self._initial(name)
+            if arrays is not None:
+                array[:self.n_customers] = arrays[name]
+            self.arrays[name] = array
+
+    @staticmethod
+    def _initial(name):
+        if name == 'first_day':
+            return NO_FIRST_DAY
+        if name in ('last_day', 'last_complaint_day'):
+            return NO_LAST_DAY
+        return 0
+
+    def __len__(self):
+        return self.n_customers
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.n_customers]
+
+    def _grow(self, size):
+        capacity = len(self.arrays['orders'])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for name, array in self.arrays.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            grown[len(array):] = self._initial(name)
+            self.arrays[name] = grown
+
+    def codes(self, ids):
+        """Dense codes of ``ids``, assigning new codes to unseen customers."""
+        inverse, uniques = pd.factorize(np.asarray(ids))
+        known = self._index.get_indexer(uniques)
+        new = known < 0
+        if new.any():
+            known[new] = np.arange(self.n_customers, self.n_customers + new.sum())
+            self._ids = np.concatenate([self._ids, uniques[new]]) if self.n_customers else uniques[new]
+            self._index = pd.Index(self._ids)
+            self._grow(self.n_customers + int(new.sum()))
+            self.n_customers += int(new.sum())
+        return known[inverse]
+
+    def add_events(self, ids, days, amounts=None, coupons=None, cashback=None, complaints=None):
+        """Fold one chunk of order events into the aggregates.
+
+        Args:
+            ids: Customer ID per event.
+            days: Event day numbers (see ``day_numbers()``).
+            amounts, coupons, cashback: Optional per-event values.
+            complaints: Optional per-event complaint flags.
+        """
+        codes = self.codes(ids)
+        days = np.asarray(days, dtype=np.int64)
+        n = self.n_customers
+        if len(codes) == 0:
+            return
+        amounts = np.zeros(len(codes)) if amounts is None else np.nan_to_num(
+            np.asarray(amounts, dtype=np.float64))
+        a = self.arrays
+
+        a['orders'][:n] += np.bincount(codes, minlength=n)
+        a['total_amount'][:n] += np.bincount(codes, weights=amounts, minlength=n)
+        for name, values in (('coupons', coupons), ('cashback', cashback)):
+            if values is not None:
+                values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+                a[name][:n] += np.bincount(codes, weights=values, minlength=n)
+        if complaints is not None:
+            flagged = np.nan_to_num(np.asarray(complaints, dtype=np.float64)) > 0
+            np.maximum.at(a['last_complaint_day'], codes[flagged], days[flagged])
+
+        # One row per (customer, day), sorted by customer then day
+        order = np.lexsort((days, codes))
+        codes, days, amounts = codes[order], days[order], amounts[order]
+        day_start = np.ones(len(codes), dtype=bool)
+        day_start[1:] = (codes[1:] != codes[:-1]) | (days[1:] != days[:-1])
+        starts = np.flatnonzero(day_start)
+        codes, days = codes[starts], days[starts]
+        amounts = np.add.reduceat(amounts, starts)
+
+        # A day counts as a new purchase day unless already seen as first/last day
+        first_day = a['first_day'][codes]
+        last_day = a['last_day'][codes]
+        new_day = (days != first_day) & (days != last_day)
+        a['purchase_days'][:n] += np.bincount(codes, weights=new_day, minlength=n).astype(np.int32)
+
+        group_start = _first_per_group(codes)
+        c, d, amount = codes[group_start], days[group_start], amounts[group_start]
+        earlier = d < a['first_day'][c]
+        same = d == a['first_day'][c]
+        a['first_day_amount'][c[same]] += amount[same]
+        a['first_day'][c[earlier]] = d[earlier]
+        a['first_day_amount'][c[earlier]] = amount[earlier]
+
+        group_end = np.append(group_start[1:], True)
+        c, d = codes[group_end], days[group_end]
+        a['last_day'][c] = np.maximum(a['last_day'][c], d)
+
+        self.events += len(order)
+        self.watermark = max(self.watermark, int(days.max()))
+
+    def end_day(self, observation_end=None):
+        if observation_end is None:
+            return self.watermark
+        return int(day_numbers([observation_end])[0])
+
+    def summary(self, observation_end=None):
+        """RFM summary in days, indexed by customer ID.
+
+        Matches ``clv_model.summary_from_transactions()`` on the same events
+        when ``observation_end`` is not before the last event.
+        """
+        end = self.end_day(observation_end)
+        first, last = self['first_day'].astype(np.float64), self['last_day'].astype(np.float64)
+        frequency = (self['purchase_days'] - 1).astype(np.float64)
+        repeat_total = self['total_amount'] - self['first_day_amount']
+        monetary = np.divide(repeat_total, frequency, out=np.zeros(len(self)), where=frequency > 0)
+        return pd.DataFrame({
+            'frequency': frequency,
+            'recency': last - first,
+            'T': np.maximum(end - first, 0.0),
+            'monetary_value': monetary,
+        }, index=pd.Index(self._ids[:len(self)], name='customer'))
+
+    def user_inputs(self, observation_end=None):
+        """Per-customer inputs in the shape of ``get_user_inputs()``."""
+        end = self.end_day(observation_end)
+        age_days = np.maximum(end - self['first_day'].astype(np.float64), 0.0)
+        tenure = age_days / DAYS_PER_MONTH
+        return pd.DataFrame({
+            'Tenure': np.round(tenure, 2),
+            'OrderCount': self['orders'],
+            'DaySinceLastOrder': np.maximum(end - self['last_day'].astype(np.float64), 0.0),
+            'CouponUsed': self['coupons'],
+            'CashbackAmount': self['cashback'],
+            'Complain': (self['last_complaint_day'] > end - COMPLAINT_WINDOW_DAYS).astype(np.int8),
+            'MonthlyCharges': self['total_amount'] / np.maximum(tenure, 1.0),
+        }, index=pd.Index(self._ids[:len(self)], name='customer'))
+
+    def save(self, path):
+        """Write the state to ``path`` (an ``.npz`` file) atomically."""
+        ids = self._ids[:len(self)]
+        if ids.dtype == object:
+            ids = ids.astype(str)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f, ids=ids, format_version=FORMAT_VERSION, events=self.events,
+                watermark=self.watermark, sources=np.asarray(self.sources, dtype=str),
+                **{name: self[name] for name in AGGREGATES},
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as state:
+            if int(state['format_version']) != FORMAT_VERSION:
+                raise RuntimeError(f"{path} was written by an incompatible version of rfm.py")
+            accumulator = cls(state['ids'], {name: state[name] for name in AGGREGATES},
+                              state['sources'].tolist())
+            accumulator.events = int(state['events'])
+            accumulator.watermark = int(state['watermark'])
+        return accumulator
+
+    @classmethod
+    def load_or_new(cls, path):
+        return cls.load(path) if path and os.path.exists(path) else cls()
+
+
+def source_fingerprint(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def iter_event_chunks(path, columns, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield DataFrames of at most ``chunk_size`` events with only ``columns``."""
+    if path.lower().endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Reading Parquet needs pyarrow: `pip install pyarrow`")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size)
+
+
+def fold_file(accumulator, path, customer_col, date_col, amount_col=None, coupon_col=None,
+              cashback_col=None, complain_col=None, chunk_size=DEFAULT_CHUNK_SIZE, log=print):
+    """Fold every event of ``path`` into ``accumulator``.
+
+    Returns:
+        int: Events read, or 0 if the same file was folded in before.
+    """
+    fingerprint = source_fingerprint(path)
+    if fingerprint in accumulator.sources:
+        log(f"Skipping {path}: already folded into this state")
+        return 0
+    optional = {'amounts': amount_col, 'coupons': coupon_col, 'cashback': cashback_col,
+                'complaints': complain_col}
+    columns = [customer_col, date_col] + [c for c in optional.values() if c]
+
+    start = time.perf_counter()
+    events = 0
+    for chunk in iter_event_chunks(path, columns, chunk_size):
+        accumulator.add_events(
+            chunk[customer_col].to_numpy(), day_numbers(chunk[date_col]),
+            **{name: chunk[column].to_numpy() for name, column in optional.items() if column},
+        )
+        events += len(chunk)
+        log(f"Folded {events} events, {len(accumulator)} customers "
+            f"({events / max(time.perf_counter() - start, 1e-9):,.0f} events/sec)")
+    accumulator.sources.append(fingerprint)
+    return events
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build per-customer RFM summaries from order events.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    update = sub.add_parser('update', help="Fold event files into the saved state")
+    update.add_argument('events', nargs='+', help="CSV or Parquet order event files")
+    update.add_argument('--customer-id', default='CustomerID')
+    update.add_argument('--date', default='InvoiceDate')
+    update.add_argument('--amount', default='Amount')
+    update.add_argument('--coupon', default=None, help="Coupons used per order (count or flag)")
+    update.add_argument('--cashback', default=None, help="Cashback amount per order")
+    update.add_argument('--complain', default=None, help="Complaint flag per order")
+    update.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    export = sub.add_parser('export', help="Write RFM and app inputs per customer")
+    export.add_argument('output', help="CSV or Parquet file to write")
+    export.add_argument('--observation-end', default=None,
+                        help="End of the observation period (default: last event day)")
+
+    for command in (update, export):
+        command.add_argument('--state', default=DEFAULT_STATE_PATH, help="Saved aggregator state (.npz)")
+    args = parser.parse_args(argv)
+
+    try:
+        accumulator = RFMAccumulator.load_or_new(args.state)
+        if args.command == 'update':
+            for path in args.events:
+                fold_file(accumulator, path, args.customer_id, args.date, args.amount or None,
+                          args.coupon, args.cashback, args.complain, args.chunk_size)
+            accumulator.save(args.state)
+            print(f"Saved {len(accumulator)} customers ({accumulator.events} events) to {args.state}")
+        else:
+            if not len(accumulator):
+                raise RuntimeError(f"No events folded into {args.state} yet")
+            table = accumulator.summary(args.observation_end).join(
+                accumulator.user_inputs(args.observation_end))
+            if args.output.lower().endswith(('.parquet', '.pq')):
+                table.to_parquet(args.output)
+            else:
+                table.to_csv(args.output)
+            print(f"Wrote {len(table)} customers to {args.output}")
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
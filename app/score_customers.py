@@ -0,0 +1,210 @@
+"""Batch churn scoring for customer files.
+
+Reads a CSV or Parquet file with the columns collected by
+``get_user_inputs()`` in ``app.py``, runs each fixed-size chunk through the
+same feature logic and churn model as the app, and appends churn
+probability, predicted label and CLV per row to a CSV file. Only one chunk
+is held in memory at a time. After every chunk the progress is recorded
+next to the output, so an interrupted run can be resumed with ``--resume``.
+
+Usage:
+    python score_customers.py customers.csv scores.csv [--chunk-size 100000] [--resume]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from clv import calculate_clv
+from features import INPUT_DEFAULTS, engineer_features
+from forest_engine import load_forest
+from forest_grid import compile_forest
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Raw columns read from the input besides the optional ID column
+INPUT_COLUMNS = list(INPUT_DEFAULTS) + ['MonthlyCharges']
+
+
+def progress_path(output_path):
+    return f"{output_path}.progress.json"
+
+
+def read_progress(output_path):
+    try:
+        with open(progress_path(output_path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_progress(output_path, progress):
+    # Write-then-rename so a crash never leaves a truncated progress file
+    path = progress_path(output_path)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(progress, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def input_fingerprint(input_path):
+    stat = os.stat(input_path)
+    return {'path': os.path.abspath(input_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def iter_chunks(input_path, chunk_size, skip_rows=0, id_column=None, extra_columns=()):
+    """Yield DataFrames of at most ``chunk_size`` rows with only the needed columns."""
+    wanted = set(INPUT_COLUMNS) | set(extra_columns)
+    if id_column:
+        wanted.add(id_column)
+
+    if input_path.lower().endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Reading Parquet needs pyarrow: `pip install pyarrow`")
+        parquet = pq.ParquetFile(input_path)
+        columns = [name for name in parquet.schema_arrow.names if name in wanted]
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            if skip_rows >= batch.num_rows:
+                skip_rows -= batch.num_rows
+                continue
+            chunk = batch.to_pandas()
+            yield chunk.iloc[skip_rows:] if skip_rows else chunk
+            skip_rows = 0
+        return
+
+    reader = pd.read_csv(
+        input_path,
+        usecols=lambda name: name in wanted,
+        chunksize=chunk_size,
+        skiprows=range(1, skip_rows + 1) if skip_rows else None,
+    )
+    for chunk in reader:
+        yield chunk
+
+
+def score_columns(forest, columns):
+    """Score raw input columns (a DataFrame or a mapping of equal-length arrays).
+
+    Returns:
+        dict: ``churn_probability``, ``churn_label`` and ``clv`` arrays.
+    """
+    features = engineer_features(columns)
+    labels, proba = forest.predict_with_proba(features)
+    churn_prob = proba[:, list(forest.classes_).index(1)] if 1 in forest.classes_ else proba[:, -1]
+
+    monthly = columns.get('MonthlyCharges')
+    if monthly is not None:
+        monthly = pd.to_numeric(pd.Series(monthly), errors='coerce').to_numpy(dtype=np.float64)
+    else:
+        monthly = np.full(len(features), np.nan)
+
+    return {
+        'churn_probability': churn_prob,
+        'churn_label': labels,
+        # Same CLV as the app's CLV tab: annual revenue, 10% discount rate
+        'clv': calculate_clv(monthly * 12, churn_prob),
+    }
+
+
+def score_chunk(forest, chunk, id_column=None):
+    """Score one chunk and return the output rows."""
+    result = pd.DataFrame(score_columns(forest, chunk))
+    if id_column and id_column in chunk.columns:
+        result.insert(0, id_column, chunk[id_column].to_numpy())
+    return result
+
+
+def score_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, model_path=None,
+               id_column='CustomerID', resume=False, log=print):
+    """Score ``input_path`` into ``output_path`` chunk by chunk.
+
+    Returns:
+        dict: Final progress record with ``rows_done`` and ``rows_per_sec``.
+    """
+    fingerprint = input_fingerprint(input_path)
+    progress = read_progress(output_path) if resume else None
+    if progress is not None:
+        if progress['input'] != fingerprint or progress['chunk_size'] != chunk_size:
+            raise RuntimeError(
+                "Cannot resume: the input file or chunk size changed since the interrupted run"
+            )
+        if progress.get('complete'):
+            log(f"Nothing to do: {output_path} is already complete ({progress['rows_done']} rows)")
+            return progress
+        # Drop anything written after the last completed chunk
+        with open(output_path, 'r+b') as f:
+            f.truncate(progress['output_bytes'])
+        log(f"Resuming after chunk {progress['chunks_done']} ({progress['rows_done']} rows)")
+    else:
+        progress = {
+            'input': fingerprint,
+            'output': os.path.abspath(output_path),
+            'chunk_size': chunk_size,
+            'chunks_done': 0,
+            'rows_done': 0,
+            'output_bytes': 0,
+            'complete': False,
+        }
+        open(output_path, 'wb').close()
+        write_progress(output_path, progress)
+
+    forest = compile_forest(load_forest(model_path))
+    log(f"Scoring with {forest.describe()}")
+    start = time.perf_counter()
+    rows_this_run = 0
+    with open(output_path, 'ab') as out:
+        for chunk in iter_chunks(input_path, chunk_size, progress['rows_done'], id_column):
+            chunk_start = time.perf_counter()
+            result = score_chunk(forest, chunk, id_column)
+            result.to_csv(out, header=progress['output_bytes'] == 0, index=False)
+            out.flush()
+            os.fsync(out.fileno())
+
+            progress['chunks_done'] += 1
+            progress['rows_done'] += len(result)
+            progress['output_bytes'] = out.tell()
+            write_progress(output_path, progress)
+
+            rows_this_run += len(result)
+            elapsed = time.perf_counter() - chunk_start
+            log(f"Chunk {progress['chunks_done']}: {len(result)} rows "
+                f"({len(result) / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+    elapsed = time.perf_counter() - start
+    progress['complete'] = True
+    progress['rows_per_sec'] = rows_this_run / max(elapsed, 1e-9)
+    write_progress(output_path, progress)
+    log(f"Scored {rows_this_run} rows in {elapsed:.2f}s "
+        f"({progress['rows_per_sec']:,.0f} rows/sec); {progress['rows_done']} rows total")
+    return progress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a customer file with the churn model.")
+    parser.add_argument('input', help="CSV or Parquet file with the app's customer columns")
+    parser.add_argument('output', help="CSV file to write scores to")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--model', default=None,
+                        help="Model artifact directory or pickle (default: the app's model)")
+    parser.add_argument('--id-column', default='CustomerID',
+                        help="Column copied to the output to identify rows (if present)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from its last completed chunk")
+    args = parser.parse_args(argv)
+
+    try:
+        score_file(args.input, args.output, chunk_size=args.chunk_size, model_path=args.model,
+                   id_column=args.id_column, resume=args.resume)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,570 @@
+"""Coordinator/worker cluster that spreads one batch scoring job across hosts.
+
+The coordinator plans the job exactly like ``partitioned_scorer.py`` (byte
+ranges of a CSV, row groups of a Parquet file, one manifest) and hands the
+partitions to workers over TCP, one at a time. Workers load the model
+artifact once, score each partition with ``score_partition()`` and write
+its Parquet file straight to the output directory, so the input and output
+paths must be visible at the same location on every host (NFS or similar
+shared storage). Only small JSON control messages cross the network.
+
+The protocol is one JSON object per line:
+
+- worker -> coordinator: ``hello`` (name, host, pid, model version),
+  ``ready``, ``heartbeat``, ``result`` and ``error``.
+- coordinator -> worker: ``welcome`` (heartbeat interval), ``reject``,
+  ``task``, ``wait`` and ``done``.
+
+Workers send a heartbeat every ``--heartbeat-interval`` seconds from a
+background thread while they score. A worker that disconnects, or stays
+silent longer than ``--heartbeat-timeout``, is dropped and its partition
+goes back to the front of the queue; a partition that fails
+``MAX_ATTEMPTS`` times fails the job. Partitions running much longer than
+the median are reported as stragglers, and the final report (also stored
+in the manifest under ``cluster``) lists rows, busy time and throughput
+per worker. Workers whose model hash differs from the coordinator's are
+rejected. There is no authentication: bind the coordinator to a trusted
+network only.
+
+``local`` runs the coordinator plus N worker processes on this machine,
+talking over real TCP sockets, for testing and for single-box runs.
+
+Usage:
+    python scoring_cluster.py coordinator customers.csv scores_dir [--host 0.0.0.0] [--port 7070]
+        [--resume]
+    python scoring_cluster.py worker coordinator-host:7070 [--name node-1]
+    python scoring_cluster.py local customers.csv scores_dir [--workers 4]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+import partitioned_scorer
+from partitioned_scorer import (DEFAULT_MEMORY_CAP_BYTES, DEFAULT_PARTITION_BYTES, prepare_job,
+                                record_result, score_partition, write_manifest)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7070
+
+# Seconds between worker heartbeats, and the silence after which a worker
+# is considered dead and its partition re-queued
+DEFAULT_HEARTBEAT_INTERVAL = 1.0
+DEFAULT_HEARTBEAT_TIMEOUT = 10.0
+
+# A partition running this many times longer than the median is a straggler
+STRAGGLER_FACTOR = 3.0
+
+# Completed partitions needed before straggler detection starts
+MIN_STRAGGLER_SAMPLES = 3
+
+# Tries per partition (first run included) before the job fails
+MAX_ATTEMPTS = 3
+
+# Seconds an idle worker waits before asking again while the last
+# partitions are still running elsewhere
+WAIT_SECONDS = 0.5
+
+# Largest control message accepted, in bytes
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+
+def _encode(message):
+    return (json.dumps(message) + '\n').encode()
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"Expected HOST:PORT, got {address!r}")
+    return host, int(port)
+
+
+class WorkerState:
+    """What the coordinator knows about one connected worker."""
+
+    def __init__(self, worker_id, hello, writer):
+        self.id = worker_id
+        self.name = hello.get('name') or f"worker-{worker_id}"
+        self.host = hello.get('host')
+        self.pid = hello.get('pid')
+        self.writer = writer
+        self.connected_at = self.last_seen = time.monotonic()
+        self.current = None
+        self.task_started = None
+        self.partitions = self.rows = self.failures = 0
+        self.busy_seconds = 0.0
+        self.lost = None
+
+    def report(self):
+        return {
+            'name': self.name,
+            'host': self.host,
+            'pid': self.pid,
+            'partitions': self.partitions,
+            'rows': self.rows,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'rows_per_sec': round(self.rows / self.busy_seconds) if self.busy_seconds else 0,
+            'failures': self.failures,
+            'lost': self.lost,
+        }
+
+
+class Coordinator:
+    """Serves the partitions of one job to workers and tracks their progress.
+
+    Args:
+        model_version: Content hash of the model every worker must load.
+        job_options: Passed to ``partitioned_scorer.prepare_job()``
+            (``memory_cap``, ``partition_bytes``, ``chunk_rows``,
+            ``id_column``, ``resume``).
+    """
+
+    def __init__(self, input_path, output_dir, model_version, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL,
+                 heartbeat_timeout=DEFAULT_HEARTBEAT_TIMEOUT, straggler_factor=STRAGGLER_FACTOR,
+                 max_attempts=MAX_ATTEMPTS, log=print, **job_options):
+        self.input_path = input_path
+        self.output_dir = output_dir
+        self.model_version = model_version
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.straggler_factor = straggler_factor
+        self.max_attempts = max_attempts
+        self.log = log
+        self.job_options = job_options
+        self.workers = {}
+        self.pending = deque()
+        self.tasks = {}
+        self.running = {}
+        self.attempts = {}
+        self.durations = []
+        self.stragglers = {}
+        self.requeued = 0
+        self.error = None
+        self._next_id = 0
+        self._server = None
+        self._reaper = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.manifest, tasks = prepare_job(self.input_path, self.output_dir, self.model_version,
+                                           log=self.log, **self.job_options)
+        self.tasks = {task['index']: task for task in tasks}
+        self.pending.extend(tasks)
+        self.finished = asyncio.Event()
+        self.started = time.monotonic()
+        self._server = await asyncio.start_server(self._handle_connection, host, port,
+                                                  limit=MAX_MESSAGE_BYTES)
+        self._reaper = asyncio.create_task(self._watch())
+        if not tasks:
+            self._finish()
+        self.log(f"Coordinator listening on {self.address[0]}:{self.address[1]}")
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def wait(self):
+        """Wait for the job to finish, then tell workers and stop serving."""
+        await self.finished.wait()
+        # Idle workers learn the job is done on their next request
+        deadline = time.monotonic() + WAIT_SECONDS * 4
+        while any(w.lost is None for w in self.workers.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(WAIT_SECONDS / 5)
+        await self.stop()
+        if self.error:
+            raise RuntimeError(self.error)
+        return self.manifest['cluster']
+
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for worker in self.workers.values():
+            worker.writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        worker = None
+        try:
+            hello = json.loads(await reader.readline() or 'null')
+            if not isinstance(hello, dict) or hello.get('type') != 'hello':
+                return
+            if hello.get('model_version') != self.model_version:
+                writer.write(_encode({'type': 'reject', 'reason': (
+                    f"model {hello.get('model_version')} does not match the job's {self.model_version}")}))
+                await writer.drain()
+                self.log(f"Rejected {hello.get('name')}: different model artifact")
+                return
+            self._next_id += 1
+            worker = self.workers[self._next_id] = WorkerState(self._next_id, hello, writer)
+            self.log(f"Worker {worker.name} joined ({worker.host}, pid {worker.pid})")
+            self._send(worker, {'type': 'welcome', 'heartbeat_interval': self.heartbeat_interval})
+
+            while worker.lost is None:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                worker.last_seen = time.monotonic()
+                kind = message.get('type')
+                if kind == 'result':
+                    self._complete(worker, message['result'])
+                elif kind == 'error':
+                    self._fail(worker, message.get('partition'), message.get('error'))
+                if kind in ('ready', 'result', 'error'):
+                    self._assign(worker)
+                await writer.drain()
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            if worker is not None:
+                self._lose(worker, 'disconnected')
+            writer.close()
+
+    def _send(self, worker, message):
+        worker.writer.write(_encode(message))
+
+    def _assign(self, worker):
+        if self.finished.is_set():
+            self._send(worker, {'type': 'done'})
+        elif self.pending:
+            task = self.pending.popleft()
+            index = task['index']
+            self.attempts[index] = self.attempts.get(index, 0) + 1
+            self.running[index] = worker.id
+            worker.current, worker.task_started = index, time.monotonic()
+            self._send(worker, {'type': 'task', 'task': task})
+        else:
+            self._send(worker, {'type': 'wait', 'seconds': WAIT_SECONDS})
+
+    def _release(self, worker):
+        index, worker.current = worker.current, None
+        if index is not None and self.running.get(index) == worker.id:
+            del self.running[index]
+            return index
+        return None
+
+    def _complete(self, worker, result):
+        index = result['index']
+        seconds = result['seconds']
+        self._release(worker)
+        worker.busy_seconds += seconds
+        if self.manifest['partitions'][index]['done']:
+            # A re-queued partition finished twice; score_partition() kept
+            # the first file published and the first result stands
+            return
+        worker.partitions += 1
+        worker.rows += result['rows']
+        self.durations.append(seconds)
+        record_result(self.output_dir, self.manifest, result)
+        self.manifest['partitions'][index]['worker'] = worker.name
+        done = sum(p['done'] for p in self.manifest['partitions'])
+        self.log(f"Partition {index}: {result['rows']:,} rows in {seconds:.2f}s on {worker.name} "
+                 f"({done}/{len(self.manifest['partitions'])} done)")
+        if done == len(self.manifest['partitions']):
+            self._finish()
+
+    def _fail(self, worker, index, error):
+        worker.failures += 1
+        if worker.current is not None and worker.task_started is not None:
+            worker.busy_seconds += time.monotonic() - worker.task_started
+        index = self._release(worker)
+        self.log(f"Partition {index} failed on {worker.name}: {error}")
+        if index is not None:
+            self._requeue(index, error)
+
+    def _lose(self, worker, reason):
+        if worker.lost is not None:
+            return
+        worker.lost = reason
+        worker.writer.close()
+        index = self._release(worker)
+        if self.finished.is_set():
+            return
+        self.log(f"Lost worker {worker.name}: {reason}")
+        if index is not None:
+            self._requeue(index, f"worker {worker.name} lost ({reason})")
+
+    def _requeue(self, index, reason):
+        if self.attempts.get(index, 0) >= self.max_attempts:
+            self.error = f"Partition {index} failed {self.attempts[index]} times; last error: {reason}"
+            self._finish()
+            return
+        self.requeued += 1
+        self.pending.appendleft(self.tasks[index])
+        self.log(f"Re-queued partition {index}")
+
+    async def _watch(self):
+        # Drops silent workers and flags stragglers
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            for worker in list(self.workers.values()):
+                if worker.lost is None and now - worker.last_seen > self.heartbeat_timeout:
+                    self._lose(worker, f"no heartbeat for {now - worker.last_seen:.1f}s")
+            if len(self.durations) < MIN_STRAGGLER_SAMPLES:
+                continue
+            median = statistics.median(self.durations)
+            for worker in self.workers.values():
+                if worker.current is None or worker.lost is not None:
+                    continue
+                elapsed = now - worker.task_started
+                if elapsed > self.straggler_factor * median and worker.current not in self.stragglers:
+                    self.stragglers[worker.current] = worker.name
+                    self.log(f"Straggler: partition {worker.current} on {worker.name} running "
+                             f"{elapsed:.1f}s, median partition {median:.2f}s")
+
+    def _finish(self):
+        if self.finished.is_set():
+            return
+        self.manifest['complete'] = self.error is None
+        self.manifest['cluster'] = self.report()
+        write_manifest(self.output_dir, self.manifest)
+        self.finished.set()
+
+    def report(self):
+        """Throughput per worker and the partitions that straggled."""
+        elapsed = time.monotonic() - self.started
+        rows = sum(worker.rows for worker in self.workers.values())
+        median = statistics.median(self.durations) if self.durations else 0.0
+        stragglers = []
+        for part in self.manifest['partitions']:
+            seconds = part.get('seconds')
+            slow = (seconds is not None and len(self.durations) >= MIN_STRAGGLER_SAMPLES
+                    and seconds > self.straggler_factor * median)
+            if slow or part['index'] in self.stragglers:
+                stragglers.append({
+                    'partition': part['index'],
+                    'worker': self.stragglers.get(part['index'], part.get('worker')),
+                    'seconds': seconds,
+                    'finished_by': part.get('worker'),
+                })
+        return {
+            'rows': rows,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(rows / elapsed) if elapsed else 0,
+            'median_partition_seconds': round(median, 3),
+            'requeued': self.requeued,
+            'workers': [worker.report() for worker in self.workers.values()],
+            'stragglers': stragglers,
+        }
+
+
+class _Connection:
+    """Line-delimited JSON over a blocking socket; sends are thread-safe."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            self.sock.sendall(_encode(message))
+
+    def receive(self):
+        line = self.reader.readline(MAX_MESSAGE_BYTES)
+        return json.loads(line) if line else None
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+def run_worker(address, model_path=None, name=None, log=print):
+    """Score partitions handed out by the coordinator at ``address`` until the job is done.
+
+    Returns:
+        int: Partitions scored by this worker.
+    """
+    from forest_engine import load_forest
+    from forest_grid import compile_forest
+    from model_artifact import content_hash
+
+    forest = load_forest(model_path)
+    model_version = content_hash(forest)
+    partitioned_scorer._worker['forest'] = compile_forest(forest)
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+
+    connection = _Connection(socket.create_connection(parse_address(address)))
+    connection.send({'type': 'hello', 'name': name, 'host': socket.gethostname(), 'pid': os.getpid(),
+                     'model_version': model_version})
+    welcome = connection.receive()
+    if welcome is None or welcome.get('type') != 'welcome':
+        connection.close()
+        reason = welcome.get('reason') if welcome else 'connection closed'
+        raise RuntimeError(f"Coordinator rejected {name}: {reason}")
+
+    current = [None]
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(welcome['heartbeat_interval']):
+            try:
+                connection.send({'type': 'heartbeat', 'partition': current[0]})
+            except OSError:
+                return
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    scored = 0
+    try:
+        connection.send({'type': 'ready'})
+        while True:
+            message = connection.receive()
+            if message is None:
+                raise RuntimeError("Coordinator closed the connection")
+            kind = message['type']
+            if kind == 'done':
+                break
+            if kind == 'wait':
+                time.sleep(message['seconds'])
+                connection.send({'type': 'ready'})
+                continue
+            task = message['task']
+            current[0] = task['index']
+            try:
+                result = score_partition(task)
+            except Exception as e:
+                connection.send({'type': 'error', 'partition': task['index'], 'error': str(e)})
+            else:
+                scored += 1
+                connection.send({'type': 'result', 'result': result})
+            current[0] = None
+    finally:
+        stop.set()
+        connection.close()
+    log(f"{name}: scored {scored} partitions")
+    return scored
+
+
+def _print_report(report, log=print):
+    log(f"Scored {report['rows']:,} rows in {report['seconds']:.2f}s ({report['rows_per_sec']:,} rows/sec), "
+        f"{report['requeued']} partitions re-queued")
+    for worker in report['workers']:
+        lost = f", lost: {worker['lost']}" if worker['lost'] and worker['lost'] != 'disconnected' else ''
+        log(f"  {worker['name']:<24} {worker['partitions']:>4} partitions {worker['rows']:>12,} rows "
+            f"{worker['rows_per_sec']:>10,} rows/sec busy {worker['busy_seconds']:.1f}s{lost}")
+    for straggler in report['stragglers']:
+        if straggler['finished_by'] and straggler['finished_by'] != straggler['worker']:
+            rerun = f", re-run on {straggler['finished_by']} in {straggler['seconds']:.2f}s"
+        else:
+            rerun = f", {straggler['seconds'] or 0:.2f}s"
+        log(f"  straggler: partition {straggler['partition']} on {straggler['worker']}{rerun} "
+            f"(median {report['median_partition_seconds']:.2f}s)")
+
+
+async def run_coordinator(input_path, output_dir, host=DEFAULT_HOST, port=DEFAULT_PORT, model_path=None,
+                          local_workers=0, log=print, **options):
+    """Run a coordinator until the job completes; optionally spawn local workers.
+
+    Returns:
+        dict: The cluster report.
+    """
+    from forest_engine import load_forest
+    from model_artifact import content_hash
+
+    coordinator = Coordinator(input_path, output_dir, content_hash(load_forest(model_path)), log=log,
+                              **options)
+    await coordinator.start(host, port)
+    processes = []
+    address = '{}:{}'.format(*coordinator.address)
+    for i in range(local_workers):
+        command = [sys.executable, os.path.abspath(__file__), 'worker', address, '--name', f"local-{i}"]
+        if model_path:
+            command += ['--model', model_path]
+        processes.append(subprocess.Popen(command))
+    try:
+        if processes:
+            waiter = asyncio.create_task(coordinator.wait())
+            while not waiter.done():
+                await asyncio.wait([waiter], timeout=WAIT_SECONDS)
+                if not waiter.done() and all(p.poll() is not None for p in processes):
+                    await coordinator.stop()
+                    waiter.cancel()
+                    raise RuntimeError("All local workers exited before the job finished")
+            report = waiter.result()
+        else:
+            report = await coordinator.wait()
+    finally:
+        for process in processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    _print_report(report, log)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spread a batch scoring job across worker processes and hosts.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    coordinator_parser = commands.add_parser('coordinator', help="Plan a job and hand partitions to workers")
+    coordinator_parser.add_argument('--host', default=DEFAULT_HOST,
+                                    help="Interface to listen on (0.0.0.0 for remote workers)")
+    coordinator_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    local_parser = commands.add_parser('local', help="Run a coordinator and workers on this machine")
+    local_parser.add_argument('--workers', type=int, default=None,
+                              help="Worker processes (default: one per CPU)")
+    for sub in (coordinator_parser, local_parser):
+        sub.add_argument('input', help="CSV or Parquet file on storage shared with the workers")
+        sub.add_argument('output', help="Shared directory for the Parquet partitions and manifest.json")
+        sub.add_argument('--memory-cap-mb', type=float, default=DEFAULT_MEMORY_CAP_BYTES / 2**20,
+                         help="Working memory per worker; sets the chunk size")
+        sub.add_argument('--chunk-rows', type=int, default=None,
+                         help="Rows per chunk (default: derived from the memory cap)")
+        sub.add_argument('--partition-mb', type=float, default=DEFAULT_PARTITION_BYTES / 2**20,
+                         help="Target CSV partition size")
+        sub.add_argument('--id-column', default='CustomerID',
+                         help="Column copied to the output to identify rows (if present)")
+        sub.add_argument('--heartbeat-interval', type=float, default=DEFAULT_HEARTBEAT_INTERVAL)
+        sub.add_argument('--heartbeat-timeout', type=float, default=DEFAULT_HEARTBEAT_TIMEOUT,
+                         help="Seconds of silence before a worker's partition is re-queued")
+        sub.add_argument('--resume', action='store_true',
+                         help="Score only the partitions an interrupted run did not finish")
+
+    worker_parser = commands.add_parser('worker', help="Score partitions for a coordinator")
+    worker_parser.add_argument('address', help="Coordinator HOST:PORT")
+    worker_parser.add_argument('--name', default=None, help="Worker name in reports (default: host-pid)")
+
+    for sub in (coordinator_parser, local_parser, worker_parser):
+        sub.add_argument('--model', default=None,
+                         help="Model artifact directory or pickle (default: the app's model)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'worker':
+            run_worker(args.address, model_path=args.model, name=args.name)
+            return 0
+        options = {
+            'memory_cap': int(args.memory_cap_mb * 2**20),
+            'partition_bytes': int(args.partition_mb * 2**20),
+            'chunk_rows': args.chunk_rows,
+            'id_column': args.id_column,
+            'resume': args.resume,
+            'heartbeat_interval': args.heartbeat_interval,
+            'heartbeat_timeout': args.heartbeat_timeout,
+        }
+        if args.command == 'local':
+            asyncio.run(run_coordinator(args.input, args.output, port=0, model_path=args.model,
+                                        local_workers=max(1, args.workers or os.cpu_count() or 1),
+                                        **options))
+        else:
+            asyncio.run(run_coordinator(args.input, args.output, host=args.host, port=args.port,
+                                        model_path=args.model, **options))
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,823 @@
+"""Asynchronous HTTP scoring service with dynamic micro-batching.
+
+Serves the churn model behind a small JSON API on asyncio streams (no web
+framework needed):
+
+- ``POST /predict``: one customer as a JSON object, in the columns collected
+  by ``get_user_inputs()`` in ``app.py`` (missing columns take the
+  defaults from ``features.INPUT_DEFAULTS``).
+- ``POST /predict/batch``: ``{"records": [...]}`` with many customers.
+- ``POST /explain``: one customer's prediction plus per-feature SHAP
+  contributions.
+- ``GET /metrics``: p50/p99 latency, throughput, batch sizes, and shed,
+  degraded and coalesced request counts.
+- ``GET /health``: liveness and the model's content hash.
+
+Requests that arrive together are coalesced: the batcher takes the first
+waiting request, then keeps collecting until ``max_batch_size`` rows are
+queued or ``max_wait_ms`` has passed, and scores all of them with one
+vectorized ``score_columns()`` call from ``score_customers.py``, so the
+service returns exactly what batch scoring would. Scoring runs on a single
+worker thread while the event loop keeps reading the next batch.
+
+Under spikes the service protects itself in two ways. Concurrent identical
+``/predict`` or ``/explain`` requests are collapsed into one computation
+by ``singleflight.SingleFlight``. Each request class then passes a bounded
+``AdmissionQueue``: when too many requests of the class are pending, or the
+oldest has waited longer than the class's latency threshold, predictions
+are shed with 503 and Retry-After, while explanations degrade to factors
+from the model's ``feature_importances_`` instead of queueing behind SHAP.
+
+Usage:
+    python scoring_service.py serve [--port 8000] [--max-batch-size 64] [--max-wait-ms 2]
+    python scoring_service.py loadtest [--url http://127.0.0.1:8000] [--concurrency 64] [--requests 20000]
+        [--endpoint explain] [--distinct 10]
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from features import engineer_features
+from score_customers import INPUT_COLUMNS, score_columns
+from singleflight import SingleFlight
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+
+# Rows scored per model call, and how long the first request of a batch
+# waits for company
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 2.0
+
+# Limits on a single request
+MAX_BODY_BYTES = 8 * 1024 * 1024
+MAX_BATCH_RECORDS = 10_000
+MAX_HEADER_BYTES = 16 * 1024
+
+# Latencies kept for the percentiles in /metrics, and the window the
+# recent throughput is measured over
+LATENCY_WINDOW = 10_000
+THROUGHPUT_WINDOW_SECONDS = 10.0
+
+# Admission limits per request class: requests (or batch rows) pending at
+# once, and how long the oldest pending one may have waited before new
+# arrivals are turned away
+DEFAULT_MAX_PENDING = {'predict': 4096, 'explain': 32}
+DEFAULT_MAX_LATENCY_MS = {'predict': 250.0, 'explain': 500.0}
+
+# SHAP computations run at once
+DEFAULT_EXPLAIN_WORKERS = 1
+
+RETRY_AFTER_SECONDS = 1
+
+ID_COLUMN = 'CustomerID'
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """A client error answered with ``status`` and a JSON error message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Overloaded(RequestError):
+    """Raised when an admission queue turns a request away."""
+
+    def __init__(self, request_class, reason):
+        super().__init__(503, f"Overloaded: {request_class} requests are being shed ({reason})")
+        self.request_class = request_class
+        self.reason = reason
+
+
+class ServiceMetrics:
+    """Request latencies, throughput and batch sizes of a running service."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.monotonic()
+        self.latencies = deque(maxlen=window)
+        self.finished = deque(maxlen=window)
+        self.requests = self.rows = self.errors = 0
+        self.batches = self.batch_rows = self.max_batch_rows = 0
+        self.score_seconds = 0.0
+        self.shed = Counter()
+        self.degraded = Counter()
+        self.coalesced = Counter()
+
+    def record_request(self, seconds, rows, error=False):
+        now = time.monotonic()
+        self.latencies.append(seconds)
+        self.finished.append(now)
+        self.requests += 1
+        self.rows += rows
+        self.errors += bool(error)
+
+    def record_batch(self, rows, seconds):
+        self.batches += 1
+        self.batch_rows += rows
+        self.max_batch_rows = max(self.max_batch_rows, rows)
+        self.score_seconds += seconds
+
+    def record_shed(self, request_class):
+        self.shed[request_class] += 1
+
+    def record_degraded(self, request_class):
+        self.degraded[request_class] += 1
+
+    def record_coalesced(self, request_class):
+        self.coalesced[request_class] += 1
+
+    def snapshot(self):
+        now = time.monotonic()
+        uptime = now - self.started
+        window = min(THROUGHPUT_WINDOW_SECONDS, uptime)
+        recent = len(self.finished) - np.searchsorted(np.fromiter(self.finished, float), now - window)
+        p50 = p99 = None
+        if self.latencies:
+            p50, p99 = np.percentile(np.fromiter(self.latencies, float), [50, 99]) * 1e3
+        return {
+            'uptime_seconds': round(uptime, 3),
+            'requests': self.requests,
+            'rows': self.rows,
+            'errors': self.errors,
+            'latency_ms': {'p50': p50, 'p99': p99, 'samples': len(self.latencies)},
+            'throughput': {
+                'requests_per_sec': recent / window if window > 0 else 0.0,
+                'rows_per_sec_total': self.rows / uptime if uptime > 0 else 0.0,
+            },
+            'batches': {
+                'count': self.batches,
+                'mean_rows': self.batch_rows / self.batches if self.batches else 0.0,
+                'max_rows': self.max_batch_rows,
+                'score_ms_mean': 1e3 * self.score_seconds / self.batches if self.batches else 0.0,
+            },
+            'shed': dict(self.shed),
+            'degraded': dict(self.degraded),
+            'coalesced': dict(self.coalesced),
+        }
+
+
+class AdmissionQueue:
+    """Bounded admission for one class of requests.
+
+    A request is turned away when admitting it would exceed ``max_pending``
+    or when the oldest pending request has waited over ``max_latency_ms``.
+    The age check clears itself as the backlog drains, unlike an average of
+    past latencies that stops updating once everything is shed.
+    """
+
+    def __init__(self, name, max_pending, max_latency_ms=None, max_concurrency=None):
+        self.name = name
+        self.max_pending = max(1, int(max_pending))
+        self.max_latency = max_latency_ms / 1e3 if max_latency_ms else None
+        self.pending = 0
+        self.rejected = Counter()
+        self._arrivals = OrderedDict()
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    def overload_reason(self, weight=1):
+        """Why a request of ``weight`` would be turned away now, or None."""
+        # A single oversized request is still admitted into an empty queue
+        if self.pending and self.pending + weight > self.max_pending:
+            return 'queue full'
+        if self.max_latency is not None and self._arrivals:
+            if time.monotonic() - next(iter(self._arrivals.values())) > self.max_latency:
+                return 'latency'
+        return None
+
+    @asynccontextmanager
+    async def admit(self, weight=1):
+        """Hold a place in the queue (and a concurrency slot) for the block.
+
+        Raises:
+            Overloaded: If the request is turned away.
+        """
+        reason = self.overload_reason(weight)
+        if reason is not None:
+            self.rejected[reason] += 1
+            raise Overloaded(self.name, reason)
+        token = object()
+        self._arrivals[token] = time.monotonic()
+        self.pending += weight
+        try:
+            if self._semaphore is not None:
+                async with self._semaphore:
+                    yield
+            else:
+                yield
+        finally:
+            del self._arrivals[token]
+            self.pending -= weight
+
+    def stats(self):
+        oldest = None
+        if self._arrivals:
+            oldest = 1e3 * (time.monotonic() - next(iter(self._arrivals.values())))
+        return {
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'oldest_ms': oldest,
+            'max_latency_ms': self.max_latency * 1e3 if self.max_latency is not None else None,
+            'rejected': dict(self.rejected),
+        }
+
+
+class MicroBatcher:
+    """Coalesces concurrent scoring requests into vectorized model calls."""
+
+    def __init__(self, score_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, metrics=None):
+        self.score_fn = score_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1e3
+        self.metrics = metrics or ServiceMetrics()
+        self._queue = None
+        self._task = None
+        # One scoring thread: batches are scored in order while the event
+        # loop parses the requests of the next one
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scoring')
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, records):
+        """Score a list of records and return one result dict per record."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((records, future))
+        return await future
+
+    async def _collect(self):
+        # The first request opens the batch; later ones join until it is
+        # full or the wait runs out
+        batch = [await self._queue.get()]
+        rows = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_size:
+            if self._queue.empty():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            batch.append(item)
+            rows += len(item[0])
+        return batch, rows
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch, rows = await self._collect()
+            records = [record for item, _ in batch for record in item]
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self.score_fn, records)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.metrics.record_batch(rows, time.perf_counter() - start)
+            offset = 0
+            for item, future in batch:
+                if not future.done():
+                    future.set_result(results[offset:offset + len(item)])
+                offset += len(item)
+
+
+def make_scorer(forest):
+    """Return a function scoring a list of record dicts with ``forest``."""
+
+    def score(records):
+        result = score_columns(forest, {name: _column(records, name) for name in INPUT_COLUMNS})
+        columns = {name: values.tolist() for name, values in result.items()}
+        rows = []
+        for i, record in enumerate(records):
+            row = {name: _json_value(values[i]) for name, values in columns.items()}
+            if record.get(ID_COLUMN) is not None:
+                row[ID_COLUMN] = record[ID_COLUMN]
+            rows.append(row)
+        return rows
+
+    return score
+
+
+def _column(records, name):
+    # Plain numbers (and None for missing) convert in one call; strings such
+    # as "Yes" go through the feature code's own parsing
+    values = [record.get(name) for record in records]
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array(values, dtype=object)
+
+
+def _input_key(record):
+    # Records with the same model inputs get the same result; the ID is
+    # not part of the key
+    return tuple(record.get(name) for name in INPUT_COLUMNS)
+
+
+def _with_id(result, record):
+    row = {name: value for name, value in result.items() if name != ID_COLUMN}
+    if record.get(ID_COLUMN) is not None:
+        row[ID_COLUMN] = record[ID_COLUMN]
+    return row
+
+
+def _json_value(value):
+    # NaN (e.g. CLV without MonthlyCharges) is not valid JSON
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _check_record(record):
+    if not isinstance(record, dict):
+        raise RequestError(400, "Each record must be a JSON object")
+    for name in INPUT_COLUMNS:
+        value = record.get(name)
+        if value is not None and not isinstance(value, (int, float, str)):
+            raise RequestError(400, f"{name} must be a number")
+    return record
+
+
+class ScoringService:
+    """HTTP front end of a MicroBatcher."""
+
+    def __init__(self, forest, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 model_version=None, metrics=None, max_pending=None, max_latency_ms=None,
+                 explain_workers=DEFAULT_EXPLAIN_WORKERS):
+        self.forest = forest
+        self.model_version = model_version
+        self.metrics = metrics or ServiceMetrics()
+        self.batcher = MicroBatcher(make_scorer(forest), max_batch_size, max_wait_ms, self.metrics)
+        self.singleflight = SingleFlight()
+        max_pending = {**DEFAULT_MAX_PENDING, **(max_pending or {})}
+        max_latency_ms = {**DEFAULT_MAX_LATENCY_MS, **(max_latency_ms or {})}
+        self.admission = {
+            'predict': AdmissionQueue('predict', max_pending['predict'], max_latency_ms['predict']),
+            'explain': AdmissionQueue('explain', max_pending['explain'], max_latency_ms['explain'],
+                                      max_concurrency=explain_workers),
+        }
+        self._explain_executor = ThreadPoolExecutor(max_workers=explain_workers,
+                                                    thread_name_prefix='explain')
+        self.server = None
+        self.warmed = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, sock=None):
+        """Start serving on ``host:port``, or on an already bound ``sock``."""
+        self.batcher.start()
+        # Importing SHAP and building the explainer takes seconds; do it
+        # now on the explain thread rather than inside the first request
+        self.warmed = asyncio.get_running_loop().run_in_executor(self._explain_executor, self.warm_explainer)
+        if sock is not None:
+            self.server = await asyncio.start_server(self._handle_connection, sock=sock,
+                                                     limit=MAX_HEADER_BYTES)
+        else:
+            self.server = await asyncio.start_server(self._handle_connection, host, port,
+                                                     limit=MAX_HEADER_BYTES)
+        return self.server
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+        self._explain_executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self):
+        """Service metrics plus the state of the admission queues and the singleflight."""
+        snapshot = self.metrics.snapshot()
+        snapshot['admission'] = {name: queue.stats() for name, queue in self.admission.items()}
+        snapshot['singleflight'] = self.singleflight.stats()
+        return snapshot
+
+    async def predict_one(self, record):
+        """Score one record, sharing the work with identical concurrent requests."""
+        async def score():
+            async with self.admission['predict'].admit():
+                return (await self.batcher.submit([record]))[0]
+
+        result, shared = await self.singleflight.do(('predict', _input_key(record)), score)
+        if shared:
+            self.metrics.record_coalesced('predict')
+        return _with_id(result, record)
+
+    async def predict_batch(self, records):
+        async with self.admission['predict'].admit(len(records)):
+            return await self.batcher.submit(records)
+
+    async def explain_one(self, record):
+        """Prediction plus feature contributions for one record.
+
+        SHAP runs on its own thread pool behind the ``explain`` admission
+        queue. When that queue is overloaded, or SHAP is not installed, the
+        contributions fall back to the model's global feature importances.
+        """
+        async def explain():
+            x = self.forest.as_array(engineer_features(record))
+            try:
+                async with self.admission['explain'].admit():
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._explain_executor, self._shap_factors, x)
+            except Overloaded as e:
+                return self._importance_factors(x, e.reason)
+            except ImportError:
+                return self._importance_factors(x, 'shap is not installed')
+
+        prediction, (explanation, shared) = await asyncio.gather(
+            self.predict_one(record), self.singleflight.do(('explain', _input_key(record)), explain)
+        )
+        if shared:
+            self.metrics.record_coalesced('explain')
+        if explanation['degraded']:
+            self.metrics.record_degraded('explain')
+        return {**prediction, 'explanation': explanation}
+
+    def warm_explainer(self):
+        """Build the SHAP explainer ahead of the first /explain; False without SHAP."""
+        from explain import get_explainer
+
+        try:
+            get_explainer(self.forest, self.model_version)
+        except ImportError:
+            return False
+        return True
+
+    def _shap_factors(self, x):
+        from explain import get_explainer, positive_class
+
+        explainer = get_explainer(self.forest, self.model_version)
+        classes = self.forest.classes_
+        values = positive_class(explainer.shap_values(x), classes)[0]
+        expected = positive_class(explainer.expected_value, classes)
+        return {
+            'method': 'shap',
+            'degraded': False,
+            'expected_value': float(np.ravel(expected)[0]),
+            'factors': _factors(self.forest, x[0], values),
+        }
+
+    def _importance_factors(self, x, reason):
+        importances = getattr(self.forest, 'feature_importances_', None)
+        if importances is None:
+            importances = np.full(x.shape[1], 1.0 / x.shape[1])
+        return {
+            'method': 'feature_importances',
+            'degraded': True,
+            'reason': reason,
+            'factors': _factors(self.forest, x[0], importances),
+        }
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                start = time.perf_counter()
+                status, payload, rows = await self._dispatch(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if path.startswith(('/predict', '/explain')):
+                    self.metrics.record_request(time.perf_counter() - start, rows, error=status != 200)
+                if not keep_alive:
+                    break
+        except RequestError as e:
+            _write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        try:
+            path = path.split('?', 1)[0]
+            if path == '/predict':
+                _require(method, 'POST')
+                record = _check_record(_parse_json(body))
+                return 200, await self.predict_one(record), 1
+            if path == '/predict/batch':
+                _require(method, 'POST')
+                payload = _parse_json(body)
+                records = payload.get('records') if isinstance(payload, dict) else payload
+                if not isinstance(records, list) or not records:
+                    raise RequestError(400, "Expected {\"records\": [...]} with at least one record")
+                if len(records) > MAX_BATCH_RECORDS:
+                    raise RequestError(413, f"At most {MAX_BATCH_RECORDS} records per request")
+                records = [_check_record(record) for record in records]
+                return 200, {'predictions': await self.predict_batch(records)}, len(records)
+            if path == '/explain':
+                _require(method, 'POST')
+                record = _check_record(_parse_json(body))
+                return 200, await self.explain_one(record), 1
+            if path == '/metrics':
+                _require(method, 'GET')
+                return 200, self.snapshot(), 0
+            if path == '/health':
+                _require(method, 'GET')
+                return 200, {'status': 'ok', 'model_version': self.model_version}, 0
+            raise RequestError(404, f"No route for {path}")
+        except Overloaded as e:
+            self.metrics.record_shed(e.request_class)
+            return e.status, {'error': str(e)}, 0
+        except RequestError as e:
+            return e.status, {'error': str(e)}, 0
+        except Exception as e:
+            return 500, {'error': str(e)}, 0
+
+
+def _factors(forest, x, weights):
+    # Features ordered by the size of their contribution
+    names = getattr(forest, 'feature_names', None) or [f"Feature{i + 1}" for i in range(len(x))]
+    order = np.argsort(-np.abs(weights), kind='stable')
+    return [{'feature': names[i], 'value': float(x[i]), 'contribution': float(weights[i])} for i in order]
+
+
+def _require(method, expected):
+    if method != expected:
+        raise RequestError(405, f"Use {expected}")
+
+
+def _parse_json(body):
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise RequestError(400, "Body is not valid JSON")
+
+
+async def _read_request(reader):
+    """Read one HTTP/1.1 request; None when the client closed the connection."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise RequestError(400, "Incomplete request")
+        return None
+    except asyncio.LimitOverrunError:
+        raise RequestError(413, "Request headers too large")
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, path, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise RequestError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY_BYTES:
+        raise RequestError(413, f"Body over {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), path, headers, body
+
+
+def _write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    headers = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", "Content-Type: application/json",
+               f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    if status == 503:
+        headers.append(f"Retry-After: {RETRY_AFTER_SECONDS}")
+    head = '\r\n'.join(headers) + '\r\n\r\n'
+    writer.write(head.encode('latin-1') + body)
+
+
+def load_service(model_path=None, **kwargs):
+    """ScoringService over the app's churn model (or ``model_path``)."""
+    from forest_engine import load_forest
+    from forest_grid import compile_forest
+    from model_artifact import content_hash
+
+    forest = load_forest(model_path)
+    return ScoringService(compile_forest(forest), model_version=content_hash(forest), **kwargs)
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, model_path=None, log=print, **kwargs):
+    service = load_service(model_path, **kwargs)
+    await service.start(host, port)
+    log(f"Serving {service.forest.describe()} on http://{host}:{service.address[1]} "
+        f"(max batch {service.batcher.max_batch_size}, max wait {service.batcher.max_wait * 1e3:g} ms)")
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.stop()
+
+
+# Load test ---------------------------------------------------------------
+
+def sample_records(n, seed=0):
+    """Random customers spanning the app's input ranges."""
+    rng = np.random.default_rng(seed)
+    columns = {
+        'Tenure': rng.integers(0, 73, n),
+        'SatisfactionScore': rng.integers(1, 6, n),
+        'OrderCount': rng.integers(0, 101, n),
+        'CouponUsed': rng.integers(0, 51, n),
+        'CashbackAmount': rng.uniform(0, 300, n).round(2),
+        'Complain': rng.integers(0, 2, n),
+        'MonthlyCharges': rng.uniform(20, 120, n).round(2),
+    }
+    columns = {name: values.tolist() for name, values in columns.items()}
+    return [{name: columns[name][i] for name in columns} for i in range(n)]
+
+
+async def _request(reader, writer, host, method, path, body=b''):
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body)
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    return status, await reader.readexactly(length)
+
+
+async def load_test(url, concurrency=64, n_requests=20_000, batch_rows=1, seed=0, endpoint='predict',
+                    distinct=1000):
+    """Drive ``url`` with ``concurrency`` keep-alive clients.
+
+    Each client sends requests back to back; with ``batch_rows > 1`` they go
+    to ``/predict/batch``. Requests cycle through ``distinct`` different
+    customers, so a small value sends many identical concurrent requests.
+
+    Returns:
+        dict: Client-side latency percentiles, throughput and the server's /metrics.
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname or DEFAULT_HOST, parts.port or 80
+    records = sample_records(max(1, distinct), seed)
+    if endpoint == 'explain':
+        path = '/explain'
+        bodies = [json.dumps(record).encode('utf-8') for record in records]
+    elif batch_rows > 1:
+        path = '/predict/batch'
+        bodies = [json.dumps({'records': [records[(i + j) % len(records)] for j in range(batch_rows)]})
+                  .encode('utf-8') for i in range(0, len(records), batch_rows)]
+    else:
+        path = '/predict'
+        bodies = [json.dumps(record).encode('utf-8') for record in records]
+
+    latencies = []
+    statuses = Counter()
+    next_request = iter(range(n_requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in next_request:
+                start = time.perf_counter()
+                status, _ = await _request(reader, writer, host, 'POST', path, bodies[i % len(bodies)])
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await _request(reader, writer, host, 'GET', '/metrics')
+    writer.close()
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status != 200),
+        'shed': statuses[503],
+        'seconds': elapsed,
+        'requests_per_sec': len(latencies) / elapsed,
+        'rows_per_sec': len(latencies) * batch_rows / elapsed,
+        'latency_ms': {'p50': p50, 'p99': p99},
+        'server': json.loads(body),
+    }
+
+
+async def _run_load_test(args, log=print):
+    service = None
+    url = args.url
+    if url is None:
+        # No target given: serve in this process on a free port
+        service = load_service(args.model, **service_options(args))
+        await service.start(DEFAULT_HOST, 0)
+        # Keep the SHAP warm-up out of the measurement
+        await service.warmed
+        url = f"http://{DEFAULT_HOST}:{service.address[1]}"
+        log(f"Started {url} (max batch {args.max_batch_size}, max wait {args.max_wait_ms:g} ms)")
+    try:
+        report = await load_test(url, args.concurrency, args.requests, args.batch_rows,
+                                 endpoint=args.endpoint, distinct=args.distinct)
+    finally:
+        if service is not None:
+            await service.stop()
+    batches = report['server']['batches']
+    log(f"{report['requests']} requests from {args.concurrency} clients in {report['seconds']:.2f}s: "
+        f"{report['requests_per_sec']:,.0f} req/s, {report['rows_per_sec']:,.0f} rows/s, "
+        f"{report['errors']} errors ({report['shed']} shed)")
+    log(f"Client latency p50 {report['latency_ms']['p50']:.2f} ms, p99 {report['latency_ms']['p99']:.2f} ms; "
+        f"server batches: {batches['count']} (mean {batches['mean_rows']:.1f} rows, "
+        f"{batches['score_ms_mean']:.2f} ms each)")
+    server = report['server']
+    log(f"Coalesced: {server['coalesced']}; shed: {server['shed']}; degraded: {server['degraded']}")
+    return report
+
+
+def add_service_arguments(parser):
+    """Add the model, batching and admission options shared by the service CLIs."""
+    parser.add_argument('--model', default=None,
+                        help="Model artifact directory or pickle (default: the app's model)")
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help="Rows scored per model call")
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="How long a request waits for others to join its batch")
+    for name in ('predict', 'explain'):
+        parser.add_argument(f'--{name}-max-pending', type=int, default=DEFAULT_MAX_PENDING[name],
+                            help=f"{name.title()} requests pending before new ones are turned away")
+        parser.add_argument(f'--{name}-max-latency-ms', type=float, default=DEFAULT_MAX_LATENCY_MS[name],
+                            help=f"Oldest pending {name} request age that turns new ones away")
+    parser.add_argument('--explain-workers', type=int, default=DEFAULT_EXPLAIN_WORKERS,
+                        help="SHAP computations run at once")
+
+
+def service_options(args):
+    """ScoringService keyword arguments from parsed ``add_service_arguments()`` options."""
+    return {
+        'max_batch_size': args.max_batch_size,
+        'max_wait_ms': args.max_wait_ms,
+        'max_pending': {'predict': args.predict_max_pending, 'explain': args.explain_max_pending},
+        'max_latency_ms': {'predict': args.predict_max_latency_ms, 'explain': args.explain_max_latency_ms},
+        'explain_workers': args.explain_workers,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the churn model over HTTP with micro-batching.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="Run the scoring service")
+    serve_parser.add_argument('--host', default=DEFAULT_HOST)
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+
+    load_parser = commands.add_parser('loadtest', help="Load-test a running service")
+    load_parser.add_argument('--url', default=None,
+                             help="Service to test (default: start one in this process)")
+    load_parser.add_argument('--concurrency', type=int, default=64, help="Concurrent keep-alive clients")
+    load_parser.add_argument('--requests', type=int, default=20_000, help="Total requests")
+    load_parser.add_argument('--batch-rows', type=int, default=1,
+                             help="Records per request; over 1 uses /predict/batch")
+    load_parser.add_argument('--endpoint', choices=['predict', 'explain'], default='predict')
+    load_parser.add_argument('--distinct', type=int, default=1000,
+                             help="Different customers the requests cycle through")
+
+    for sub in (serve_parser, load_parser):
+        add_service_arguments(sub)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'serve':
+            asyncio.run(serve(args.host, args.port, args.model, **service_options(args)))
+        else:
+            asyncio.run(_run_load_test(args))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Incremental re-scoring of one customer as inputs change.
+
+Moving a single sidebar slider usually changes one engineered feature, yet
+a full prediction walks every tree from the root. A ScoringSession keeps
+the leaf each tree currently lands in plus the summed leaf probabilities.
+When features change it re-walks only the trees that split on one of them,
+and patches the sum with the difference between old and new leaves.
+
+The app uses a session only when ``compile_forest()`` falls back to tree
+traversal because the forest's threshold grid would exceed its memory
+cap; a compiled grid answers in a single table lookup and needs no
+session.
+"""
+import weakref
+
+import numpy as np
+
+# Recompute the probability sum from scratch after this many updates so
+# floating point error from in-place patching cannot build up.
+RESYNC_EVERY = 1000
+
+_feature_tree_cache = weakref.WeakKeyDictionary()
+
+
+def feature_tree_index(forest):
+    """For every feature, the ids of the trees that split on it (cached per forest)."""
+    index = _feature_tree_cache.get(forest)
+    if index is None:
+        is_split = ~forest.is_leaf
+        tree_of_node = np.repeat(np.arange(forest.n_trees), np.diff(np.append(forest.roots, forest.n_nodes)))
+        index = [
+            np.unique(tree_of_node[is_split & (forest.feature == feature)])
+            for feature in range(forest.n_features_in_)
+        ]
+        _feature_tree_cache[forest] = index
+    return index
+
+
+class ScoringSession:
+    """Scores one customer and updates the score incrementally."""
+
+    def __init__(self, forest, x):
+        # Sessions work on the tree arrays; unwrap a CompiledForest
+        self.forest = getattr(forest, 'forest', forest)
+        self.feature_trees = feature_tree_index(self.forest)
+        self.x = self._as_row(x)
+        self.leaves = self.forest.apply(self.x[None, :])[0]
+        self.resync()
+        self.trees_walked = self.forest.n_trees
+
+    def _as_row(self, x):
+        return self.forest.as_array(x)[0].copy()
+
+    def resync(self):
+        """Recompute the probability sum from the cached leaves."""
+        self.proba_sum = np.take(self.forest.value, self.leaves, axis=0).sum(axis=0)
+        self.updates_since_resync = 0
+
+    def _walk(self, trees):
+        forest = self.forest
+        nodes = np.take(forest.roots, trees)
+        children = forest.children.ravel()
+        for _ in range(int(forest.tree_depth[trees].max())):
+            go_left = np.take(self.x, np.take(forest.feature, nodes)) <= np.take(forest.threshold, nodes)
+            nodes = np.take(children, 2 * nodes + go_left)
+        return nodes
+
+    def update(self, x):
+        """Move to new feature values, re-walking only the affected trees.
+
+        Returns:
+            int: Number of trees that were re-walked.
+        """
+        x = self._as_row(x)
+        changed = np.flatnonzero(x != self.x)
+        self.x = x
+        if len(changed) == 0:
+            self.trees_walked = 0
+            return 0
+
+        if len(changed) == 1:
+            trees = self.feature_trees[changed[0]]
+        else:
+            trees = np.unique(np.concatenate([self.feature_trees[f] for f in changed]))
+        self.trees_walked = len(trees)
+        if len(trees) == 0:
+            return 0
+
+        new_leaves = self._walk(trees)
+        old_leaves = self.leaves[trees]
+        moved = new_leaves != old_leaves
+        if moved.any():
+            self.proba_sum += np.take(self.forest.value, new_leaves[moved], axis=0).sum(axis=0)
+            self.proba_sum -= np.take(self.forest.value, old_leaves[moved], axis=0).sum(axis=0)
+            self.leaves[trees[moved]] = new_leaves[moved]
+
+        self.updates_since_resync += 1
+        if self.updates_since_resync >= RESYNC_EVERY:
+            self.resync()
+        return len(trees)
+
+    def set_feature(self, feature, value):
+        """Change a single feature (by index or name) and update the score."""
+        if not isinstance(feature, (int, np.integer)):
+            feature = self.forest.feature_names.index(feature)
+        x = self.x.copy()
+        x[feature] = value
+        return self.update(x)
+
+    def predict_proba(self):
+        return (self.proba_sum / self.forest.n_trees)[None, :]
+
+    def predict_with_proba(self):
+        """Return ``(labels, probabilities)`` shaped like FlatForest.predict_with_proba."""
+        proba = self.predict_proba()
+        return self.forest.classes_[np.argmax(proba, axis=1)], proba
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from forest_engine import load_forest
+
+    forest = load_forest(sys.argv[1] if len(sys.argv) > 1 else None)
+    rng = np.random.default_rng(0)
+    x = rng.random(forest.n_features_in_, dtype=np.float32)
+    session = ScoringSession(forest, x)
+
+    repeats = 2000
+    values = rng.random(repeats, dtype=np.float32)
+    start = time.perf_counter()
+    walked = 0
+    for value in values:
+        walked += session.set_feature(0, value)
+    incremental = (time.perf_counter() - start) / repeats
+
+    x[0] = values[-1]
+    assert np.allclose(session.predict_proba(), forest.predict_proba(x[None, :]))
+    start = time.perf_counter()
+    for value in values:
+        x[0] = value
+        forest.predict_with_proba(x[None, :])
+    full = (time.perf_counter() - start) / repeats
+
+    print(f"Trees: {forest.n_trees}, re-walked per update: {walked / repeats:.1f}")
+    print(f"Full re-score: {full * 1e6:.1f} us, incremental update: {incremental * 1e6:.1f} us")
@@ -0,0 +1,347 @@
+"""Customer segmentation and personas.
+
+Segments are learned from the whole customer base instead of hard-coded
+thresholds: MiniBatchKMeans is fitted on the engineered features of a
+customer file, one chunk at a time (``partial_fit``), so the file never
+has to fit in memory. A second pass assigns every customer and caches
+per-segment statistics (size, observed and predicted churn rate, mean
+raw inputs and the most common rule-based persona, which names the
+segment). Centroids and statistics are saved as JSON.
+
+Assignment is plain NumPy: millions of customers in vectorized batches,
+or a single customer in a few microseconds with the same centroids and no
+sklearn import. Without a fitted segmentation the app falls back to the
+original rules in ``rule_persona()``.
+
+Usage:
+    python segmentation.py fit customers.csv [--clusters 8] [--output segments.json]
+    python segmentation.py assign customers.csv segments.csv [--segments segments.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_NAMES, engineer_features, extract_inputs
+from score_customers import iter_chunks
+
+DEFAULT_SEGMENTS_PATH = os.path.join(os.path.dirname(__file__), 'segments.json')
+
+FORMAT_VERSION = 1
+
+DEFAULT_CLUSTERS = 8
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Customers assigned per vectorized batch
+ASSIGN_BATCH_ROWS = 1 << 16
+
+# Raw inputs averaged per segment for display
+PROFILE_COLUMNS = ['Tenure', 'SatisfactionScore', 'OrderCount', 'CouponUsed', 'CashbackAmount',
+                   'Complain']
+
+PERSONAS = {
+    'balanced': {
+        'type': 'Balanced Customer',
+        'description': 'This customer shows moderate engagement with your services.',
+        'strategies': [
+            'Monitor engagement metrics for changes',
+            'Offer personalized recommendations',
+            'Request feedback to improve experience'
+        ]
+    },
+    'new': {
+        'type': 'New Customer',
+        'description': 'This is a new customer who may need onboarding support.',
+        'strategies': [
+            'Provide comprehensive onboarding',
+            'Schedule a check-in call',
+            'Offer a welcome discount on next purchase'
+        ]
+    },
+    'at_risk': {
+        'type': 'At-Risk Customer',
+        'description': 'This customer has expressed low satisfaction and may be at risk of churn.',
+        'strategies': [
+            'Reach out to understand their concerns',
+            'Offer personalized support',
+            'Provide a special discount or perk'
+        ]
+    },
+    'power_user': {
+        'type': 'Power User',
+        'description': 'This customer is highly engaged with your services.',
+        'strategies': [
+            'Offer loyalty rewards',
+            'Provide exclusive early access to new features',
+            'Request testimonials or referrals'
+        ]
+    },
+}
+PERSONA_KEYS = list(PERSONAS)
+
+
+def rule_persona_codes(inputs):
+    """Index into ``PERSONA_KEYS`` of the rule-based persona of every customer."""
+    return np.select(
+        [inputs['Tenure'] < 3, inputs['SatisfactionScore'] < 3, inputs['OrderCount'] > 50],
+        [PERSONA_KEYS.index('new'), PERSONA_KEYS.index('at_risk'), PERSONA_KEYS.index('power_user')],
+        default=PERSONA_KEYS.index('balanced'),
+    )
+
+
+def rule_persona(user_inputs):
+    """Persona from the hard-coded rules on tenure, satisfaction and orders."""
+    key = 'balanced'
+    # Check if we have the expected features
+    if 'Tenure' in user_inputs and 'SatisfactionScore' in user_inputs and 'OrderCount' in user_inputs:
+        key = PERSONA_KEYS[int(rule_persona_codes(extract_inputs(user_inputs))[0])]
+    return dict(PERSONAS[key], strategies=list(PERSONAS[key]['strategies']))
+
+
+def churn_labels(values):
+    """Observed churn as floats (1/0, NaN when unknown) from Yes/No or numeric labels."""
+    text = pd.Series(np.asarray(values).ravel()).astype(str).str.strip().str.lower()
+    flags = text.map({'yes': 1.0, 'no': 0.0, 'true': 1.0, 'false': 0.0})
+    return flags.fillna(pd.to_numeric(text, errors='coerce')).to_numpy(dtype=np.float64)
+
+
+class Segmenter:
+    """Nearest-centroid assignment with cached per-segment statistics."""
+
+    def __init__(self, centroids, feature_names=FEATURE_NAMES, segments=None, info=None):
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.feature_names = list(feature_names)
+        self.segments = segments or [{} for _ in range(len(self.centroids))]
+        self.info = info or {}
+        self._squared_norms = (self.centroids ** 2).sum(axis=1)
+        # Plain tuples for the single-customer path, which avoids NumPy overhead
+        self._rows = [tuple(map(float, row)) for row in self.centroids]
+
+    @property
+    def n_segments(self):
+        return len(self.centroids)
+
+    def assign(self, X, batch_rows=ASSIGN_BATCH_ROWS):
+        """Nearest centroid of every row of ``X`` (n_rows x n_features)."""
+        X = np.asarray(X, dtype=np.float64)
+        labels = np.empty(len(X), dtype=np.int32)
+        for start in range(0, len(X), batch_rows):
+            batch = X[start:start + batch_rows]
+            # ||x - c||^2 without the ||x||^2 term, which is the same for every centroid
+            distances = batch @ (-2.0 * self.centroids.T)
+            distances += self._squared_norms
+            labels[start:start + batch_rows] = distances.argmin(axis=1)
+        return labels
+
+    def assign_one(self, x):
+        """Nearest centroid of one customer's feature vector."""
+        x = [float(v) for v in x]
+        best, best_distance = 0, float('inf')
+        for i, row in enumerate(self._rows):
+            distance = 0.0
+            for value, center in zip(x, row):
+                distance += (value - center) * (value - center)
+            if distance < best_distance:
+                best, best_distance = i, distance
+        return best
+
+    def persona(self, segment):
+        """Persona dict for ``segment``, with its cached statistics."""
+        stats = self.segments[segment]
+        base = PERSONAS[stats.get('persona', 'balanced')]
+        return dict(base, strategies=list(base['strategies']), segment=dict(stats, id=segment))
+
+    def to_dict(self):
+        return {
+            'format_version': FORMAT_VERSION,
+            'feature_names': self.feature_names,
+            'centroids': self.centroids.tolist(),
+            'segments': self.segments,
+            'info': self.info,
+        }
+
+    def save(self, path=DEFAULT_SEGMENTS_PATH):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_SEGMENTS_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('format_version') != FORMAT_VERSION:
+            raise RuntimeError(f"{path} was written by an incompatible version of segmentation.py")
+        return cls(data['centroids'], data['feature_names'], data['segments'], data.get('info'))
+
+
+def generate_persona(user_inputs, segmenter=None, features=None):
+    """Persona for one customer: their segment's if a segmentation is given, else the rules.
+
+    Args:
+        user_inputs: Raw inputs as returned by ``get_user_inputs()``.
+        segmenter: Fitted Segmenter, or None for the rule-based persona.
+        features: The customer's engineered features, if already computed.
+    """
+    if segmenter is None:
+        return rule_persona(user_inputs)
+    if features is None:
+        features = engineer_features(user_inputs, dtype=np.float64)[0]
+    return segmenter.persona(segmenter.assign_one(features))
+
+
+def _segment_stats(counts, churned, labelled, predicted, sums, persona_counts):
+    total = max(int(counts.sum()), 1)
+    segments = []
+    for k in range(len(counts)):
+        size = int(counts[k])
+        segments.append({
+            'size': size,
+            'share': size / total,
+            'churn_rate': float(churned[k] / labelled[k]) if labelled[k] else None,
+            'predicted_churn': float(predicted[k] / size) if size else None,
+            'mean_inputs': {name: float(sums[k, i] / size) if size else None
+                            for i, name in enumerate(PROFILE_COLUMNS)},
+            'persona': PERSONA_KEYS[int(persona_counts[k].argmax())],
+        })
+    return segments
+
+
+def fit_segments(input_path, n_clusters=DEFAULT_CLUSTERS, chunk_size=DEFAULT_CHUNK_SIZE,
+                 model_path=None, churn_column='Churn', seed=0, log=print):
+    """Fit segments on a customer file and compute their statistics.
+
+    Returns:
+        Segmenter
+    """
+    try:
+        from sklearn.cluster import MiniBatchKMeans
+    except ImportError:
+        raise RuntimeError("Fitting segments needs scikit-learn: `pip install scikit-learn`")
+    from forest_engine import load_forest
+
+    start = time.perf_counter()
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, n_init=3)
+    rows = 0
+    pending = None
+    for chunk in iter_chunks(input_path, chunk_size):
+        X = engineer_features(chunk, dtype=np.float64)
+        # partial_fit needs at least n_clusters rows in its first batch
+        pending = X if pending is None else np.vstack([pending, X])
+        if len(pending) >= n_clusters:
+            kmeans.partial_fit(pending)
+            rows += len(pending)
+            pending = None
+    if rows == 0:
+        raise RuntimeError(f"Need at least {n_clusters} customers to fit {n_clusters} segments")
+    if pending is not None:
+        kmeans.partial_fit(pending)
+        rows += len(pending)
+    log(f"Fitted {n_clusters} segments on {rows} customers in {time.perf_counter() - start:.2f}s")
+
+    segmenter = Segmenter(kmeans.cluster_centers_, FEATURE_NAMES)
+    forest = load_forest(model_path)
+    churn_index = list(forest.classes_).index(1) if 1 in forest.classes_ else -1
+    counts = np.zeros(n_clusters)
+    churned = np.zeros(n_clusters)
+    labelled = np.zeros(n_clusters)
+    predicted = np.zeros(n_clusters)
+    sums = np.zeros((n_clusters, len(PROFILE_COLUMNS)))
+    persona_counts = np.zeros((n_clusters, len(PERSONA_KEYS)))
+    extra = [churn_column] if churn_column else []
+    for chunk in iter_chunks(input_path, chunk_size, extra_columns=extra):
+        inputs = extract_inputs(chunk)
+        X = engineer_features(inputs, dtype=np.float64)
+        labels = segmenter.assign(X)
+        counts += np.bincount(labels, minlength=n_clusters)
+        predicted += np.bincount(labels, weights=forest.predict_proba(X)[:, churn_index],
+                                 minlength=n_clusters)
+        if churn_column in chunk.columns:
+            observed = churn_labels(chunk[churn_column])
+            known = ~np.isnan(observed)
+            churned += np.bincount(labels[known], weights=observed[known], minlength=n_clusters)
+            labelled += np.bincount(labels[known], minlength=n_clusters)
+        for i, name in enumerate(PROFILE_COLUMNS):
+            sums[:, i] += np.bincount(labels, weights=inputs[name], minlength=n_clusters)
+        codes = rule_persona_codes(inputs)
+        persona_counts += np.bincount(labels * len(PERSONA_KEYS) + codes,
+                                      minlength=n_clusters * len(PERSONA_KEYS)
+                                      ).reshape(n_clusters, len(PERSONA_KEYS))
+
+    segmenter.segments = _segment_stats(counts, churned, labelled, predicted, sums, persona_counts)
+    segmenter.info = {
+        'customers': int(counts.sum()),
+        'input': os.path.abspath(input_path),
+        'fitted_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seconds': time.perf_counter() - start,
+    }
+    return segmenter
+
+
+def assign_file(segmenter, input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE,
+                id_column='CustomerID', log=print):
+    """Write the segment and persona of every customer of ``input_path`` to CSV."""
+    start = time.perf_counter()
+    rows = 0
+    names = np.array([PERSONAS[s.get('persona', 'balanced')]['type'] for s in segmenter.segments])
+    with open(output_path, 'w', newline='') as out:
+        for chunk in iter_chunks(input_path, chunk_size, id_column=id_column):
+            labels = segmenter.assign(engineer_features(chunk, dtype=np.float64))
+            result = pd.DataFrame({'segment': labels, 'persona': names[labels]})
+            if id_column and id_column in chunk.columns:
+                result.insert(0, id_column, chunk[id_column].to_numpy())
+            result.to_csv(out, header=rows == 0, index=False)
+            rows += len(result)
+    elapsed = time.perf_counter() - start
+    log(f"Assigned {rows} customers in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit customer segments and assign personas.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    fit = sub.add_parser('fit', help="Fit segments on a customer file")
+    fit.add_argument('input', help="CSV or Parquet file with the app's customer columns")
+    fit.add_argument('--clusters', type=int, default=DEFAULT_CLUSTERS)
+    fit.add_argument('--output', default=DEFAULT_SEGMENTS_PATH, help="JSON file for centroids and stats")
+    fit.add_argument('--churn-column', default='Churn', help="Observed churn label column (if present)")
+    fit.add_argument('--model', default=None,
+                     help="Model artifact directory or pickle (default: the app's model)")
+    fit.add_argument('--seed', type=int, default=0)
+
+    assign = sub.add_parser('assign', help="Assign every customer of a file to a segment")
+    assign.add_argument('input', help="CSV or Parquet file with the app's customer columns")
+    assign.add_argument('output', help="CSV file to write segments to")
+    assign.add_argument('--segments', default=DEFAULT_SEGMENTS_PATH)
+    assign.add_argument('--id-column', default='CustomerID')
+
+    for command in (fit, assign):
+        command.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'fit':
+            segmenter = fit_segments(args.input, args.clusters, args.chunk_size, args.model,
+                                     args.churn_column, args.seed)
+            segmenter.save(args.output)
+            for k, stats in enumerate(segmenter.segments):
+                churn = stats['churn_rate'] if stats['churn_rate'] is not None else stats['predicted_churn']
+                print(f"  Segment {k}: {stats['size']} customers ({stats['share']:.1%}), "
+                      f"churn {churn or 0:.1%}, {PERSONAS[stats['persona']]['type']}")
+            print(f"Saved segments to {args.output}")
+        else:
+            segmenter = Segmenter.load(args.segments)
+            assign_file(segmenter, args.input, args.output, args.chunk_size, args.id_column)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
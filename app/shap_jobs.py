@@ -0,0 +1,147 @@
+"""Background SHAP jobs shared by all Streamlit sessions.
+
+SHAP values are computed on a small thread pool that lives for the whole
+server process, so a slow explanation never blocks a script run. Jobs are
+keyed by model version and feature vector; a request for a job that is
+already queued, running or recently finished returns the same job instead
+of starting another one.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Worker threads shared by every session
+DEFAULT_MAX_WORKERS = 2
+
+# Jobs allowed to wait or run at once; further submissions are refused
+DEFAULT_MAX_PENDING = 16
+
+# Finished jobs kept so reruns and other sessions can pick up the result
+DEFAULT_MAX_FINISHED = 64
+
+# Seconds the SHAP tab waits before showing a cheaper attribution
+DEFAULT_TIME_BUDGET = float(os.environ.get('SHAP_TIME_BUDGET_SECONDS', 5.0))
+
+# Seconds between reruns of the SHAP tab while a job is running
+POLL_INTERVAL = 0.25
+
+
+class ShapJob:
+    """One submitted computation and its state."""
+
+    def __init__(self, key):
+        self.key = key
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def state(self):
+        if self.future.done():
+            return 'failed' if self.future.exception() is not None else 'done'
+        return 'running' if self.started_at is not None else 'queued'
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+    def error(self):
+        return self.future.exception() if self.future.done() else None
+
+    def elapsed(self):
+        end = self.finished_at or time.monotonic()
+        return end - self.submitted_at
+
+
+class ShapJobRunner:
+    """Bounded, deduplicating pool of background jobs."""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 max_finished=DEFAULT_MAX_FINISHED):
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shap')
+        self._lock = threading.Lock()
+        self._active = {}
+        self._finished = OrderedDict()
+        self.submitted = self.deduplicated = self.rejected = 0
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Return the job for ``key``, starting ``fn(*args, **kwargs)`` if there is none.
+
+        Returns:
+            ShapJob or None: None when the pool is full.
+        """
+        with self._lock:
+            job = self._active.get(key) or self._finished.get(key)
+            if job is not None:
+                self.deduplicated += 1
+                return job
+            if len(self._active) >= self.max_pending:
+                self.rejected += 1
+                return None
+
+            job = ShapJob(key)
+            self._active[key] = job
+            self.submitted += 1
+
+            def run():
+                job.started_at = time.monotonic()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    job.finished_at = time.monotonic()
+
+            job.future = self._executor.submit(run)
+        job.future.add_done_callback(lambda _: self._finish(job))
+        return job
+
+    def _finish(self, job):
+        with self._lock:
+            self._active.pop(job.key, None)
+            # Failed jobs are not kept so the next request retries them
+            if job.future.exception() is None:
+                self._finished[job.key] = job
+                while len(self._finished) > self.max_finished:
+                    self._finished.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            return self._active.get(key) or self._finished.get(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': len(self._active),
+                'finished': len(self._finished),
+                'submitted': self.submitted,
+                'deduplicated': self.deduplicated,
+                'rejected': self.rejected,
+            }
+
+
+def job_key(version, features):
+    """Key identifying a SHAP job: model version and float32 feature bytes."""
+    values = features.to_numpy() if hasattr(features, 'to_numpy') else features
+    return version, np.ascontiguousarray(values, dtype=np.float32).tobytes()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """Return the job runner shared by every session in this process."""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = ShapJobRunner()
+    return _runner
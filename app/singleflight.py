@@ -0,0 +1,68 @@
+"""Collapse concurrent identical requests into one computation.
+
+When many callers ask for the same thing at once (dashboard tiles polling
+the same customer, retries of a slow explanation), only the first caller,
+the leader, runs the computation; everyone arriving while it is in flight
+awaits the leader's result, or its exception, instead. Nothing is cached:
+once the computation finishes the key is released and the next caller
+starts a new one, so results are never staler than the request itself.
+"""
+import asyncio
+
+
+class SingleFlight:
+    """Deduplicates in-flight asyncio computations by key."""
+
+    def __init__(self):
+        self._flights = {}
+        self.calls = self.executed = self.coalesced = 0
+
+    async def do(self, key, factory):
+        """Return ``await factory()``, sharing one run among concurrent callers of ``key``.
+
+        Args:
+            key: Hashable identity of the computation.
+            factory: Zero-argument callable returning an awaitable; only
+                called by the leader.
+
+        Returns:
+            tuple: ``(result, shared)``, where ``shared`` is True for callers
+            that joined another caller's computation.
+        """
+        self.calls += 1
+        future = self._flights.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: a follower giving up must not cancel the leader's run
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        self.executed += 1
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an exception nobody joined is not logged
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._flights[key]
+
+    @property
+    def in_flight(self):
+        return len(self._flights)
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'in_flight': self.in_flight,
+        }
@@ -0,0 +1,84 @@
+"""Shared fixtures for the app's tests.
+
+The app modules are plain scripts that import their siblings directly, so
+the app directory is put on ``sys.path`` here. Tests train a small forest
+on synthetic customers instead of using the deployed model, whose
+predictions are constant.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+from features import FEATURE_NAMES, engineer_features  # noqa: E402
+from forest_engine import FlatForest  # noqa: E402
+
+
+def make_customers(n, seed=0):
+    """Raw customer inputs as collected by the app, with a CustomerID column."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'CustomerID': np.arange(n) + 1000,
+        'Tenure': rng.integers(0, 72, n),
+        'SatisfactionScore': rng.integers(1, 6, n),
+        'OrderCount': rng.integers(0, 60, n),
+        'CouponUsed': rng.integers(0, 20, n),
+        'CashbackAmount': rng.uniform(0, 320, n).round(2),
+        'Complain': rng.integers(0, 2, n),
+        'MonthlyCharges': rng.uniform(20, 120, n).round(2),
+    })
+
+
+def make_transactions(n_customers=400, seed=0):
+    """Repeat-purchase log with a few same-day duplicates."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2024-01-01')
+    rows = []
+    for customer in range(n_customers):
+        first = rng.integers(0, 300)
+        n = rng.poisson(3) + 1
+        days = first + np.sort(rng.integers(0, 365 - first, n))
+        days[0] = first
+        for day in days:
+            rows.append((f'C{customer}', start + pd.Timedelta(days=int(day)), float(rng.integers(10, 200))))
+    return pd.DataFrame(rows, columns=['CustomerID', 'InvoiceDate', 'Amount'])
+
+
+@pytest.fixture(scope='session')
+def sk_forest():
+    """A fitted sklearn RandomForestClassifier over the engineered features."""
+    from sklearn.ensemble import RandomForestClassifier
+
+    customers = make_customers(4000, seed=1)
+    X = pd.DataFrame(engineer_features(customers), columns=FEATURE_NAMES)
+    score = X['Feature1'] + X['Feature2'] - 0.5 * X['Feature3']
+    y = (score + np.random.default_rng(2).normal(0, 0.3, len(X)) > 0.8).astype(int)
+    return RandomForestClassifier(n_estimators=25, max_depth=6, random_state=0).fit(X, y)
+
+
+@pytest.fixture(scope='session')
+def forest(sk_forest):
+    return FlatForest.from_estimator(sk_forest)
+
+
+@pytest.fixture(scope='session')
+def artifact_dir(forest, tmp_path_factory):
+    """The test forest exported as a model artifact directory."""
+    from model_artifact import export_artifact
+
+    path = str(tmp_path_factory.mktemp('model') / 'churn_model')
+    export_artifact(forest, path)
+    return path
+
+
+@pytest.fixture
+def customers_csv(tmp_path):
+    path = tmp_path / 'customers.csv'
+    make_customers(2500, seed=3).to_csv(path, index=False)
+    return str(path)
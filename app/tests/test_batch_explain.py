@@ -0,0 +1,37 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_explain import explain_file
+from explain import get_explainer, positive_class
+from features import engineer_features
+from forest_engine import load_forest
+
+pytest.importorskip('shap')
+pytest.importorskip('pyarrow')
+
+
+def test_matches_explaining_the_whole_file_at_once(artifact_dir, customers_csv, tmp_path):
+    output = str(tmp_path / 'shap.parquet')
+    report = explain_file(customers_csv, output, chunk_size=600, model_path=artifact_dir,
+                          workers=2, log=lambda m: None)
+
+    customers = pd.read_csv(customers_csv)
+    forest = load_forest(artifact_dir)
+    X = engineer_features(customers)
+    expected = positive_class(get_explainer(forest).shap_values(X), forest.classes_)
+
+    result = pd.read_parquet(output)
+    assert len(result) == len(customers) == report['rows']
+    np.testing.assert_array_equal(result['CustomerID'], customers['CustomerID'])
+    shap_columns = [f'shap_{name}' for name in forest.feature_names]
+    np.testing.assert_allclose(result[shap_columns].to_numpy(), expected, atol=1e-12)
+    np.testing.assert_allclose(result['churn_probability'], forest.predict_proba(X)[:, 1])
+
+    with open(f"{output}.summary.json") as f:
+        summary = json.load(f)
+    for i, name in enumerate(forest.feature_names):
+        assert summary['mean_abs_shap'][name] == pytest.approx(np.abs(expected[:, i]).mean())
+    assert list(summary['mean_abs_shap'].values()) == sorted(summary['mean_abs_shap'].values(), reverse=True)
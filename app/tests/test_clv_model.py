@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from clv_model import CLVModel, collapse, summary_from_transactions
+from conftest import make_transactions
+
+lifetimes = pytest.importorskip('lifetimes')
+
+
+@pytest.fixture(scope='module')
+def transactions():
+    return make_transactions()
+
+
+@pytest.fixture(scope='module')
+def summary(transactions):
+    return summary_from_transactions(transactions, 'CustomerID', 'InvoiceDate', 'Amount')
+
+
+@pytest.fixture(scope='module')
+def model_summary():
+    """Customers drawn from a BG/NBD process, so the fit is well posed."""
+    from lifetimes.generate_data import beta_geometric_nbd_model
+
+    np.random.seed(0)
+    T = np.random.randint(30, 365, 2000).astype(np.float64)
+    data = beta_geometric_nbd_model(T=T, r=0.8, alpha=40.0, a=0.8, b=2.5, size=len(T))
+    summary = data[['frequency', 'recency', 'T']].round()
+    summary['monetary_value'] = np.where(summary['frequency'] > 0,
+                                         np.random.gamma(5.0, 10.0, len(T)).round(), 0.0)
+    return summary
+
+
+def test_summary_matches_lifetimes(transactions, summary):
+    from lifetimes.utils import summary_data_from_transaction_data
+
+    expected = summary_data_from_transaction_data(
+        transactions, 'CustomerID', 'InvoiceDate', monetary_value_col='Amount', freq='D'
+    )
+    pd.testing.assert_frame_equal(summary.sort_index(), expected[summary.columns].sort_index(),
+                                  check_names=False, check_dtype=False)
+
+
+def test_collapse_rebuilds_the_rows(summary):
+    tuples, weights, inverse = collapse(summary)
+    assert len(tuples) < len(summary) and weights.sum() == len(summary)
+    np.testing.assert_array_equal(tuples.to_numpy()[inverse], summary.to_numpy())
+
+
+def test_weighted_fit_and_predictions_match_lifetimes(model_summary):
+    from lifetimes import BetaGeoFitter, GammaGammaFitter
+
+    summary = model_summary
+    model = CLVModel.fit(summary)
+    bgf = BetaGeoFitter().fit(summary['frequency'], summary['recency'], summary['T'])
+    repeat = summary[summary['frequency'] > 0]
+    ggf = GammaGammaFitter().fit(repeat['frequency'], repeat['monetary_value'])
+    for name, value in model.bgnbd.items():
+        assert value == pytest.approx(bgf.params_[name], rel=1e-4)
+    for name, value in model.gamma_gamma.items():
+        assert value == pytest.approx(ggf.params_[name], rel=1e-3)
+
+    # Predictions are checked with identical parameters
+    bgf.params_ = pd.Series(model.bgnbd)
+    ggf.params_ = pd.Series(model.gamma_gamma)
+
+    predicted = model.predict(summary, months=6, monthly_discount_rate=0.01)
+    f, r, T, m = (summary[c] for c in ['frequency', 'recency', 'T', 'monetary_value'])
+    np.testing.assert_allclose(predicted['expected_purchases'],
+                               bgf.conditional_expected_number_of_purchases_up_to_time(180, f, r, T), rtol=1e-8)
+    np.testing.assert_allclose(predicted['probability_alive'], bgf.conditional_probability_alive(f, r, T),
+                               rtol=1e-8)
+    expected_clv = ggf.customer_lifetime_value(bgf, f, r, T, m, time=6, discount_rate=0.01, freq='D')
+    np.testing.assert_allclose(predicted['clv'], expected_clv, rtol=1e-8)
+
+
+def test_fit_or_load_skips_refitting_unchanged_data(model_summary, tmp_path, monkeypatch):
+    summary = model_summary
+    path = str(tmp_path / 'clv_params.json')
+    fitted = CLVModel.fit_or_load(summary, path)
+    monkeypatch.setattr(CLVModel, 'fit', classmethod(lambda cls, *a, **k: pytest.fail('refitted')))
+    shuffled = summary.sample(frac=1.0, random_state=0)
+    assert CLVModel.fit_or_load(shuffled, path).bgnbd == fitted.bgnbd
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from clv import calculate_clv, monthly_discount
+from clv_projection import monthly_churn, project_clv
+
+
+def loop_clv(revenue, churn, horizon, rate):
+    total, survival = 0.0, 1.0
+    for h in range(1, horizon + 1):
+        survival *= 1.0 - churn
+        total += revenue * survival / (1.0 + rate) ** h
+    return total
+
+
+@pytest.fixture(scope='module')
+def portfolio():
+    rng = np.random.default_rng(71)
+    return rng.gamma(2.0, 40.0, 5000), monthly_churn(rng.beta(2.0, 5.0, 5000), period_months=12)
+
+
+def test_matches_the_per_customer_loop(portfolio):
+    revenue, churn = portfolio
+    rate = monthly_discount(0.1)
+    projection = project_clv(revenue, churn, horizon=24, monthly_discount_rate=rate)
+    expected = [loop_clv(m, p, 24, rate) for m, p in zip(revenue[:300], churn[:300])]
+    np.testing.assert_allclose(projection.clv[:300], expected, rtol=1e-12)
+    assert projection.portfolio[-1] == pytest.approx(projection.clv.sum(), rel=1e-12)
+
+
+def test_chunking_and_sampling_do_not_change_totals(portfolio):
+    revenue, churn = portfolio
+    whole = project_clv(revenue, churn, horizon=36)
+    chunked = project_clv(revenue, churn, horizon=36, max_bytes=10_000, sample_size=1000)
+    np.testing.assert_allclose(chunked.clv, whole.clv, rtol=1e-12)
+    np.testing.assert_allclose(chunked.portfolio, whole.portfolio, rtol=1e-12)
+    assert whole.exact_bands and not chunked.exact_bands
+    assert chunked.bands[50][-1] == pytest.approx(whole.bands[50][-1], rel=0.1)
+
+
+def test_exact_bands_are_percentiles_of_the_customer_curves(portfolio):
+    revenue, churn = portfolio
+    revenue, churn = revenue[:200], churn[:200]
+    projection = project_clv(revenue, churn, horizon=6)
+    curves = np.column_stack([project_clv(revenue, churn, horizon=h).clv for h in range(1, 7)])
+    np.testing.assert_allclose(projection.bands[25], np.percentile(curves, 25, axis=0), rtol=1e-12)
+
+
+def test_long_horizon_converges_to_calculate_clv():
+    rate = monthly_discount(0.1)
+    projection = project_clv([100.0, 50.0], [0.05, 0.2], horizon=2000, monthly_discount_rate=rate)
+    expected = calculate_clv(np.array([100.0, 50.0]), np.array([0.05, 0.2]), discount_rate=rate)
+    np.testing.assert_allclose(projection.clv, expected, rtol=1e-9)
+
+
+def test_per_month_inputs_and_validation():
+    flat = project_clv([100.0], [0.1], horizon=3)
+    varying = project_clv([[100.0, 100.0, 100.0]], [[0.1, 0.1, 0.1]], horizon=3)
+    np.testing.assert_allclose(varying.clv, flat.clv)
+    with pytest.raises(ValueError):
+        project_clv([1.0, 2.0, 3.0], [0.1, 0.2], horizon=3)
+    assert monthly_churn(0.5, period_months=12) == pytest.approx(1 - 0.5 ** (1 / 12))
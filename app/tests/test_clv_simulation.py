@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from clv_projection import project_clv
+from clv_simulation import simulate_clv
+
+
+@pytest.fixture(scope='module')
+def customers():
+    rng = np.random.default_rng(81)
+    return rng.gamma(2.0, 40.0, 400), rng.uniform(0.01, 0.2, 400)
+
+
+def test_mean_matches_the_expected_projection(customers):
+    revenue, churn = customers
+    expected = project_clv(revenue, churn, horizon=24).clv
+    for revenue_cv in (0.0, 0.25):
+        result = simulate_clv(revenue, churn, horizon=24, paths=4000, revenue_cv=revenue_cv)
+        assert result.portfolio_mean == pytest.approx(expected.sum(), rel=0.01)
+        np.testing.assert_allclose(result.mean, expected, rtol=0.15)
+
+
+def test_reproducible_across_workers(customers):
+    revenue, churn = customers
+    options = dict(horizon=12, paths=200, seed=7, max_bytes=200 * 20 * 50)
+    inline = simulate_clv(revenue, churn, workers=1, **options)
+    pooled = simulate_clv(revenue, churn, workers=2, **options)
+    np.testing.assert_array_equal(inline.mean, pooled.mean)
+    np.testing.assert_array_equal(inline.quantiles, pooled.quantiles)
+    np.testing.assert_array_equal(inline.portfolio_paths, pooled.portfolio_paths)
+    assert not np.array_equal(simulate_clv(revenue, churn, workers=1, **{**options, 'seed': 8}).mean, inline.mean)
+
+
+def test_quantiles_are_ordered_and_bounded(customers):
+    revenue, churn = customers
+    result = simulate_clv(revenue, churn, horizon=12, paths=500, revenue_cv=0.0)
+    q = result.quantiles
+    assert (np.diff(q, axis=1) >= 0).all()
+    assert (q >= 0).all() and (q[:, -1] <= revenue * 12 + 1e-3).all()
+    frame = result.customers()
+    assert list(frame.columns) == ['clv_mean', 'clv_q5', 'clv_q50', 'clv_q95']
+    assert set(result.portfolio_quantiles()) == set(result.levels)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from conftest import make_customers
+from explain import (clear_explainers, explain_customer, get_explainer, model_version,
+                     positive_class, synthetic_neighbourhood)
+from features import FEATURE_NAMES, engineer_features, features_frame
+from forest_grid import compile_forest
+
+shap = pytest.importorskip('shap')
+
+
+def test_tree_shap_matches_shap_on_the_sklearn_model(sk_forest, forest):
+    X = engineer_features(make_customers(200, seed=51))
+    ours = positive_class(get_explainer(forest).shap_values(X), forest.classes_)
+    reference = positive_class(shap.TreeExplainer(sk_forest).shap_values(X), sk_forest.classes_)
+    np.testing.assert_allclose(ours, reference, atol=1e-9)
+    # Additivity: expected value plus contributions is the probability
+    expected = positive_class(get_explainer(forest).expected_value, forest.classes_)
+    np.testing.assert_allclose(expected + ours.sum(axis=1), forest.predict_proba(X)[:, 1], atol=1e-9)
+
+
+def test_explainer_is_cached_per_model_version(forest):
+    clear_explainers()
+    explainer = get_explainer(forest)
+    assert get_explainer(compile_forest(forest)) is explainer
+    assert get_explainer(forest, version='other') is not explainer
+    assert model_version(forest) == model_version(compile_forest(forest))
+
+
+def test_explain_customer_covers_the_neighbourhood(forest):
+    features = features_frame(make_customers(1, seed=52))
+    result = explain_customer(forest, features, n_samples=50)
+    assert result.method == 'tree'
+    assert result.values.shape == (51, len(FEATURE_NAMES))
+    assert list(result.data.columns) == FEATURE_NAMES
+    np.testing.assert_array_equal(result.data.iloc[0].to_numpy(), features.iloc[0].to_numpy())
+    proba = forest.predict_proba(result.data)[:, 1]
+    np.testing.assert_allclose(result.expected_value + result.values.sum(axis=1), proba, atol=1e-9)
+
+
+def test_neighbourhood_matches_the_per_feature_loop():
+    x = np.array([0.3, 0.0, 0.8])
+    np.random.seed(42)
+    expected = []
+    for value in x:
+        std = max(0.1, 0.2 * abs(value))
+        expected.append(np.clip(np.random.normal(value, std, 100), value - 3 * std, value + 3 * std))
+    np.testing.assert_allclose(synthetic_neighbourhood(x), np.column_stack(expected), rtol=1e-15)
+
+
+def test_path_contributions_add_up_to_the_probability(forest):
+    from explain import MAX_NODES_PER_STEP, path_contributions
+
+    X = engineer_features(make_customers(3 * MAX_NODES_PER_STEP // forest.n_trees + 7, seed=53))
+    bias, contributions = path_contributions(forest, X)
+    assert contributions.shape == (len(X), forest.n_features_in_)
+    np.testing.assert_allclose(bias + contributions.sum(axis=1), forest.predict_proba(X)[:, 1], atol=1e-12)
+    # Chunking does not change any row's result
+    single = path_contributions(forest, X[-5:])[1]
+    np.testing.assert_allclose(single, contributions[-5:], atol=1e-15)
+
+
+def test_path_method_is_cheap_and_additive(forest):
+    features = features_frame(make_customers(1, seed=54))
+    result = explain_customer(forest, features, method='path')
+    assert result.method == 'path'
+    proba = forest.predict_proba(result.data)[:, 1]
+    np.testing.assert_allclose(result.expected_value + result.values.sum(axis=1), proba, atol=1e-12)
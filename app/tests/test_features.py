@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from conftest import make_customers
+from features import FEATURE_NAMES, INPUT_DEFAULTS, engineer_features, features_frame
+
+
+def test_batch_matches_one_customer_at_a_time():
+    customers = make_customers(200, seed=21)
+    batch = engineer_features(customers)
+    rows = np.vstack([
+        engineer_features({name: row[name] for name in INPUT_DEFAULTS})
+        for _, row in customers.iterrows()
+    ])
+    np.testing.assert_array_equal(batch, rows)
+
+
+def test_missing_and_unparseable_inputs_use_defaults():
+    defaults = engineer_features({})
+    frame = pd.DataFrame({'Tenure': [np.nan, 'n/a'], 'Complain': ['', None]})
+    np.testing.assert_array_equal(engineer_features(frame), np.vstack([defaults, defaults]))
+
+
+def test_yes_no_flags_and_numeric_strings():
+    text = pd.DataFrame({'Complain': ['Yes', ' no ', 'TRUE'], 'Tenure': ['12', '12', '12']})
+    numeric = pd.DataFrame({'Complain': [1, 0, 1], 'Tenure': [12, 12, 12]})
+    np.testing.assert_array_equal(engineer_features(text), engineer_features(numeric))
+
+
+def test_features_frame_keeps_index_and_names():
+    customers = make_customers(5, seed=22).set_index('CustomerID')
+    frame = features_frame(customers)
+    assert list(frame.columns) == FEATURE_NAMES
+    assert frame.index.equals(customers.index)
+    assert frame.dtypes.eq(np.float32).all()
+    assert ((frame > 0) & (frame < 1.5)).all().all()
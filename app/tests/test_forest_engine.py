@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from conftest import make_customers
+from features import FEATURE_NAMES, engineer_features
+from forest_engine import TREE_AT_A_TIME_ROWS, FlatForest
+from model_artifact import reference_predict_proba
+
+
+def test_matches_sklearn(sk_forest, forest):
+    X = engineer_features(make_customers(3000, seed=5))
+    labels, proba = forest.predict_with_proba(X)
+    expected = reference_predict_proba(sk_forest, X)
+    np.testing.assert_allclose(proba, expected, rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(labels, sk_forest.classes_[np.argmax(expected, axis=1)])
+
+
+def test_small_and_large_batches_agree(forest):
+    X = engineer_features(make_customers(TREE_AT_A_TIME_ROWS * 2, seed=6))
+    batch = forest.predict_proba(X)
+    single = np.vstack([forest.predict_proba(X[i:i + 1]) for i in range(0, len(X), 97)])
+    np.testing.assert_array_equal(single, batch[::97])
+
+
+def test_thresholds_are_inclusive_on_the_left(sk_forest, forest):
+    # Rows sitting exactly on split thresholds go left, as in sklearn
+    split = ~forest.is_leaf
+    X = np.tile(np.float32(0.5), (int(split.sum()), forest.n_features_in_))
+    X[np.arange(len(X)), forest.feature[split]] = forest.threshold[split]
+    np.testing.assert_allclose(forest.predict_proba(X), reference_predict_proba(sk_forest, X), atol=1e-12)
+
+
+def test_accepts_dataframes_and_reorders_columns(forest):
+    X = pd.DataFrame(engineer_features(make_customers(50, seed=7)), columns=FEATURE_NAMES)
+    shuffled = X[FEATURE_NAMES[::-1]]
+    np.testing.assert_array_equal(forest.predict_proba(shuffled), forest.predict_proba(X.to_numpy()))
+
+
+def test_apply_returns_leaves(forest):
+    X = engineer_features(make_customers(20, seed=8))
+    leaves = forest.apply(X)
+    assert leaves.shape == (20, forest.n_trees)
+    assert forest.is_leaf[leaves].all()
+    np.testing.assert_allclose(forest.value[leaves].mean(axis=1), forest.predict_proba(X))
+
+
+def test_from_estimator_keeps_schema(sk_forest):
+    forest = FlatForest.from_estimator(sk_forest)
+    assert forest.feature_names == FEATURE_NAMES
+    assert forest.n_trees == len(sk_forest.estimators_)
+    np.testing.assert_allclose(forest.feature_importances_, sk_forest.feature_importances_)
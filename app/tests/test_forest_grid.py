@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from conftest import make_customers
+from features import engineer_features, features_frame
+from forest_engine import FlatForest
+from forest_grid import compile_forest, grid_nbytes, grid_thresholds
+
+
+@pytest.fixture(scope='module')
+def small_forest(sk_forest):
+    """A forest small enough for its grid to fit under the default cap."""
+    from sklearn.ensemble import RandomForestClassifier
+
+    X = features_frame(make_customers(2000, seed=30))
+    y = sk_forest.predict(X)
+    return FlatForest.from_estimator(RandomForestClassifier(n_estimators=8, max_depth=4, random_state=0).fit(X, y))
+
+
+def boundary_points(forest, seed=0):
+    """Random rows plus rows on, just below and just above every threshold."""
+    rng = np.random.default_rng(seed)
+    thresholds = grid_thresholds(forest)
+    n = sum(3 * len(t) for t in thresholds) + 2000
+    X = rng.uniform(-0.1, 1.1, (n, forest.n_features_in_)).astype(np.float32)
+    row = 2000
+    for feature, t in enumerate(thresholds):
+        t = t.astype(np.float32)
+        for values in (t, np.nextafter(t, np.float32(-np.inf)), np.nextafter(t, np.float32(np.inf))):
+            X[row:row + len(t), feature] = values
+            row += len(t)
+    return X
+
+
+def test_grid_is_bit_identical_to_tree_traversal(small_forest):
+    compiled = compile_forest(small_forest)
+    assert compiled.mode == 'grid'
+    for X in (boundary_points(small_forest), engineer_features(make_customers(3000, seed=31))):
+        np.testing.assert_array_equal(compiled.predict_proba(X), small_forest.predict_proba(X))
+        np.testing.assert_array_equal(compiled.predict(X), small_forest.predict(X))
+
+
+def test_falls_back_to_trees_over_the_cap(forest):
+    compiled = compile_forest(forest, max_bytes=grid_nbytes(forest) - 1)
+    assert compiled.mode == 'trees' and compiled.grid is None
+    assert 'over the cap' in compiled.describe()
+    X = boundary_points(forest, seed=1)
+    np.testing.assert_array_equal(compiled.predict_proba(X), forest.predict_proba(X))
+
+
+def test_forwards_forest_attributes(small_forest):
+    compiled = compile_forest(small_forest)
+    assert compiled.n_trees == small_forest.n_trees
+    assert compiled.feature_names == small_forest.feature_names
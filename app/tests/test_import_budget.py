@@ -0,0 +1,46 @@
+import pytest
+
+from import_budget import BASELINE_MODULES, DEFAULT_SCRIPT, measure, parse_importtime, report, summarize, top_level_imports
+
+# Libraries the app only imports in the tab or code path that needs them
+LAZY_PACKAGES = {'shap', 'lifetimes', 'matplotlib', 'plotly', 'sklearn', 'joblib'}
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   numpy._core
+import time:        50 |        150 | numpy
+import time:       200 |        200 | pandas
+some other line
+"""
+
+
+def test_parse_and_summarize():
+    rows = parse_importtime(IMPORTTIME)
+    assert rows == [('numpy._core', 100, 100, 1), ('numpy', 50, 150, 0), ('pandas', 200, 200, 0)]
+    assert summarize(rows) == [('pandas', pytest.approx(0.2)), ('numpy', pytest.approx(0.15))]
+
+
+def test_only_module_level_imports_are_measured(tmp_path):
+    script = tmp_path / 'script.py'
+    script.write_text("import os\nfrom json import dumps\n\ndef f():\n    import sqlite3\n")
+    assert top_level_imports(str(script)) == "import os\nfrom json import dumps"
+
+
+def test_app_does_not_import_heavy_libraries_at_startup():
+    pytest.importorskip('streamlit')
+
+    def packages(code=None):
+        return {name.split('.')[0] for name, _, _, _ in measure(DEFAULT_SCRIPT, code=code)}
+
+    # Streamlit itself pulls in some of these (plotly); only the app's own count
+    baseline = packages('import ' + ', '.join(BASELINE_MODULES))
+    assert not (packages() - baseline) & LAZY_PACKAGES
+
+
+def test_eager_import_goes_over_a_tight_budget(tmp_path):
+    script = tmp_path / 'script.py'
+    script.write_text("import json\n")
+    assert report(str(script), overhead_ms=1e6, repeat=1, log=lambda m: None)
+    script.write_text("import json\nimport sklearn.ensemble\n")
+    pytest.importorskip('sklearn')
+    assert not report(str(script), overhead_ms=0, repeat=1, log=lambda m: None)
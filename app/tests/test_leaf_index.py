@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import make_customers
+from features import engineer_features
+from leaf_index import LeafIndex
+
+
+@pytest.fixture(scope='module')
+def customers():
+    X = engineer_features(make_customers(3000, seed=40))
+    ids = np.array([f'C{i}' for i in range(len(X))])
+    outcomes = np.random.default_rng(41).random(len(X)) < 0.3
+    return X, ids, outcomes
+
+
+def dense_shared(forest, X, x):
+    """Trees in which every customer shares a leaf with ``x``, from ``apply``."""
+    return (forest.apply(X) == forest.apply(x[None, :])).sum(axis=1)
+
+
+def test_top_k_matches_dense_proximity(forest, customers):
+    X, ids, outcomes = customers
+    index = LeafIndex.build(forest, X, ids, outcomes)
+    queries = engineer_features(make_customers(30, seed=42))
+    for x in np.concatenate([queries, X[:5]]):
+        shared = dense_shared(forest, X, x)
+        found, counts, found_outcomes = index.query(forest.apply(x[None, :])[0], k=15)
+        assert len(found) == 15
+        # Same shared-tree counts as the 15 best of the dense row, best first
+        np.testing.assert_array_equal(counts, np.sort(shared)[::-1][:15])
+        rows = np.array([int(i[1:]) for i in found])
+        np.testing.assert_array_equal(shared[rows], counts)
+        np.testing.assert_array_equal(found_outcomes, outcomes[rows])
+        np.testing.assert_allclose(index.proximity(forest.apply(x[None, :])[0]), shared / forest.n_trees)
+
+
+def test_chunk_size_does_not_change_the_index(forest, customers):
+    X, ids, outcomes = customers
+    reference = LeafIndex.build(forest, X, ids, outcomes)
+    for chunk_size in (1, 7, 1000):
+        index = LeafIndex.build(forest, X, ids, outcomes, chunk_size=chunk_size)
+        assert index.manifest == reference.manifest
+        for name, array in reference.arrays.items():
+            np.testing.assert_array_equal(index.arrays[name], array)
+
+
+def test_save_and_load_round_trip(forest, customers, tmp_path):
+    X, ids, outcomes = customers
+    index = LeafIndex.build(forest, X, ids, outcomes)
+    index.save(str(tmp_path / 'index'))
+    # Saving again replaces the previous index
+    index.save(str(tmp_path / 'index'))
+    loaded = LeafIndex.load(str(tmp_path / 'index'))
+    assert len(loaded) == len(index)
+    assert loaded.manifest['content_hash'] == index.manifest['content_hash']
+    leaves = forest.apply(X[:20])
+    for row in leaves:
+        expected = index.query(row, k=10)
+        for got, want in zip(loaded.query(row, k=10), expected):
+            np.testing.assert_array_equal(got, want)
+
+
+def test_load_rejects_other_format_versions(forest, customers, tmp_path):
+    X, ids, outcomes = customers
+    path = tmp_path / 'index'
+    LeafIndex.build(forest, X[:100], ids[:100], outcomes[:100]).save(str(path))
+    manifest = json.loads((path / 'manifest.json').read_text())
+    manifest['format_version'] = 0
+    (path / 'manifest.json').write_text(json.dumps(manifest))
+    with pytest.raises(ValueError, match='Unsupported index format'):
+        LeafIndex.load(str(path))
@@ -0,0 +1,71 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import make_customers
+from features import engineer_features
+from forest_engine import load_forest
+from model_artifact import (MANIFEST_NAME, check_parity, content_hash, export_artifact,
+                            load_artifact, read_manifest)
+
+
+def test_round_trip_is_bit_identical(forest, artifact_dir):
+    loaded = load_artifact(artifact_dir)
+    X = engineer_features(make_customers(1000, seed=11))
+    np.testing.assert_array_equal(loaded.predict_proba(X), forest.predict_proba(X))
+    assert loaded.feature_names == forest.feature_names
+    assert content_hash(loaded) == content_hash(forest) == loaded.manifest['content_hash']
+
+
+def test_arrays_are_memory_mapped_read_only(artifact_dir):
+    from model_registry import measure_size
+
+    loaded = load_artifact(artifact_dir, mmap=True)
+    assert not loaded.threshold.flags.writeable
+    assert measure_size(loaded)[1] > 0
+    assert measure_size(load_artifact(artifact_dir, mmap=False))[1] == 0
+
+
+def test_load_forest_prefers_artifacts(forest, artifact_dir):
+    assert content_hash(load_forest(artifact_dir)) == content_hash(forest)
+
+
+def test_check_parity_against_sklearn(sk_forest, artifact_dir):
+    report = check_parity(sk_forest, load_artifact(artifact_dir), n_samples=2000)
+    assert report['max_abs_diff'] < 1e-12
+    assert report['label_mismatches'] == 0
+
+
+def test_verify_detects_tampering(forest, tmp_path):
+    path = str(tmp_path / 'model')
+    export_artifact(forest, path)
+    threshold = np.load(os.path.join(path, 'threshold.npy'))
+    threshold[0] += 1.0
+    np.save(os.path.join(path, 'threshold.npy'), threshold)
+    load_artifact(path)
+    with pytest.raises(ValueError, match='hash'):
+        load_artifact(path, verify=True)
+
+
+def test_rejects_unknown_format_and_shape_mismatch(forest, tmp_path):
+    path = str(tmp_path / 'model')
+    manifest = export_artifact(forest, path)
+    manifest['arrays']['threshold']['shape'] = [1]
+    with open(os.path.join(path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError, match='threshold'):
+        load_artifact(path)
+    manifest['format_version'] = 99
+    with open(os.path.join(path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError, match='format'):
+        read_manifest(path)
+
+
+def test_export_replaces_existing_artifact(forest, tmp_path):
+    path = str(tmp_path / 'model')
+    export_artifact(forest, path)
+    export_artifact(forest, path)
+    assert sorted(os.listdir(tmp_path)) == ['model']
@@ -0,0 +1,71 @@
+import os
+import pickle
+
+import pytest
+
+from forest_engine import load_forest
+from model_artifact import content_hash, export_artifact
+from model_registry import ModelRegistry, measure_size
+
+
+def write_pickle(path, value):
+    with open(path, 'wb') as f:
+        pickle.dump(value, f)
+
+
+def test_loads_once_and_reloads_on_content_change(tmp_path):
+    path = str(tmp_path / 'model.pkl')
+    write_pickle(path, {'version': 1})
+    calls = []
+
+    def loader(p):
+        calls.append(p)
+        with open(p, 'rb') as f:
+            return pickle.load(f)
+
+    registry = ModelRegistry(check_interval=0)
+    first = registry.get(path, loader)
+    assert registry.get(path, loader) is first
+    assert len(calls) == 1
+
+    write_pickle(path, {'version': 2})
+    assert registry.get(path, loader) == {'version': 2}
+    assert len(calls) == 2
+    assert len(registry.stats()[os.path.abspath(path)]['versions']) == 2
+
+
+def test_touching_without_changes_does_not_reload(tmp_path):
+    path = str(tmp_path / 'model.pkl')
+    write_pickle(path, {'version': 1})
+    registry = ModelRegistry(check_interval=0)
+    first = registry.get(path)
+    os.utime(path, ns=(0, 0))
+    assert registry.get(path) is first
+
+
+def test_keeps_serving_previous_version_when_reload_fails(tmp_path):
+    path = str(tmp_path / 'model.pkl')
+    write_pickle(path, {'version': 1})
+    registry = ModelRegistry(check_interval=0)
+    first = registry.get(path)
+    with open(path, 'wb') as f:
+        f.write(b'not a pickle')
+    assert registry.get(path) is first
+    assert registry.stats()[os.path.abspath(path)]['last_error']
+
+
+def test_first_load_failure_raises(tmp_path):
+    path = str(tmp_path / 'model.pkl')
+    with open(path, 'wb') as f:
+        f.write(b'not a pickle')
+    with pytest.raises(Exception):
+        ModelRegistry().get(path)
+
+
+def test_artifact_versions_follow_the_manifest(forest, tmp_path):
+    path = str(tmp_path / 'model')
+    export_artifact(forest, path)
+    registry = ModelRegistry(check_interval=0)
+    loaded = registry.get(path, load_forest)
+    assert registry.current(path).version == content_hash(forest)
+    assert measure_size(loaded)[1] > 0
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import neighbors
+from neighbors import NeighborIndex, read_customers
+
+
+def brute_force(points, ids, x, k):
+    distances = np.sqrt(((points - x) ** 2).sum(axis=1))
+    order = np.argsort(distances, kind='stable')[:k]
+    return distances[order], ids[order]
+
+
+@pytest.fixture(scope='module')
+def customers():
+    rng = np.random.default_rng(101)
+    return rng.random((20_000, 3)).astype(np.float32), np.arange(20_000) + 5000, rng.random(20_000) < 0.3
+
+
+def test_kd_tree_matches_brute_force(customers, tmp_path):
+    points, ids, outcomes = customers
+    index = NeighborIndex.build(points, ids, outcomes, leaf_size=32)
+    index.save(str(tmp_path / 'index'))
+    loaded = NeighborIndex.load(str(tmp_path / 'index'))
+    rng = np.random.default_rng(102)
+    for x in rng.uniform(-0.2, 1.2, (50, 3)).astype(np.float32):
+        for searcher in (index, loaded):
+            distances, found, found_outcomes = searcher.query(x, k=7)
+            expected_d, expected_ids = brute_force(points, ids, x, 7)
+            np.testing.assert_allclose(distances, expected_d, rtol=1e-5)
+            np.testing.assert_array_equal(found, expected_ids)
+            np.testing.assert_array_equal(found_outcomes, outcomes[found - 5000])
+
+
+def test_appended_customers_replace_earlier_rows(customers, tmp_path, monkeypatch):
+    points, ids, outcomes = customers
+    text_ids = np.array([f'C{i}' for i in ids])
+    index = NeighborIndex.build(points[:5000], text_ids[:5000], outcomes[:5000])
+    index.save(str(tmp_path / 'index'))
+
+    # Move 300 existing customers (some twice) and add 200 new ones
+    rng = np.random.default_rng(103)
+    moved = rng.choice(5000, 300, replace=False)
+    new_points = rng.random((500, 3)).astype(np.float32)
+    new_ids = np.concatenate([text_ids[moved], text_ids[5000:5200]])
+    index.append(new_points[:250], new_ids[:250], np.ones(250))
+    index.append(new_points[250:], new_ids[250:], np.ones(250))
+    index.append(new_points[:10] + 0.5, new_ids[:10], np.zeros(10))
+    index.save_delta()
+
+    current = pd.DataFrame({'id': np.concatenate([text_ids[:5000], new_ids, new_ids[:10]]),
+                            'row': np.arange(5510)})
+    all_points = np.concatenate([points[:5000], new_points, new_points[:10] + 0.5])
+    last = current.groupby('id')['row'].max().to_numpy()
+    loaded = NeighborIndex.load(str(tmp_path / 'index'))
+    for x in rng.random((30, 3)).astype(np.float32):
+        expected_d, expected_ids = brute_force(all_points[last], current['id'].to_numpy()[last], x, 5)
+        for searcher in (index, loaded):
+            distances, found, _ = searcher.query(x, k=5)
+            np.testing.assert_allclose(distances, expected_d, rtol=1e-5)
+            assert found.tolist() == expected_ids.tolist()
+
+    # A rebuild folds the delta into the tree, one row per customer
+    monkeypatch.setattr(neighbors, 'MIN_REBUILD_ROWS', 0)
+    assert loaded.append(new_points[:1], new_ids[:1], [0.0])
+    assert loaded.n_delta == 0 and len(loaded) == len(last)
+
+
+def test_read_customers_keeps_mixed_ids_as_text(tmp_path):
+    path = tmp_path / 'customers.csv'
+    pd.DataFrame({'CustomerID': ['1', 'A2', '3'], 'Tenure': [1, 2, 3], 'Churn': ['Yes', 'No', '']}).to_csv(
+        path, index=False)
+    points, ids, outcomes = read_customers(str(path), chunk_size=2)
+    assert points.shape == (3, 3)
+    assert neighbors.decode_ids(ids).tolist() == ['1', 'A2', '3']
+    np.testing.assert_array_equal(outcomes[:2], [1.0, 0.0])
+    assert np.isnan(outcomes[2])
@@ -0,0 +1,138 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import partitioned_scorer
+from conftest import make_customers
+from partitioned_scorer import (plan_csv_partitions, prepare_job, read_header, read_manifest,
+                                score_partition, score_partitioned)
+from score_customers import score_columns
+
+pytest.importorskip('pyarrow')
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def read_output(output_dir):
+    manifest = read_manifest(output_dir)
+    files = [part['file'] for part in manifest['partitions'] if part['file']]
+    return pd.concat([pd.read_parquet(os.path.join(output_dir, name)) for name in files], ignore_index=True)
+
+
+def assert_matches_batch_scoring(forest, output, customers):
+    expected = score_columns(forest, customers)
+    assert list(output['CustomerID']) == [str(i) for i in customers['CustomerID']]
+    np.testing.assert_array_equal(output['churn_probability'], expected['churn_probability'])
+    np.testing.assert_array_equal(output['churn_label'], expected['churn_label'])
+    np.testing.assert_allclose(output['clv'], expected['clv'])
+
+
+@pytest.fixture
+def big_csv(tmp_path):
+    customers = make_customers(6000, seed=70)
+    path = tmp_path / 'customers.csv'
+    customers.to_csv(path, index=False)
+    return str(path), customers
+
+
+def test_csv_partitions_cover_every_line_once(big_csv):
+    path, customers = big_csv
+    _, data_start = read_header(path)
+    partitions = plan_csv_partitions(path, partition_bytes=10_000)
+    assert len(partitions) > 10
+    assert partitions[0][0] == data_start
+    assert partitions[-1][1] == os.path.getsize(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    lines = 0
+    for (start, stop), (next_start, _) in zip(partitions, partitions[1:] + [(len(data), None)]):
+        assert stop == next_start
+        assert data[stop - 1:stop] == b'\n'
+        lines += data[start:stop].count(b'\n')
+    assert lines == len(customers)
+
+
+def test_partitions_match_batch_scoring(forest, artifact_dir, big_csv, tmp_path):
+    path, customers = big_csv
+    output_dir = str(tmp_path / 'scores')
+    manifest = score_partitioned(path, output_dir, workers=2, partition_bytes=40_000, chunk_rows=1000,
+                                 model_path=artifact_dir, log=quiet)
+    assert manifest['complete']
+    assert manifest['rows_done'] == len(customers)
+    assert len(manifest['partitions']) > 3
+    assert_matches_batch_scoring(forest, read_output(output_dir), customers)
+    assert not [name for name in os.listdir(output_dir) if name.endswith('.tmp')]
+
+
+def test_parquet_input_is_partitioned_by_row_group(forest, artifact_dir, tmp_path):
+    customers = make_customers(3000, seed=71)
+    path = str(tmp_path / 'customers.parquet')
+    customers.to_parquet(path, row_group_size=700)
+    output_dir = str(tmp_path / 'scores')
+    manifest = score_partitioned(path, output_dir, workers=1, chunk_rows=300, model_path=artifact_dir,
+                                 log=quiet)
+    assert len(manifest['partitions']) == 5
+    output = read_output(output_dir)
+    # Parquet IDs keep their type
+    output['CustomerID'] = output['CustomerID'].astype(str)
+    assert_matches_batch_scoring(forest, output, customers)
+
+
+def test_dirty_values_fall_back_like_batch_scoring(forest, artifact_dir, tmp_path):
+    customers = make_customers(2000, seed=72).astype({'CashbackAmount': object, 'Complain': object})
+    customers.loc[5, 'CashbackAmount'] = '$5'
+    customers.loc[1500, 'CashbackAmount'] = 'n/a'
+    customers.loc[::7, 'Complain'] = 'Yes'
+    path = str(tmp_path / 'dirty.csv')
+    customers.to_csv(path, index=False)
+    output_dir = str(tmp_path / 'scores')
+    score_partitioned(path, output_dir, workers=1, partition_bytes=20_000, chunk_rows=200,
+                      model_path=artifact_dir, log=quiet)
+    assert_matches_batch_scoring(forest, read_output(output_dir), pd.read_csv(path))
+
+
+def test_resume_scores_only_unfinished_partitions(forest, artifact_dir, big_csv, tmp_path):
+    path, customers = big_csv
+    output_dir = str(tmp_path / 'scores')
+    options = dict(workers=1, partition_bytes=40_000, chunk_rows=1000, model_path=artifact_dir, log=quiet)
+    manifest = score_partitioned(path, output_dir, **options)
+    before = {p['file']: os.path.getmtime(os.path.join(output_dir, p['file'])) for p in manifest['partitions']}
+    lost = manifest['partitions'][2]['file']
+    os.remove(os.path.join(output_dir, lost))
+
+    logs = []
+    manifest = score_partitioned(path, output_dir, resume=True, **{**options, 'log': logs.append})
+    assert any(f"Resuming: {len(before) - 1} of {len(before)}" in line for line in logs)
+    for name, mtime in before.items():
+        if name != lost:
+            assert os.path.getmtime(os.path.join(output_dir, name)) == mtime
+    assert manifest['rows_done'] == len(customers)
+    assert_matches_batch_scoring(forest, read_output(output_dir), customers)
+
+
+def test_resume_refuses_a_changed_input(artifact_dir, big_csv, tmp_path):
+    path, customers = big_csv
+    output_dir = str(tmp_path / 'scores')
+    score_partitioned(path, output_dir, workers=1, model_path=artifact_dir, log=quiet)
+    customers.iloc[:100].to_csv(path, index=False)
+    with pytest.raises(RuntimeError, match='Cannot resume'):
+        score_partitioned(path, output_dir, workers=1, model_path=artifact_dir, resume=True, log=quiet)
+
+
+def test_duplicate_attempts_publish_one_file(forest, big_csv, tmp_path, monkeypatch):
+    path, _ = big_csv
+    output_dir = str(tmp_path / 'scores')
+    _, tasks = prepare_job(path, output_dir, 'test', partition_bytes=40_000, chunk_rows=500, log=quiet)
+    monkeypatch.setitem(partitioned_scorer._worker, 'forest', forest)
+    first = score_partition(tasks[0])
+    published = open(tasks[0]['output'], 'rb').read()
+    second = score_partition(tasks[0])
+    assert not first['duplicate']
+    assert second['duplicate']
+    assert first['rows'] == second['rows'] > 0
+    assert open(tasks[0]['output'], 'rb').read() == published
+    assert sorted(os.listdir(output_dir)) == ['manifest.json', os.path.basename(tasks[0]['output'])]
@@ -0,0 +1,76 @@
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+import prediction_cache
+from explain import ShapResult
+from prediction_cache import VERSION_MARKER, PredictionCache, input_key
+
+
+def test_key_rounds_numbers_and_separates_models():
+    inputs = {'Tenure': 12, 'CashbackAmount': 150.004, 'Complain': True}
+    assert input_key('m', inputs) == input_key('m', {'Tenure': 12.0, 'CashbackAmount': 150.0, 'Complain': 1 > 0})
+    assert input_key('m', inputs) != input_key('m', {**inputs, 'CashbackAmount': 150.01})
+    assert input_key('m', inputs) != input_key('other', inputs)
+
+
+def test_entries_survive_a_restart(tmp_path):
+    shap_result = ShapResult(np.arange(6.0).reshape(2, 3), pd.DataFrame({'Feature1': [0.1, 0.2]}),
+                             np.float64(0.25), 'path', 0.01)
+    features = pd.DataFrame({'Feature1': np.array([0.5], dtype=np.float32), 'Name': ['x']})
+    cache = PredictionCache(str(tmp_path))
+    cache.update('m1', 'k', features=features, probability=np.array([[0.7, 0.3]]),
+                 shap_path=shap_result, figure_path=b'\x89PNG', unsupported=object())
+
+    entry = PredictionCache(str(tmp_path)).get('m1', 'k')
+    assert 'unsupported' not in entry
+    pd.testing.assert_frame_equal(entry['features'], features)
+    np.testing.assert_array_equal(entry['probability'], [[0.7, 0.3]])
+    assert entry['figure_path'] == b'\x89PNG'
+    assert isinstance(entry['shap_path'], ShapResult)
+    np.testing.assert_array_equal(entry['shap_path'].values, shap_result.values)
+    pd.testing.assert_frame_equal(entry['shap_path'].data, shap_result.data)
+    assert entry['shap_path'].expected_value == 0.25 and entry['shap_path'].method == 'path'
+
+
+def test_planted_pickles_are_never_loaded(tmp_path):
+    cache = PredictionCache(str(tmp_path))
+    cache.update('m1', 'k', probability=np.array([[0.5, 0.5]]))
+    with open(cache._path('m1', 'k'), 'wb') as f:
+        pickle.dump({'probability': 'planted'}, f)
+    assert PredictionCache(str(tmp_path)).get('m1', 'k') is None
+
+
+def test_switching_models_drops_only_stale_marked_versions(tmp_path, monkeypatch):
+    cache = PredictionCache(str(tmp_path))
+    cache.update('old', 'k', probability=np.zeros(2))
+    old_dir = cache._model_dir('old')
+    other = tmp_path / 'pc-not-ours'
+    other.mkdir()
+    (tmp_path / 'user-data').mkdir()
+
+    # A version another process may still be serving is kept
+    cache.get('new', 'k')
+    assert os.path.isdir(old_dir)
+
+    stale = time.time() - prediction_cache.STALE_VERSION_SECONDS - 1
+    os.utime(os.path.join(old_dir, VERSION_MARKER), (stale, stale))
+    cache.get('newer', 'k')
+    assert not os.path.exists(old_dir)
+    assert other.is_dir() and (tmp_path / 'user-data').is_dir()
+    assert cache.get('old', 'k') is None
+
+
+def test_disk_usage_is_capped(tmp_path):
+    cache = PredictionCache(str(tmp_path), max_disk_bytes=20_000, max_memory_items=1)
+    for i in range(10):
+        cache.update('m1', f'k{i}', values=np.zeros(500))
+    stats = cache.stats()
+    assert stats['disk_bytes'] <= 20_000 and stats['disk_evictions'] > 0
+    assert cache.get('m1', 'k9') is not None
+    assert cache.get('m1', 'k0') is None
+    files = os.listdir(cache._model_dir('m1'))
+    assert len([f for f in files if f.endswith(prediction_cache.ENTRY_SUFFIX)]) == stats['disk_items']
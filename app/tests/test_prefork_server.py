@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+
+import prefork_server
+from prefork_server import HAS_REUSE_PORT, PreforkServer, bind_socket
+from scoring_service import load_test
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+
+
+def get(server, path):
+    host, port = server.address
+    with urllib.request.urlopen(f'http://{host}:{port}{path}', timeout=5) as response:
+        return json.loads(response.read())
+
+
+def wait_until(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if condition():
+                return
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise AssertionError("Timed out")
+
+
+def server_pids(report):
+    return [w['pid'] for w in report['workers'] if w['pid']]
+
+
+@pytest.mark.skipif(not HAS_REUSE_PORT, reason="needs SO_REUSEPORT")
+def test_reuse_port_sockets_share_a_port():
+    first = bind_socket('127.0.0.1', 0, reuse_port=True)
+    try:
+        second = bind_socket('127.0.0.1', first.getsockname()[1], reuse_port=True)
+        second.close()
+        # Without SO_REUSEPORT the port is taken
+        with pytest.raises(OSError):
+            bind_socket('127.0.0.1', first.getsockname()[1])
+    finally:
+        first.close()
+
+
+@pytest.mark.parametrize('reuse_port', [
+    pytest.param(True, marks=pytest.mark.skipif(not HAS_REUSE_PORT, reason="needs SO_REUSEPORT")),
+    False,
+])
+def test_workers_serve_and_report(forest, reuse_port):
+    server = PreforkServer(forest, workers=2, port=0, reuse_port=reuse_port).start()
+    try:
+        assert server.sock.getsockname()[1] == server.address[1]
+        url = f'http://{server.host}:{server.address[1]}'
+        load = asyncio.run(load_test(url, concurrency=8, n_requests=300, distinct=20))
+        assert load['requests'] == 300
+        assert load['errors'] == 0
+        report = get(server, '/workers')
+    finally:
+        server.stop()
+    assert report['balancing'] == ('reuseport' if reuse_port else 'shared accept')
+    assert len(report['workers']) == 2
+    assert sum(w['requests'] for w in report['workers']) == 300
+    assert report['restarts'] == 0
+
+
+def test_killed_worker_is_restarted(forest, monkeypatch):
+    monkeypatch.setattr(prefork_server, 'RESTART_BACKOFF_SECONDS', 0.0)
+    server = PreforkServer(forest, workers=2, port=0).start()
+    seen = {}
+
+    def chaos():
+        try:
+            wait_until(lambda: get(server, '/health')['status'] == 'ok')
+            seen['before'] = list(server.pids)
+            os.kill(server.pids[0], signal.SIGKILL)
+            wait_until(lambda: server.restarts == 1 and server.pids[0] not in seen['before'])
+            seen['after'] = list(server.pids)
+            # The new worker takes over the dead one's counter row
+            wait_until(lambda: sorted(server_pids(get(server, '/workers'))) == sorted(seen['after']))
+            seen['report'] = get(server, '/workers')
+        finally:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    thread = threading.Thread(target=chaos)
+    thread.start()
+    logs = []
+    server.serve_forever(log=logs.append)
+    thread.join()
+
+    assert seen['after'][1] == seen['before'][1]
+    assert seen['after'][0] != seen['before'][0]
+    assert server.restarts == 1
+    assert sorted(server_pids(seen['report'])) == sorted(seen['after'])
+    assert any('restarting' in line for line in logs)
+    # Stopping reaps every worker
+    assert server.pids == [0, 0]
+    for pid in seen['after']:
+        with pytest.raises(ChildProcessError):
+            os.waitpid(pid, os.WNOHANG)
+
+
+def test_stopped_server_releases_the_port(forest):
+    server = PreforkServer(forest, workers=1, port=0).start()
+    port = server.address[1]
+    wait_until(lambda: get(server, '/health')['status'] == 'ok')
+    server.stop()
+    with pytest.raises(ConnectionRefusedError):
+        socket.create_connection(('127.0.0.1', port), timeout=1).close()
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from clv_model import summary_from_transactions
+from conftest import make_transactions
+from rfm import RFMAccumulator, day_numbers, fold_file
+
+
+@pytest.fixture(scope='module')
+def events():
+    events = make_transactions(n_customers=600, seed=61).sort_values('InvoiceDate', kind='stable')
+    rng = np.random.default_rng(61)
+    events['Coupons'] = rng.integers(0, 3, len(events))
+    events['Cashback'] = rng.uniform(0, 20, len(events)).round(2)
+    events['Complain'] = (rng.random(len(events)) < 0.05).astype(int)
+    return events.reset_index(drop=True)
+
+
+def test_streamed_summary_matches_summary_from_transactions(events):
+    accumulator = RFMAccumulator()
+    for start in range(0, len(events), 137):
+        chunk = events.iloc[start:start + 137]
+        accumulator.add_events(chunk['CustomerID'].to_numpy(), day_numbers(chunk['InvoiceDate']),
+                               chunk['Amount'].to_numpy())
+    expected = summary_from_transactions(events, 'CustomerID', 'InvoiceDate', 'Amount')
+    summary = accumulator.summary().loc[expected.index]
+    np.testing.assert_allclose(summary.to_numpy(), expected.to_numpy(), rtol=1e-12)
+
+
+def test_state_can_be_saved_and_extended(events, tmp_path):
+    half = len(events) // 2
+    first, second = tmp_path / 'first.csv', tmp_path / 'second.csv'
+    events.iloc[:half].to_csv(first, index=False)
+    events.iloc[half:].to_csv(second, index=False)
+    columns = dict(amount_col='Amount', coupon_col='Coupons', cashback_col='Cashback',
+                   complain_col='Complain', chunk_size=100, log=lambda m: None)
+
+    state = str(tmp_path / 'state.npz')
+    accumulator = RFMAccumulator()
+    fold_file(accumulator, str(first), 'CustomerID', 'InvoiceDate', **columns)
+    accumulator.save(state)
+    resumed = RFMAccumulator.load(state)
+    assert fold_file(resumed, str(first), 'CustomerID', 'InvoiceDate', **columns) == 0
+    fold_file(resumed, str(second), 'CustomerID', 'InvoiceDate', **columns)
+
+    at_once = RFMAccumulator()
+    fold_file(at_once, str(first), 'CustomerID', 'InvoiceDate', **columns)
+    fold_file(at_once, str(second), 'CustomerID', 'InvoiceDate', **columns)
+    pd.testing.assert_frame_equal(resumed.summary(), at_once.summary())
+    pd.testing.assert_frame_equal(resumed.user_inputs(), at_once.user_inputs())
+    assert resumed.events == len(events)
+
+
+def test_user_inputs_aggregate_the_events(events):
+    accumulator = RFMAccumulator()
+    accumulator.add_events(events['CustomerID'].to_numpy(), day_numbers(events['InvoiceDate']),
+                           events['Amount'].to_numpy(), events['Coupons'].to_numpy(),
+                           events['Cashback'].to_numpy(), events['Complain'].to_numpy())
+    inputs = accumulator.user_inputs()
+    grouped = events.groupby('CustomerID')
+    np.testing.assert_array_equal(inputs['OrderCount'], grouped.size().loc[inputs.index])
+    np.testing.assert_allclose(inputs['CouponUsed'], grouped['Coupons'].sum().loc[inputs.index])
+    np.testing.assert_allclose(inputs['CashbackAmount'], grouped['Cashback'].sum().loc[inputs.index])
+    end = events['InvoiceDate'].max()
+    days_since = (end - grouped['InvoiceDate'].max()).dt.days.loc[inputs.index]
+    np.testing.assert_array_equal(inputs['DaySinceLastOrder'], days_since)
@@ -0,0 +1,70 @@
+import os
+
+import pandas as pd
+import pytest
+
+from forest_grid import compile_forest
+from score_customers import progress_path, read_progress, score_chunk, score_file
+
+
+class Interrupted(Exception):
+    pass
+
+
+def stop_after(chunks):
+    def log(message):
+        if message.startswith(f"Chunk {chunks}:"):
+            raise Interrupted
+    return log
+
+
+def test_output_matches_scoring_in_memory(forest, artifact_dir, customers_csv, tmp_path):
+    output = str(tmp_path / 'scores.csv')
+    progress = score_file(customers_csv, output, chunk_size=700, model_path=artifact_dir, log=lambda m: None)
+    assert progress['complete'] and progress['rows_done'] == 2500 and progress['chunks_done'] == 4
+
+    scores = pd.read_csv(output)
+    expected = score_chunk(compile_forest(forest), pd.read_csv(customers_csv), 'CustomerID')
+    assert list(scores.columns) == ['CustomerID', 'churn_probability', 'churn_label', 'clv']
+    pd.testing.assert_frame_equal(scores, expected, check_exact=False, rtol=1e-12)
+
+
+def test_resume_gives_identical_output(artifact_dir, customers_csv, tmp_path):
+    reference = str(tmp_path / 'reference.csv')
+    score_file(customers_csv, reference, chunk_size=500, model_path=artifact_dir, log=lambda m: None)
+
+    output = str(tmp_path / 'scores.csv')
+    with pytest.raises(Interrupted):
+        score_file(customers_csv, output, chunk_size=500, model_path=artifact_dir, log=stop_after(2))
+    assert read_progress(output)['chunks_done'] == 2
+    # A crash mid-write leaves a torn row after the last completed chunk
+    with open(output, 'a') as f:
+        f.write('999999,0.5')
+    progress = score_file(customers_csv, output, chunk_size=500, model_path=artifact_dir,
+                          resume=True, log=lambda m: None)
+    assert progress['complete'] and progress['rows_done'] == 2500
+    with open(output, 'rb') as a, open(reference, 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_resume_refuses_changed_input(artifact_dir, customers_csv, tmp_path):
+    output = str(tmp_path / 'scores.csv')
+    with pytest.raises(Interrupted):
+        score_file(customers_csv, output, chunk_size=500, model_path=artifact_dir, log=stop_after(1))
+    with pytest.raises(RuntimeError, match='Cannot resume'):
+        score_file(customers_csv, output, chunk_size=400, model_path=artifact_dir, resume=True)
+    with open(customers_csv, 'a') as f:
+        f.write('1,1,1,1,1,1,1,1\n')
+    with pytest.raises(RuntimeError, match='Cannot resume'):
+        score_file(customers_csv, output, chunk_size=500, model_path=artifact_dir, resume=True)
+    assert os.path.exists(progress_path(output))
+
+
+def test_parquet_input(artifact_dir, customers_csv, tmp_path):
+    pytest.importorskip('pyarrow')
+    parquet = str(tmp_path / 'customers.parquet')
+    pd.read_csv(customers_csv).to_parquet(parquet)
+    csv_out, parquet_out = str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')
+    score_file(customers_csv, csv_out, chunk_size=600, model_path=artifact_dir, log=lambda m: None)
+    score_file(parquet, parquet_out, chunk_size=600, model_path=artifact_dir, log=lambda m: None)
+    pd.testing.assert_frame_equal(pd.read_csv(csv_out), pd.read_csv(parquet_out))
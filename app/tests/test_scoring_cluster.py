@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_customers
+from partitioned_scorer import read_manifest
+from score_customers import score_columns
+from scoring_cluster import Coordinator, parse_address, run_coordinator, run_worker
+
+pytest.importorskip('pyarrow')
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+@pytest.fixture(scope='module')
+def model_version(artifact_dir):
+    from forest_engine import load_forest
+    from model_artifact import content_hash
+
+    return content_hash(load_forest(artifact_dir))
+
+
+@pytest.fixture
+def job(tmp_path):
+    customers = make_customers(5000, seed=80)
+    path = tmp_path / 'customers.csv'
+    customers.to_csv(path, index=False)
+    return str(path), str(tmp_path / 'scores'), customers
+
+
+def assert_output_matches(forest, output_dir, customers):
+    manifest = read_manifest(output_dir)
+    assert manifest['complete']
+    assert manifest['rows_done'] == len(customers)
+    output = pd.concat([pd.read_parquet(os.path.join(output_dir, p['file'])) for p in manifest['partitions']],
+                       ignore_index=True)
+    expected = score_columns(forest, customers)
+    assert list(output['CustomerID']) == [str(i) for i in customers['CustomerID']]
+    np.testing.assert_array_equal(output['churn_probability'], expected['churn_probability'])
+    np.testing.assert_allclose(output['clv'], expected['clv'])
+
+
+class FakeWorker:
+    """A worker speaking the protocol by hand, to misbehave on purpose."""
+
+    def __init__(self, coordinator, model_version, name='fake'):
+        self.address = coordinator.address
+        self.hello = {'type': 'hello', 'name': name, 'host': 'test', 'pid': 0, 'model_version': model_version}
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(*self.address)
+        return await self.send(self.hello)
+
+    async def send(self, message):
+        self.writer.write((json.dumps(message) + '\n').encode())
+        await self.writer.drain()
+        line = await self.reader.readline()
+        return json.loads(line) if line else None
+
+    def close(self):
+        self.writer.close()
+
+
+async def with_real_worker(coordinator, artifact_dir):
+    address = '{}:{}'.format(*coordinator.address)
+    worker = asyncio.ensure_future(asyncio.to_thread(run_worker, address, artifact_dir, 'real', quiet))
+    report = await coordinator.wait()
+    await worker
+    return report
+
+
+def test_lost_worker_partition_is_requeued(forest, artifact_dir, model_version, job):
+    input_path, output_dir, customers = job
+
+    async def scenario():
+        coordinator = Coordinator(input_path, output_dir, model_version, partition_bytes=30_000,
+                                  chunk_rows=500, log=quiet)
+        await coordinator.start('127.0.0.1', 0)
+        fake = FakeWorker(coordinator, model_version)
+        assert (await fake.connect())['type'] == 'welcome'
+        task = await fake.send({'type': 'ready'})
+        assert task['type'] == 'task'
+        # Dies holding the partition
+        fake.close()
+        return task['task']['index'], await with_real_worker(coordinator, artifact_dir)
+
+    index, report = asyncio.run(scenario())
+    assert report['requeued'] == 1
+    workers = {w['name']: w for w in report['workers']}
+    assert workers['fake']['partitions'] == 0
+    assert workers['real']['partitions'] == len(read_manifest(output_dir)['partitions'])
+    assert read_manifest(output_dir)['partitions'][index]['worker'] == 'real'
+    assert_output_matches(forest, output_dir, customers)
+
+
+def test_silent_worker_is_dropped_after_the_heartbeat_timeout(forest, artifact_dir, model_version, job):
+    input_path, output_dir, customers = job
+
+    async def scenario():
+        coordinator = Coordinator(input_path, output_dir, model_version, heartbeat_interval=0.05,
+                                  heartbeat_timeout=0.2, partition_bytes=60_000, log=quiet)
+        await coordinator.start('127.0.0.1', 0)
+        fake = FakeWorker(coordinator, model_version, name='silent')
+        await fake.connect()
+        assert (await fake.send({'type': 'ready'}))['type'] == 'task'
+        # Connected but never heard from again
+        await asyncio.sleep(0.5)
+        lost = coordinator.workers[1].lost
+        report = await with_real_worker(coordinator, artifact_dir)
+        fake.close()
+        return lost, report
+
+    lost, report = asyncio.run(scenario())
+    assert lost.startswith('no heartbeat')
+    assert report['requeued'] == 1
+    assert_output_matches(forest, output_dir, customers)
+
+
+def test_worker_with_another_model_is_rejected(model_version, job):
+    input_path, output_dir, _ = job
+
+    async def scenario():
+        coordinator = Coordinator(input_path, output_dir, model_version, log=quiet)
+        await coordinator.start('127.0.0.1', 0)
+        try:
+            reply = await FakeWorker(coordinator, 'another-model').connect()
+            return reply, len(coordinator.workers)
+        finally:
+            await coordinator.stop()
+
+    reply, n_workers = asyncio.run(scenario())
+    assert reply['type'] == 'reject'
+    assert n_workers == 0
+
+
+def test_partition_failing_every_attempt_fails_the_job(model_version, job):
+    input_path, output_dir, _ = job
+
+    async def scenario():
+        coordinator = Coordinator(input_path, output_dir, model_version, max_attempts=2, log=quiet)
+        await coordinator.start('127.0.0.1', 0)
+        fake = FakeWorker(coordinator, model_version)
+        await fake.connect()
+        message = await fake.send({'type': 'ready'})
+        while message['type'] == 'task':
+            message = await fake.send({'type': 'error', 'partition': message['task']['index'],
+                                       'error': 'disk full'})
+        fake.close()
+        with pytest.raises(RuntimeError, match='failed 2 times; last error: disk full'):
+            await coordinator.wait()
+        return message
+
+    assert asyncio.run(scenario())['type'] == 'done'
+    assert not read_manifest(output_dir)['complete']
+
+
+def test_local_cluster_matches_batch_scoring(forest, artifact_dir, job):
+    input_path, output_dir, customers = job
+    report = asyncio.run(run_coordinator(input_path, output_dir, port=0, model_path=artifact_dir,
+                                         local_workers=2, partition_bytes=40_000, log=quiet))
+    assert report['rows'] == len(customers)
+    assert sum(w['partitions'] for w in report['workers']) == len(read_manifest(output_dir)['partitions'])
+    assert_output_matches(forest, output_dir, customers)
+
+
+def test_parse_address():
+    assert parse_address('node-1:7070') == ('node-1', 7070)
+    with pytest.raises(ValueError):
+        parse_address('node-1')
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_customers
+from score_customers import INPUT_COLUMNS, score_columns
+from scoring_service import (AdmissionQueue, MicroBatcher, Overloaded, ScoringService, _request, load_test,
+                             sample_records)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def started(service):
+    await service.start('127.0.0.1', 0)
+    return service
+
+
+async def post(service, path, payload):
+    host, port = service.address
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        status, body = await _request(reader, writer, host, 'POST', path, json.dumps(payload).encode())
+    finally:
+        writer.close()
+    return status, json.loads(body)
+
+
+def test_concurrent_requests_match_batch_scoring(forest):
+    customers = make_customers(300, seed=50)
+    records = [{k: (int(v) if isinstance(v, np.integer) else float(v)) for k, v in row.items()}
+               for row in customers.to_dict('records')]
+    expected = score_columns(forest, customers)
+
+    async def scenario():
+        service = await started(ScoringService(forest, max_batch_size=32, max_wait_ms=5))
+        try:
+            results = await asyncio.gather(*(post(service, '/predict', record) for record in records))
+            status, batch = await post(service, '/predict/batch', {'records': records})
+            return results, status, batch, service.snapshot()
+        finally:
+            await service.stop()
+
+    results, status, batch, snapshot = run(scenario())
+    assert [s for s, _ in results] == [200] * len(records)
+    assert status == 200
+    for rows in ([body for _, body in results], batch['predictions']):
+        frame = pd.DataFrame(rows)
+        np.testing.assert_array_equal(frame['CustomerID'], customers['CustomerID'])
+        np.testing.assert_array_equal(frame['churn_probability'], expected['churn_probability'])
+        np.testing.assert_array_equal(frame['churn_label'], expected['churn_label'])
+        np.testing.assert_allclose(frame['clv'], expected['clv'])
+    # Concurrent single requests were scored together
+    assert snapshot['batches']['max_rows'] > 1
+    assert snapshot['batches']['count'] < len(records)
+    assert snapshot['requests'] == len(records) + 1
+
+
+def test_batcher_respects_max_batch_size():
+    sizes = []
+
+    def score(records):
+        sizes.append(len(records))
+        return [{'n': record['n']} for record in records]
+
+    async def scenario():
+        batcher = MicroBatcher(score, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit([{'n': i}]) for i in range(40)))
+        finally:
+            await batcher.stop()
+
+    results = run(scenario())
+    assert [r[0]['n'] for r in results] == list(range(40))
+    assert sizes == [8] * 5
+
+
+def test_scoring_errors_reach_every_caller_of_the_batch():
+    def score(records):
+        raise ValueError('model failed')
+
+    async def scenario():
+        batcher = MicroBatcher(score, max_batch_size=4, max_wait_ms=20)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit([{}]) for _ in range(4)), return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    errors = run(scenario())
+    assert all(isinstance(e, ValueError) for e in errors)
+
+
+def test_bad_requests_get_client_errors(forest):
+    async def scenario():
+        service = await started(ScoringService(forest))
+        try:
+            return [
+                await post(service, '/predict', ['not', 'an', 'object']),
+                await post(service, '/predict', {'Tenure': [1]}),
+                await post(service, '/predict/batch', {'records': []}),
+                await post(service, '/nowhere', {}),
+            ]
+        finally:
+            await service.stop()
+
+    assert [status for status, _ in run(scenario())] == [400, 400, 400, 404]
+
+
+def test_load_test_reports_server_metrics(forest):
+    async def scenario():
+        service = await started(ScoringService(forest))
+        try:
+            host, port = service.address
+            return await load_test(f'http://{host}:{port}', concurrency=8, n_requests=400, distinct=50)
+        finally:
+            await service.stop()
+
+    report = run(scenario())
+    assert report['requests'] == 400
+    assert report['errors'] == 0
+    assert report['server']['requests'] == 400
+    assert report['server']['rows'] == 400
+
+
+@pytest.mark.parametrize('n', [1, 17])
+def test_sample_records_have_every_input(n):
+    records = sample_records(n, seed=1)
+    assert len(records) == n
+    assert all(set(INPUT_COLUMNS) <= set(record) for record in records)
+
+
+def test_admission_queue_turns_away_when_full_or_slow():
+    async def scenario():
+        queue = AdmissionQueue('predict', max_pending=2, max_latency_ms=50)
+        reasons = []
+        # One oversized request still fits into an empty queue
+        async with queue.admit(5):
+            reasons.append(queue.overload_reason())
+        async with queue.admit():
+            async with queue.admit():
+                with pytest.raises(Overloaded) as full:
+                    async with queue.admit():
+                        pass
+                reasons.append(full.value.reason)
+        async with queue.admit():
+            await asyncio.sleep(0.08)
+            reasons.append(queue.overload_reason())
+        reasons.append(queue.overload_reason())
+        return reasons, queue.stats()
+
+    reasons, stats = run(scenario())
+    assert reasons == ['queue full', 'queue full', 'latency', None]
+    assert stats['pending'] == 0
+    assert stats['rejected'] == {'queue full': 1}
+
+
+def slowed(score_fn, seconds):
+    def score(records):
+        time.sleep(seconds)
+        return score_fn(records)
+    return score
+
+
+def test_overloaded_predictions_are_shed_with_retry_after(forest):
+    records = sample_records(20, seed=60)
+
+    async def scenario():
+        service = await started(ScoringService(forest, max_batch_size=1, max_pending={'predict': 2}))
+        service.batcher.score_fn = slowed(service.batcher.score_fn, 0.02)
+        try:
+            results = await asyncio.gather(*(post(service, '/predict', record) for record in records))
+            host, port = service.address
+            reader, writer = await asyncio.open_connection(host, port)
+            service.admission['predict'].pending = 2
+            writer.write(b'POST /predict HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}')
+            head = await reader.readuntil(b'\r\n\r\n')
+            writer.close()
+            service.admission['predict'].pending = 0
+            return results, head, service.snapshot()
+        finally:
+            await service.stop()
+
+    results, head, snapshot = run(scenario())
+    statuses = [status for status, _ in results]
+    assert statuses.count(200) >= 2
+    assert statuses.count(503) > 0
+    assert set(statuses) == {200, 503}
+    assert head.startswith(b'HTTP/1.1 503')
+    assert b'Retry-After: 1' in head
+    assert snapshot['shed']['predict'] == statuses.count(503) + 1
+    assert snapshot['admission']['predict']['rejected']['queue full'] == statuses.count(503) + 1
+
+
+def test_identical_predictions_are_coalesced_but_keep_their_ids(forest):
+    record = sample_records(1, seed=61)[0]
+    records = [{**record, 'CustomerID': f'C{i}'} for i in range(10)]
+
+    async def scenario():
+        service = await started(ScoringService(forest))
+        service.batcher.score_fn = slowed(service.batcher.score_fn, 0.05)
+        try:
+            results = await asyncio.gather(*(service.predict_one(r) for r in records))
+            return results, service.snapshot()
+        finally:
+            await service.stop()
+
+    results, snapshot = run(scenario())
+    assert [r['CustomerID'] for r in results] == [r['CustomerID'] for r in records]
+    assert len({r['churn_probability'] for r in results}) == 1
+    assert snapshot['coalesced']['predict'] == 9
+    assert snapshot['batches']['count'] == 1
+
+
+def test_overloaded_explanations_degrade_to_feature_importances(forest):
+    records = sample_records(5, seed=62)
+
+    async def scenario():
+        service = ScoringService(forest, max_pending={'explain': 1})
+        await started(service)
+
+        def slow_shap(x):
+            time.sleep(0.1)
+            return {'method': 'shap', 'degraded': False, 'factors': []}
+
+        service._shap_factors = slow_shap
+        try:
+            results = await asyncio.gather(*(service.explain_one(r) for r in records))
+            return results, service.snapshot()
+        finally:
+            await service.stop()
+
+    results, snapshot = run(scenario())
+    methods = [r['explanation']['method'] for r in results]
+    assert methods.count('shap') == 1
+    assert methods.count('feature_importances') == 4
+    degraded = [r['explanation'] for r in results if r['explanation']['degraded']]
+    assert {e['reason'] for e in degraded} == {'queue full'}
+    assert all(len(e['factors']) == forest.n_features_in_ for e in degraded)
+    assert snapshot['degraded']['explain'] == 4
+    # Every explanation still carries its prediction
+    assert all('churn_probability' in r for r in results)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from conftest import make_customers
+from features import engineer_features
+from forest_grid import compile_forest
+from scoring_session import ScoringSession, feature_tree_index
+
+
+def test_tracks_a_full_rescore_through_random_updates(forest):
+    rng = np.random.default_rng(41)
+    X = engineer_features(make_customers(300, seed=41))
+    session = ScoringSession(forest, X[:1])
+    x = X[0].copy()
+    for row in X[1:]:
+        # Change one or two features at a time, like slider moves
+        for feature in rng.choice(len(x), rng.integers(1, 3), replace=False):
+            x[feature] = row[feature]
+        session.update(x)
+        np.testing.assert_allclose(session.predict_proba(), forest.predict_proba(x[None, :]), atol=1e-12)
+        labels, _ = session.predict_with_proba()
+        assert labels[0] == forest.predict(x[None, :])[0]
+
+
+def test_rewalks_only_trees_that_split_on_the_changed_feature(forest):
+    index = feature_tree_index(forest)
+    session = ScoringSession(forest, np.full((1, 3), 0.5, dtype=np.float32))
+    assert session.set_feature('Feature2', 0.9) == len(index[1])
+    assert session.update(session.x) == 0
+    np.testing.assert_allclose(session.predict_proba(), forest.predict_proba(session.x[None, :]), atol=1e-12)
+
+
+def test_accepts_a_compiled_forest(forest):
+    x = engineer_features(make_customers(1, seed=42))
+    session = ScoringSession(compile_forest(forest, max_bytes=0), x)
+    assert session.forest is forest
+    np.testing.assert_allclose(session.predict_proba(), forest.predict_proba(x), atol=1e-12)
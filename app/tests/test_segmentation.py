@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_customers
+from features import engineer_features
+from segmentation import (PERSONAS, Segmenter, assign_file, fit_segments, generate_persona,
+                          rule_persona)
+
+
+def original_persona(inputs):
+    # The if/else chain the app used before segments were fitted
+    if inputs['Tenure'] < 3:
+        return 'New Customer'
+    if inputs['SatisfactionScore'] < 3:
+        return 'At-Risk Customer'
+    if inputs['OrderCount'] > 50:
+        return 'Power User'
+    return 'Balanced Customer'
+
+
+@pytest.fixture
+def labelled_csv(tmp_path):
+    customers = make_customers(3000, seed=91)
+    customers['Churn'] = np.where(np.random.default_rng(91).random(len(customers)) < 0.3, 'Yes', 'No')
+    path = tmp_path / 'customers.csv'
+    customers.to_csv(path, index=False)
+    return str(path), customers
+
+
+def test_rules_match_the_original_if_else():
+    for _, row in make_customers(300, seed=92).iterrows():
+        assert rule_persona(row.to_dict())['type'] == original_persona(row)
+    assert rule_persona({})['type'] == 'Balanced Customer'
+
+
+def test_vectorized_and_single_assignment_agree_with_brute_force():
+    rng = np.random.default_rng(93)
+    segmenter = Segmenter(rng.random((6, 3)))
+    X = rng.random((5000, 3))
+    brute = ((X[:, None, :] - segmenter.centroids[None]) ** 2).sum(axis=2).argmin(axis=1)
+    np.testing.assert_array_equal(segmenter.assign(X, batch_rows=777), brute)
+    assert [segmenter.assign_one(x) for x in X[:200]] == brute[:200].tolist()
+
+
+def test_fit_statistics_and_round_trip(labelled_csv, artifact_dir, tmp_path):
+    pytest.importorskip('sklearn')
+    path, customers = labelled_csv
+    segmenter = fit_segments(path, n_clusters=4, chunk_size=700, model_path=artifact_dir, log=lambda m: None)
+    labels = segmenter.assign(engineer_features(customers, dtype=np.float64))
+    churned = (customers['Churn'] == 'Yes').to_numpy()
+    for k, stats in enumerate(segmenter.segments):
+        members = labels == k
+        assert stats['size'] == members.sum()
+        if members.any():
+            assert stats['churn_rate'] == pytest.approx(churned[members].mean())
+            assert stats['mean_inputs']['Tenure'] == pytest.approx(customers['Tenure'][members].mean())
+            assert stats['persona'] in PERSONAS
+
+    saved = str(tmp_path / 'segments.json')
+    segmenter.save(saved)
+    loaded = Segmenter.load(saved)
+    np.testing.assert_array_equal(loaded.centroids, segmenter.centroids)
+    inputs = customers.iloc[0].to_dict()
+    assert generate_persona(inputs, loaded) == generate_persona(inputs, segmenter)
+    assert generate_persona(inputs, loaded)['segment']['id'] == labels[0]
+
+    output = str(tmp_path / 'segments.csv')
+    assign_file(loaded, path, output, chunk_size=900, log=lambda m: None)
+    assigned = pd.read_csv(output)
+    np.testing.assert_array_equal(assigned['CustomerID'], customers['CustomerID'])
+    np.testing.assert_array_equal(assigned['segment'], labels)
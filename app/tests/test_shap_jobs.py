@@ -0,0 +1,64 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from shap_jobs import ShapJobRunner, job_key
+
+
+def test_duplicate_submissions_share_one_job():
+    release = threading.Event()
+    calls = []
+
+    def work(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    runner = ShapJobRunner(max_workers=1)
+    first = runner.submit('k', work, 21)
+    assert runner.submit('k', work, 21) is first
+    assert first.state in ('queued', 'running') and not first.done()
+    release.set()
+    assert first.future.result(5) == 42
+    # Finished jobs are served to later reruns without recomputing
+    assert runner.submit('k', work, 21) is first
+    assert calls == [21]
+    assert runner.stats()['deduplicated'] == 2
+
+
+def test_full_pool_refuses_new_jobs():
+    release = threading.Event()
+    runner = ShapJobRunner(max_workers=1, max_pending=2)
+    jobs = [runner.submit(i, release.wait, 5) for i in range(3)]
+    assert jobs[2] is None and runner.stats()['rejected'] == 1
+    release.set()
+    for job in jobs[:2]:
+        job.future.result(5)
+
+
+def test_failed_jobs_are_retried():
+    runner = ShapJobRunner(max_workers=1)
+
+    def fail():
+        raise ValueError('boom')
+
+    job = runner.submit('k', fail)
+    job.future.exception(5)
+    assert job.state == 'failed' and isinstance(job.error(), ValueError)
+    # The done callback may still be running in the worker thread
+    deadline = time.monotonic() + 5
+    while runner.get('k') is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    retry = runner.submit('k', lambda: 1)
+    assert retry is not job
+    assert retry.future.result(5) == 1
+
+
+def test_job_key_ignores_container_type():
+    values = np.array([[0.1, 0.2, 0.3]])
+    frame = pd.DataFrame(values, columns=['a', 'b', 'c'])
+    assert job_key('v1', values) == job_key('v1', frame)
+    assert job_key('v1', values) != job_key('v2', values)
+    assert job_key('v1', values) != job_key('v1', values + 0.01)
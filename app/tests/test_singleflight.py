@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_callers_share_one_run():
+    calls = []
+
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return 'value'
+
+        callers = [asyncio.ensure_future(flight.do('key', compute)) for _ in range(10)]
+        await asyncio.sleep(0)
+        assert flight.in_flight == 1
+        release.set()
+        return await asyncio.gather(*callers), flight.stats()
+
+    results, stats = run(scenario())
+    assert len(calls) == 1
+    assert [value for value, _ in results] == ['value'] * 10
+    assert [shared for _, shared in results] == [False] + [True] * 9
+    assert stats == {'calls': 10, 'executed': 1, 'coalesced': 9, 'in_flight': 0}
+
+
+def test_distinct_keys_and_later_calls_run_again():
+    async def scenario():
+        flight = SingleFlight()
+        counter = {'n': 0}
+
+        async def compute():
+            counter['n'] += 1
+            run_number = counter['n']
+            await asyncio.sleep(0.01)
+            return run_number
+
+        first = await asyncio.gather(flight.do('a', compute), flight.do('b', compute))
+        # Nothing is cached once the first run finished
+        second = await flight.do('a', compute)
+        return first, second, counter['n']
+
+    first, second, runs = run(scenario())
+    assert sorted(value for value, _ in first) == [1, 2]
+    assert second == (3, False)
+    assert runs == 3
+
+
+def test_exception_reaches_every_caller_and_releases_the_key():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError('boom')
+
+        results = await asyncio.gather(*(flight.do('key', fail) for _ in range(3)), return_exceptions=True)
+
+        async def succeed():
+            return 'ok'
+
+        return results, await flight.do('key', succeed), flight.in_flight
+
+    results, retry, in_flight = run(scenario())
+    assert all(isinstance(e, ValueError) for e in results)
+    assert retry == ('ok', False)
+    assert in_flight == 0
+
+
+def test_cancelled_follower_does_not_cancel_the_leader():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return 'done'
+
+        leader = asyncio.ensure_future(flight.do('key', compute))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do('key', compute))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert run(scenario()) == ('done', False)